@@ -0,0 +1,22 @@
+"""
+Measure the cost of accessing the cols, rows, save and plots accessors of a dataframe. No Spark job is launched.
+
+Usage: python benchmarks/accessors.py [iterations]
+"""
+import sys
+import timeit
+
+from optimus import Optimus
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    op = Optimus()
+    df = op.create.df([("name", "str", True), ("num", "int", True)], [("a", 1), ("b", 2)])
+
+    for accessor in ["cols", "rows", "save", "plots"]:
+        seconds = timeit.timeit(lambda: getattr(df, accessor), number=iterations)
+        print("df.{accessor}: {us:.2f} us per access".format(accessor=accessor, us=seconds / iterations * 1e6))
+
+    seconds = timeit.timeit(lambda: df.cols.lower, number=iterations)
+    print("df.cols.lower: {us:.2f} us per access".format(us=seconds / iterations * 1e6))
@@ -0,0 +1,46 @@
+"""
+Compare the driver planning time of chained withColumn() calls against a single projection on a wide dataframe.
+Only the analysis is measured, no Spark job is launched.
+
+Usage: python benchmarks/planning.py [columns]
+"""
+import sys
+import timeit
+
+import pyspark.sql.functions as F
+
+from optimus import Optimus
+
+
+def plan(df):
+    """
+    Force the analysis of the plan
+    :param df:
+    :return: seconds
+    """
+    start = timeit.default_timer()
+    df._jdf.queryExecution().analyzed()
+    return timeit.default_timer() - start
+
+
+def chained(df):
+    for c in df.columns:
+        df = df.withColumn(c, F.abs(F.col(c)))
+    return df
+
+
+if __name__ == "__main__":
+    columns = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    op = Optimus()
+    df = op.spark.range(10).select(*[F.col("id").alias("c" + str(i)) for i in range(columns)])
+
+    start = timeit.default_timer()
+    df_chained = chained(df)
+    seconds = timeit.default_timer() - start + plan(df_chained)
+    print("withColumn loop: {seconds:.2f} s".format(seconds=seconds))
+
+    start = timeit.default_timer()
+    df_select = df.cols.abs("*")
+    seconds = timeit.default_timer() - start + plan(df_select)
+    print("Single projection: {seconds:.2f} s".format(seconds=seconds))
@@ -0,0 +1,29 @@
+"""
+Measure the messages and rows per second published by save.rabbit_mq() with different batch sizes. The in memory
+kombu transport is used as a broker stand-in, so no RabbitMQ server is needed and only the publishing side is measured.
+
+Usage: python benchmarks/rabbit_mq.py [rows] [broker url]
+"""
+import sys
+
+import pyspark.sql.functions as F
+
+from optimus import Optimus
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    host = sys.argv[2] if len(sys.argv) > 2 else "memory://"
+
+    op = Optimus()
+    df = op.spark.range(rows).select(F.col("id"), F.col("id").cast("string").alias("name")).cache()
+    df.count()
+
+    for batch_size in [1, 10, 100, 1000]:
+        metrics = df.save.rabbit_mq(host, exchange_name="benchmark", queue_name="benchmark",
+                                    routing_key="benchmark", batch_size=batch_size)
+
+        messages = sum(m["messages"] for m in metrics)
+        # Partitions are published at the same time, so the slowest one is the elapsed time
+        seconds = max(m["seconds"] for m in metrics) or 0.01
+        print("batch_size={batch_size}: {messages:.0f} messages/sec, {rows:.0f} rows/sec"
+              .format(batch_size=batch_size, messages=messages / seconds, rows=rows / seconds))
@@ -0,0 +1,28 @@
+"""
+Compare to_json() collecting Rows against collecting Arrow record batches. Requires pyarrow.
+
+Usage: python benchmarks/to_json.py [rows] [columns]
+"""
+import sys
+import timeit
+
+import pyspark.sql.functions as F
+
+from optimus import Optimus
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    columns = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    op = Optimus()
+    df = op.spark.range(rows)
+    df = df.select(*[(F.col("id") * i).alias("num_" + str(i)) if i % 2 == 0 else
+                     F.col("id").cast("string").alias("str_" + str(i)) for i in range(columns)]).cache()
+    df.count()
+
+    for arrow in [False, True]:
+        seconds = timeit.timeit(lambda: df.to_json(arrow=arrow), number=1)
+        print("to_json(arrow={arrow}): {seconds:.2f} sec for {rows} rows".format(arrow=arrow, seconds=seconds,
+                                                                                rows=rows))
+
+    assert df.to_json(arrow=False) == df.to_json(arrow=True)
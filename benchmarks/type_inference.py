@@ -0,0 +1,52 @@
+"""
+Compare the throughput of the Spark expression type inference against the Pandas UDF inference.
+
+Usage: python benchmarks/type_inference.py [rows]
+"""
+import sys
+import timeit
+
+import pyspark.sql.functions as F
+
+from optimus import Optimus
+from optimus.functions import filter_row_by_data_type as fbdt
+
+VALUES = ["1", "-12", "1.5", "1e5", "true", "False", "2018-01-31", "Jan 31, 2018", "[1, 2]", "dog dog", None]
+
+
+def create_df(op, rows):
+    """
+    Create a string column cycling through values of every data type
+    :param op: Optimus instance
+    :param rows: number of rows
+    :return:
+    """
+    values = F.array(*[F.lit(v) for v in VALUES])
+    return (op.spark.range(rows)
+            .select(values[(F.col("id") % len(VALUES)).cast("int")].alias("value"))
+            .cache())
+
+
+def run(df, native):
+    """
+    Count the rows of every data type
+    :param df:
+    :param native: Use the Spark expression inference
+    :return: seconds
+    """
+    start = timeit.default_timer()
+    df.groupBy(fbdt("value", get_type=True, native=native).alias("type")).count().collect()
+    return timeit.default_timer() - start
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+
+    op = Optimus()
+    df = create_df(op, rows)
+    df.count()
+
+    for native in [True, False]:
+        seconds = run(df, native)
+        print("{name}: {seconds:.2f} s, {throughput:,.0f} rows/s".format(
+            name="Spark expressions" if native else "Pandas UDF", seconds=seconds, throughput=rows / seconds))
@@ -1,8 +1,5 @@
 import builtins
-import itertools
 import re
-import string
-import unicodedata
 from fastnumbers import fast_float
 from functools import reduce
 
@@ -14,25 +11,38 @@ from pyspark.sql import DataFrame
 from pyspark.sql import functions as F
 from pyspark.sql.functions import Column
 
-from optimus.functions import abstract_udf as audf, concat
+from optimus.functions import abstract_udf as audf, concat, remove_accents_series, remove_special_chars_series
 from optimus.functions import filter_row_by_data_type as fbdt
 from optimus.helpers.checkit import is_num_or_str, is_list, is_, is_tuple, is_list_of_dataframes, is_list_of_tuples, \
     is_function, is_one_element, is_type, is_int, is_dict, is_str, has_
 # Helpers
 from optimus.helpers.constants import *
-from optimus.helpers.decorators import add_attr
+from optimus.helpers.cache import stats_cache
+from optimus.helpers.decorators import time_it
 from optimus.helpers.functions \
     import validate_columns_names, parse_columns, format_dict, \
     tuple_to_dict, val_to_list, filter_list, get_spark_dtypes_object
 from optimus.helpers.raiseit import RaiseIt
-from optimus.profiler.functions import bucketizer
-from optimus.profiler.functions import create_buckets
+from optimus.dataframe.lazy import LazyCols
+from optimus.profiler.functions import hist_counts, percentile_agg, quantile_sketches, heavy_hitters
 
 
-def cols(self):
-    @add_attr(cols)
+class Cols:
+    __slots__ = ["_df"]
+
+    def __init__(self, df):
+        self._df = df
+
+    def lazy(self):
+        """
+        Record the cols operations and apply them in a single projection when collect_plan() is called
+        df.cols.lazy().trim("*").lower("*").collect_plan()
+        :return: LazyCols
+        """
+        return LazyCols(self._df)
+
     @dispatch(str, object)
-    def append(col_name=None, value=None):
+    def append(self, col_name=None, value=None):
         """
         Append a column to a Dataframe
         :param col_name: Name of the new column
@@ -46,7 +56,7 @@ def cols(self):
                 temp.append(F.lit(v))
             return F.array(temp)
 
-        df = self
+        df = self._df
 
         if is_num_or_str(value):
             value = F.lit(value)
@@ -60,9 +70,8 @@ def cols(self):
 
         return df
 
-    @add_attr(cols)
     @dispatch(list)
-    def append(cols_values=None):
+    def append(self, cols_values=None):
         """
         Append a column or a Dataframe to a Dataframe
         :param cols_values: New Column Names and data values
@@ -73,11 +82,11 @@ def cols(self):
         # Append a dataframe
         if is_list_of_dataframes(cols_values):
             dfs = cols_values
-            dfs.insert(0, self)
+            dfs.insert(0, self._df)
             df_result = concat(dfs, like="columns")
 
         elif is_list_of_tuples(cols_values):
-            df_result = self
+            df_result = self._df
             for c in cols_values:
                 col_name = c[0]
                 value = c[1]
@@ -85,8 +94,7 @@ def cols(self):
 
         return df_result
 
-    @add_attr(cols)
-    def select(columns=None, regex=None, data_type=None):
+    def select(self, columns=None, regex=None, data_type=None):
         """
         Select columns using index, column name, regex to data type
         :param columns:
@@ -94,11 +102,10 @@ def cols(self):
         :param data_type:
         :return:
         """
-        columns = parse_columns(self, columns, is_regex=regex, filter_by_column_dtypes=data_type)
-        return self.select(columns)
+        columns = parse_columns(self._df, columns, is_regex=regex, filter_by_column_dtypes=data_type)
+        return self._df.select(columns)
 
-    @add_attr(cols)
-    def apply_expr(columns, func=None, args=None, filter_col_by_dtypes=None, verbose=True):
+    def apply_expr(self, columns, func=None, args=None, filter_col_by_dtypes=None, verbose=True):
         """
         Apply a expression to column.
         :param columns: Columns in which the function is going to be applied
@@ -119,15 +126,15 @@ def cols(self):
         else:
             _func = func
 
-        columns = parse_columns(self, columns, filter_by_column_dtypes=filter_col_by_dtypes, accepts_missing_cols=True)
+        columns = parse_columns(self._df, columns, filter_by_column_dtypes=filter_col_by_dtypes,
+                                accepts_missing_cols=True)
 
-        df = self
-        for col_name in columns:
-            df = df.withColumn(col_name, audf(col_name, _func, attrs=args, func_type="column_exp", verbose=verbose))
+        df = self._df.with_columns([(col_name, audf(col_name, _func, attrs=args, func_type="column_exp",
+                                                    verbose=verbose))
+                                    for col_name in columns])
         return df
 
-    @add_attr(cols)
-    def apply(columns, func, func_return_type, args=None, func_type=None, when=None, filter_col_by_dtypes=None,
+    def apply(self, columns, func, func_return_type, args=None, func_type=None, when=None, filter_col_by_dtypes=None,
               verbose=True):
         """
         Apply a function using pandas udf or udf if apache arrow is not available
@@ -136,59 +143,56 @@ def cols(self):
             def func(value, args):
         :param func_return_type: function return type. This is required by UDF and Pandas UDF.
         :param args: Arguments to be passed to the function
-        :param func_type: pandas_udf or udf. If none try to use pandas udf (Pyarrow needed)
+        :param func_type: pandas_udf, vectorized or udf. If none try to use pandas udf (Pyarrow needed). A
+        vectorized function receives the whole pandas Series instead of a value
+            def func(series, args):
         :param when: A expression to better control when the function is going to be apllied
         :param filter_col_by_dtypes: Only apply the filter to specific type of value ,integer, float, string or bool
         :param verbose: Print additional information about
         :return: DataFrame
         """
 
-        columns = parse_columns(self, columns, filter_by_column_dtypes=filter_col_by_dtypes, accepts_missing_cols=True)
-
-        df = self
+        columns = parse_columns(self._df, columns, filter_by_column_dtypes=filter_col_by_dtypes,
+                                accepts_missing_cols=True)
 
-        def expr(_when):
+        def expr(c, _when):
             main_query = audf(c, func, func_return_type, args, func_type, verbose=verbose)
-            if when is not None:
+            if _when is not None:
                 # Use the data type to filter the query
                 main_query = F.when(_when, main_query).otherwise(F.col(c))
 
             return main_query
 
-        for c in columns:
-            df = df.withColumn(c, expr(when))
+        df = self._df.with_columns([(c, expr(c, when)) for c in columns])
         return df
 
-    @add_attr(cols)
-    def apply_by_dtypes(columns, func, func_return_type, args=None, func_type=None, data_type=None):
+    def apply_by_dtypes(self, columns, func, func_return_type, args=None, func_type=None, data_type=None):
         """
         Apply a function using pandas udf or udf if apache arrow is not available
         :param columns: Columns in which the function is going to be applied
         :param func: Functions to be applied to a columns
         :param func_return_type
         :param args:
-        :param func_type: pandas_udf or udf. If none try to use pandas udf (Pyarrow needed)
+        :param func_type: pandas_udf, vectorized or udf. If none try to use pandas udf (Pyarrow needed)
         :param data_type:
         :return:
         """
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
 
-        for c in columns:
-            df = self.cols.apply(c, func, func_return_type, args=args, func_type=func_type,
-                                 when=fbdt(c, data_type))
+        df = self._df.with_columns([(c, F.when(fbdt(c, data_type), audf(c, func, func_return_type, args, func_type))
+                                 .otherwise(F.col(c))) for c in columns])
         return df
 
     # TODO: Check if we must use * to select all the columns
-    @add_attr(cols)
     @dispatch(object, object)
-    def rename(columns_old_new=None, func=None):
+    def rename(self, columns_old_new=None, func=None):
         """"
         Changes the name of a column(s) dataFrame.
         :param columns_old_new: List of tuples. Each tuple has de following form: (oldColumnName, newColumnName).
         :param func: can be lower, upper or any string transformation function
         """
 
-        df = self
+        df = self._df
 
         # Apply a transformation function
         if is_function(func):
@@ -198,37 +202,41 @@ def cols(self):
         elif is_list_of_tuples(columns_old_new):
             # Check that the 1st element in the tuple is a valid set of columns
 
-            validate_columns_names(self, columns_old_new)
+            validate_columns_names(self._df, columns_old_new)
+
+            # Apply the renames in order like chained withColumnRenamed() calls, so [("a", "b"), ("b", "c")] renames
+            # 'a' to 'c'. Then rename all the columns in a single projection. toDF() renames by position, so it works
+            # with duplicated column names too
+            names = df.columns
             for c in columns_old_new:
                 old_col_name = c[0]
-                if is_str(old_col_name):
-                    df = df.withColumnRenamed(old_col_name, c[1])
-                elif is_int(old_col_name):
-                    df = df.withColumnRenamed(self.schema.names[old_col_name], c[1])
+                if is_int(old_col_name):
+                    old_col_name = self._df.schema.names[old_col_name]
+                elif not is_str(old_col_name):
+                    continue
+                names = [c[1] if name == old_col_name else name for name in names]
+
+            df = df.toDF(*names)
 
         return df
 
-    @add_attr(cols)
     @dispatch(list)
-    def rename(columns_old_new=None):
-        return rename(columns_old_new, None)
+    def rename(self, columns_old_new=None):
+        return self.rename(columns_old_new, None)
 
-    @add_attr(cols)
     @dispatch(object)
-    def rename(func=None):
-        return rename(None, func)
+    def rename(self, func=None):
+        return self.rename(None, func)
 
-    @add_attr(cols)
     @dispatch(str, str, object)
-    def rename(old_column, new_column, func=None):
-        return rename([(old_column, new_column)], func)
+    def rename(self, old_column, new_column, func=None):
+        return self.rename([(old_column, new_column)], func)
 
-    @add_attr(cols)
     @dispatch(str, str)
-    def rename(old_column, new_column):
-        return rename([(old_column, new_column)], None)
+    def rename(self, old_column, new_column):
+        return self.rename([(old_column, new_column)], None)
 
-    def _cast(cols, args):
+    def _cast(self, cols, args):
         """
         Helper function to support the multiple params implementation
         :param cols:
@@ -266,19 +274,19 @@ def cols(self):
 
             return func_return_type, cast_to_vectors, func_type
 
-        df = self
+        exprs = []
         for col, args in zip(cols, args):
             return_type, func, func_type = cast_factory(args[0])
-            df = df.withColumn(col, audf(col, func,
-                                         func_return_type=return_type,
-                                         attrs=args[0],
-                                         func_type=func_type, verbose=False)
-                               )
+            exprs.append((col, audf(col, func,
+                                    func_return_type=return_type,
+                                    attrs=args[0],
+                                    func_type=func_type, verbose=False)
+                          ))
+        df = self._df.with_columns(exprs)
         return df
 
-    @add_attr(cols)
     @dispatch(list)
-    def cast(col_and_dtype):
+    def cast(self, col_and_dtype):
         """
         Cast multiple columns to a specific datatype
         List of tuples of column names and types to be casted. This variable should have the
@@ -292,12 +300,11 @@ def cols(self):
         :param col_and_dtype: Columns to be casted and new data types
         :return:
         """
-        cols, attrs = parse_columns(self, col_and_dtype, get_args=True)
-        return _cast(cols, attrs)
+        cols, attrs = parse_columns(self._df, col_and_dtype, get_args=True)
+        return self._cast(cols, attrs)
 
-    @add_attr(cols)
     @dispatch((list, str), object)
-    def cast(columns, dtype):
+    def cast(self, columns, dtype):
         """
         Cast a column or a list of columns to a specific datatype
         :param columns: Columns names to be casted
@@ -305,20 +312,17 @@ def cols(self):
         :return: Spark DataFrame
         """
 
-        cols = parse_columns(self, columns)
+        cols = parse_columns(self._df, columns)
         attrs = []
         for _ in builtins.range(0, len(cols)):
             attrs.append((dtype,))
 
-        return _cast(cols, attrs)
+        return self._cast(cols, attrs)
 
-    @add_attr(cols)
-    @add_attr(cols)
-    def astype(*args, **kwargs):
-        return cast(*args, **kwargs)
+    def astype(self, *args, **kwargs):
+        return self.cast(*args, **kwargs)
 
-    @add_attr(cols)
-    def move(column, position, ref_col):
+    def move(self, column, position, ref_col):
         """
         Move a column to specific position
         :param column: Column to be moved
@@ -327,15 +331,15 @@ def cols(self):
         :return: Spark DataFrame
         """
         # Check that column is a string or a list
-        column = parse_columns(self, column)
-        ref_col = parse_columns(self, ref_col)
+        column = parse_columns(self._df, column)
+        ref_col = parse_columns(self._df, ref_col)
 
         # Asserting if position is 'after' or 'before'
         assert (position == 'after') or (
                 position == 'before'), "Error: Position parameter only can be 'after' or 'before' actually" % position
 
         # Get dataframe columns
-        columns = self.columns
+        columns = self._df.columns
 
         # Get source and reference column index position
 
@@ -355,10 +359,9 @@ def cols(self):
             elif new_index[0] < old_index:  # Check if the movement if from left to right:
                 columns.insert(new_index, columns.pop(old_index))
 
-        return self[columns]
+        return self._df[columns]
 
-    @add_attr(cols)
-    def keep(columns=None, regex=None):
+    def keep(self, columns=None, regex=None):
         """
         Only keep the columns specified
         :param columns: Columns to Keep in the dataFrame
@@ -368,14 +371,13 @@ def cols(self):
 
         if regex:
             r = re.compile(regex)
-            columns = list((r.match, self.columns))
+            columns = list((r.match, self._df.columns))
 
-        columns = parse_columns(self, columns)
-        return self.select(*columns)
+        columns = parse_columns(self._df, columns)
+        return self._df.select(*columns)
 
-    @add_attr(cols)
     # TODO: Create a function to sort by datatype?
-    def sort(order="asc"):
+    def sort(self, order="asc"):
         """
         Sort dataframes columns asc or desc
         :param order: 'asc' or 'desc' accepted
@@ -383,16 +385,15 @@ def cols(self):
         """
 
         if order == "asc":
-            sorted_col_names = sorted(self.columns)
+            sorted_col_names = sorted(self._df.columns)
         elif order == "desc":
-            sorted_col_names = sorted(self.columns, reverse=True)
+            sorted_col_names = sorted(self._df.columns, reverse=True)
         else:
             RaiseIt.value_error(order, ["asc", "desc"])
 
-        return self.select(sorted_col_names)
+        return self._df.select(sorted_col_names)
 
-    @add_attr(cols)
-    def drop(columns=None, regex=None, data_type=None):
+    def drop(self, columns=None, regex=None, data_type=None):
         """
         Drop a list of columns
         :param columns: Columns to be dropped
@@ -400,19 +401,19 @@ def cols(self):
         :param data_type:
         :return:
         """
-        df = self
+        df = self._df
         if regex:
             r = re.compile(regex)
-            columns = list((r.match, self.columns))
+            columns = list((r.match, self._df.columns))
 
-        columns = parse_columns(self, columns, filter_by_column_dtypes=data_type)
+        columns = parse_columns(self._df, columns, filter_by_column_dtypes=data_type)
 
         for column in columns:
             df = df.drop(column)
         return df
 
-    @add_attr(cols, log_time=True)
-    def _exprs(funcs, columns):
+    @time_it
+    def _exprs(self, funcs, columns):
         """
         Helper function to apply multiple columns expression to multiple columns
         :param funcs: Aggregation functions from Apache Spark
@@ -449,197 +450,268 @@ def cols(self):
             else:
                 return data
 
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
 
         # Ensure that is a list
         funcs = val_to_list(funcs)
 
-        df = self
+        df = self._df
 
         # Parse the columns to float. Seems that spark can handle some aggregation with string columns giving
         # unexpected results
         # df = df.cols.cast(columns, "float")
 
+        # Only the stats that are not cached are calculated
+        keys = [(func.__name__, col_name) for col_name in columns for func in funcs]
+        cached = stats_cache.get(df, keys)
+
         # Create a Column Expression for every column
         exprs = []
         for col_name in columns:
             for func in funcs:
-                exprs.append(func(col_name).alias(func.__name__ + "_" + col_name))
-
-        result = parse_col_names_funcs_to_keys(format_dict(df.agg(*exprs).to_json()))
+                if (func.__name__, col_name) not in cached:
+                    exprs.append(func(col_name).alias(func.__name__ + "_" + col_name))
+
+        if len(exprs) > 0:
+            values = df.agg(*exprs).to_json()[0]
+            calculated = {(func_name, col_name): values[func_name + "_" + col_name]
+                          for func_name, col_name in keys if (func_name, col_name) not in cached}
+            stats_cache.set(df, calculated)
+            cached.update(calculated)
+
+        data = {func_name + "_" + col_name: cached[(func_name, col_name)] for func_name, col_name in keys}
+        result = parse_col_names_funcs_to_keys(format_dict([data]))
         # logging.info(result)
         return result
 
     # Quantile statistics
-    @add_attr(cols)
-    def min(columns):
+    def min(self, columns):
         """
         Return the min value from a column dataframe
         :param columns: '*', list of columns names or a single column name.
         :return:
         """
-        return _exprs(F.min, columns)
+        return self._exprs(F.min, columns)
 
-    @add_attr(cols)
-    def max(columns):
+    def max(self, columns):
         """
         Return the max value from a column dataframe
         :param columns: '*', list of columns names or a single column name.
         :return:
         """
-        return _exprs(F.max, columns)
+        return self._exprs(F.max, columns)
 
-    @add_attr(cols)
-    def range(columns):
+    def range(self, columns):
         """
         Return the range form the min to the max value
         :param columns: '*', list of columns names or a single column name.
         :return:
         """
 
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
 
         range_result = {}
         for c in columns:
-            max_val = self.cols.max(c)
-            min_val = self.cols.min(c)
+            max_val = self._df.cols.max(c)
+            min_val = self._df.cols.min(c)
             range_result[c] = {'min': min_val, 'max': max_val}
 
         return range_result
 
-    @add_attr(cols)
     # TODO: Use pandas or rdd for small datasets?!
-    def median(columns):
+    def median(self, columns, error=1):
         """
         Return the median of a column dataframe
         :param columns: '*', list of columns names or a single column name.
+        :param error: Relative error as in approxQuantile() or "sketch". See percentile()
         :return:
         """
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
 
-        return percentile(columns, [0.5])
+        return self.percentile(columns, [0.5], error)
 
-    @add_attr(cols, log_time=True)
-    def percentile(columns, values=None, error=1):
+    @time_it
+    def percentile(self, columns, values=None, error=1, k=200):
         """
         Return the percentile of a dataframe
         :param columns:  '*', list of columns names or a single column name.
         :param values: list of percentiles to be calculated
-        :param error:
+        :param error: Relative error as in approxQuantile(). "sketch" calculate the percentiles from the KLL sketches
+        cached for the dataframe, so other percentiles of the same columns do not launch another Spark job. The
+        sketches are built in the python workers, so the first call is slower than the percentile_approx aggregation.
+        The sketches are seeded, so the same dataframe returns the same percentiles
+        :param k: Quantile sketch size used if error is "sketch"
         :return: percentiles per columns
         """
 
         if values is None:
             values = [0.05, 0.25, 0.5, 0.75, 0.95]
 
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
+
+        return format_dict(self._quantiles(self._df, columns, values, error, k))
+
+    @staticmethod
+    def _quantiles(df, columns, values, error, k=200):
+        """
+        Calculate the percentiles of multiple columns with percentile_approx or from the cached quantile sketches
+        :param df: Dataframe to be processed
+        :param columns: list of columns names
+        :param values: list of percentiles to be calculated
+        :param error: Relative error or "sketch"
+        :param k: Quantile sketch size
+        :return: dict with the percentiles for every column
+        """
+        if error == "sketch":
+            return Cols._sketch_percentile(df, columns, values, k)
+        return Cols._percentile(df, columns, values, error)
+
+    @staticmethod
+    def _sketch_percentile(df, columns, values, k):
+        """
+        Calculate the percentiles of multiple columns from the cached quantile sketches
+        :param df: Dataframe to be processed
+        :param columns: list of columns names
+        :param values: list of percentiles to be calculated
+        :param k: Quantile sketch size
+        :return: dict with the percentiles for every column
+        """
+        sketches = quantile_sketches(df, columns, k)
 
-        # Get percentiles
-        percentile_results = []
+        result = {}
         for c in columns:
-            percentile_per_col = self \
-                .rows.drop_na(c) \
-                .cols.cast(c, "double") \
-                .approxQuantile(c, values, error)
+            sketch = sketches[c]
+            result[c] = dict(zip(values, sketch.quantiles(values))) if sketch.n > 0 else {}
+        return result
 
-            percentile_results.append(dict(zip(values, percentile_per_col)))
+    def quantile_sketch(self, columns, k=200):
+        """
+        Return a mergeable KLL quantile sketch for every column. The sketches are calculated in a single pass and
+        cached in the dataframe. Use to_dict() to serialize them
+        :param columns: '*', list of columns names or a single column name.
+        :param k: Quantile sketch size. With the default k=200 the rank error is about 1.65%
+        :return: KLL sketches per column
+        """
+        columns = parse_columns(self._df, columns)
 
-        percentile_results = dict(zip(columns, percentile_results))
+        return format_dict(quantile_sketches(self._df, columns, k))
 
-        return format_dict(percentile_results)
+    @staticmethod
+    def _percentile(df, columns, values, error):
+        """
+        Calculate the percentiles of multiple columns in a single pass. Nulls and NaN are ignored per column
+        :param df: Dataframe to be processed
+        :param columns: list of columns names
+        :param values: list of percentiles to be calculated
+        :param error: relative error
+        :return: dict with the percentiles for every column
+        """
+        row = df.agg(*[percentile_agg(c, values, error).alias(str(i)) for i, c in enumerate(columns)]).first()
+
+        result = {}
+        for i, c in enumerate(columns):
+            percentile_per_col = row[str(i)]
+            result[c] = dict(zip(values, percentile_per_col)) if percentile_per_col is not None else {}
+        return result
 
     # Descriptive Analytics
-    @add_attr(cols)
     # TODO: implement double MAD http://eurekastatistics.com/using-the-median-absolute-deviation-to-find-outliers/
-    def mad(col_name, more=None):
+    def mad(self, columns, more=None, error=1, k=200):
         """
         Return the Median Absolute Deviation
-        :param col_name: Column to be processed
+        :param columns: Columns to be processed
         :param more: Return some extra computed values (Median).
+        :param error: Relative error as in approxQuantile(). The medians of all the columns are calculated in one
+        pass and the medians of the deviations in another one. "sketch" calculate the median and the mad from the KLL
+        quantile sketches cached for the dataframe, the rank error of the median is about 1.65% for the default k=200
+        and the rank error of the mad is at most twice that
+        :param k: Quantile sketch size used if error is "sketch". Bigger is more precise but uses more memory
         :return:
         """
+        columns = parse_columns(self._df, columns)
 
-        # return mean(absolute(data - mean(data, axis)), axis)
-        median_value = self.cols.median(col_name)
+        if error == "sketch":
+            sketches = quantile_sketches(self._df, columns, k)
+            mads = {c: sketches[c].mad() for c in columns}
+        else:
+            medians = {c: p[0.5] for c, p in self._percentile(self._df, columns, [0.5], error).items() if p}
 
-        mad_value = self.select(col_name) \
-            .withColumn(col_name, F.abs(F.col(col_name) - median_value)) \
-            .cols.median(col_name)
+            deviations = self._df.select(*[F.abs(F.col("`" + c.replace("`", "``") + "`") - medians[c]).alias(c)
+                                           for c in medians])
+            deviation_medians = self._percentile(deviations, list(medians.keys()), [0.5], error)
+            mads = {c: (medians[c], deviation_medians[c].get(0.5)) if c in medians else (None, None)
+                    for c in columns}
 
-        if more:
-            result = {"mad": mad_value, "median": median_value}
-        else:
-            result = mad_value
+        result = {}
+        for c in columns:
+            median_value, mad_value = mads[c]
+            if more:
+                result[c] = {"mad": mad_value, "median": median_value}
+            else:
+                result[c] = mad_value
 
-        return result
+        return format_dict(result)
 
-    @add_attr(cols)
-    def std(columns):
+    def std(self, columns):
         """
         Return the standard deviation of a column dataframe
         :param columns: '*', list of columns names or a single column name.
         :return:
         """
-        return _exprs(F.stddev, columns)
+        return self._exprs(F.stddev, columns)
 
-    @add_attr(cols)
-    def kurt(columns):
+    def kurt(self, columns):
         """
         Return the kurtosis of a column dataframe
         :param columns: '*', list of columns names or a single column name.
         :return:
         """
-        return _exprs(F.kurtosis, columns)
+        return self._exprs(F.kurtosis, columns)
 
-    @add_attr(cols)
-    def mean(columns):
+    def mean(self, columns):
         """
         Return the mean of a column dataframe
         :param columns: '*', list of columns names or a single column name.
         :return:
         """
-        return _exprs(F.mean, columns)
+        return self._exprs(F.mean, columns)
 
-    @add_attr(cols)
-    def skewness(columns):
+    def skewness(self, columns):
         """
         Return the skewness of a column dataframe
         :param columns: '*', list of columns names or a single column name.
         :return:
         """
-        return _exprs(F.skewness, columns)
+        return self._exprs(F.skewness, columns)
 
-    @add_attr(cols)
-    def sum(columns):
+    def sum(self, columns):
         """
         Return the sum of a column dataframe
         :param columns: '*', list of columns names or a single column name.
         :return:
         """
-        return _exprs(F.sum, columns)
+        return self._exprs(F.sum, columns)
 
-    @add_attr(cols)
-    def variance(columns):
+    def variance(self, columns):
         """
         Return the column variance
         :param columns: '*', list of columns names or a single column name.
         :return:
         """
-        return _exprs(F.variance, columns)
+        return self._exprs(F.variance, columns)
 
-    @add_attr(cols)
-    def mode(columns):
+    def mode(self, columns):
         """
         Return the the column mode
         :param columns: '*', list of columns names or a single column name.
         :return:
         """
 
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
         mode_result = []
 
         for col_name in columns:
-            cnts = self.groupBy(col_name).count()
+            cnts = self._df.groupBy(col_name).count()
             mode_df = cnts.join(
                 cnts.agg(F.max("count").alias("max_")), F.col("count") == F.col("max_")
             )
@@ -655,8 +727,7 @@ def cols(self):
         return mode_result
 
     # String Operations
-    @add_attr(cols)
-    def lower(columns):
+    def lower(self, columns):
         """
         Lowercase all the string in a column
         :param columns: '*', list of columns names or a single column name.
@@ -666,10 +737,9 @@ def cols(self):
         def _lower(col, args):
             return F.lower(F.col(col))
 
-        return apply_expr(columns, _lower, filter_col_by_dtypes="string")
+        return self.apply_expr(columns, _lower, filter_col_by_dtypes="string")
 
-    @add_attr(cols)
-    def upper(columns):
+    def upper(self, columns):
         """
         Uppercase all the strings column
         :param columns: '*', list of columns names or a single column name.
@@ -679,10 +749,9 @@ def cols(self):
         def _upper(col, args):
             return F.upper(F.col(col))
 
-        return apply_expr(columns, _upper, filter_col_by_dtypes="string")
+        return self.apply_expr(columns, _upper, filter_col_by_dtypes="string")
 
-    @add_attr(cols)
-    def trim(columns):
+    def trim(self, columns):
         """
         Trim the string in a column
         :param columns: '*', list of columns names or a single column name.
@@ -692,10 +761,9 @@ def cols(self):
         def _trim(col_name, args):
             return F.trim(F.col(col_name))
 
-        return apply_expr(columns, _trim)
+        return self.apply_expr(columns, _trim)
 
-    @add_attr(cols)
-    def reverse(columns):
+    def reverse(self, columns):
         """
         Reverse the order of all the string in a column
         :param columns: '*', list of columns names or a single column name.
@@ -705,33 +773,23 @@ def cols(self):
         def _reverse(col, args):
             return F.reverse(F.col(col))
 
-        df = apply_expr(columns, _reverse, filter_col_by_dtypes="string")
+        df = self.apply_expr(columns, _reverse, filter_col_by_dtypes="string")
 
         return df
 
-    @add_attr(cols)
-    def remove_accents(columns):
+    def remove_accents(self, columns):
         """
         Remove accents in specific columns
         :param columns: '*', list of columns names or a single column name.
         :return:
         """
 
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
 
-        def _remove_accents(col_name, attr):
-            cell_str = col_name
-            # first, normalize strings:
-            nfkd_str = unicodedata.normalize('NFKD', cell_str)
-            # Keep chars that has no other char combined (i.e. accents chars)
-            with_out_accents = u"".join([c for c in nfkd_str if not unicodedata.combining(c)])
-            return with_out_accents
-
-        df = apply(columns, _remove_accents, "string")
+        df = self.apply(columns, remove_accents_series, "string", func_type="vectorized")
         return df
 
-    @add_attr(cols)
-    def remove_special_chars(columns):
+    def remove_special_chars(self, columns):
         """
         Reference https://stackoverflow.com/questions/265960/best-way-to-strip-punctuation-from-a-string-in-python
         This method remove special characters (i.e. !”#$%&/()=?) in columns of dataFrames.
@@ -739,32 +797,26 @@ def cols(self):
         :return:
         """
 
-        columns = parse_columns(self, columns)
-        regex = re.compile("[%s]" % re.escape(string.punctuation))
-
-        def _remove_special_chars(value, attr):
-            return regex.sub("", value)
+        columns = parse_columns(self._df, columns)
 
-        df = apply(columns, _remove_special_chars, "string")
+        df = self.apply(columns, remove_special_chars_series, "string", func_type="vectorized")
         return df
 
-    @add_attr(cols)
-    def remove_white_spaces(columns):
+    def remove_white_spaces(self, columns):
         """
         Remove all the white spaces from a string
         :param columns:
         :return:
         """
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
 
         def _remove_white_spaces(col_name, args):
             return F.regexp_replace(F.col(col_name), " ", "")
 
-        df = apply_expr(columns, _remove_white_spaces)
+        df = self.apply_expr(columns, _remove_white_spaces)
         return df
 
-    @add_attr(cols)
-    def date_transform(col_name, new_col, current_format, output_format):
+    def date_transform(self, col_name, new_col, current_format, output_format):
         """
         Tranform a column date format
         :param  col_name: Name date columns to be transformed. Columns ha
@@ -776,7 +828,7 @@ def cols(self):
         """
 
         # Asserting if column if in dataFrame:
-        validate_columns_names(self, col_name)
+        validate_columns_names(self._df, col_name)
 
         def _date_transform(new_col, attr):
             _col_name = attr[0]
@@ -785,10 +837,9 @@ def cols(self):
             return F.date_format(F.unix_timestamp(_col_name, _current_format).cast("timestamp"), _output_format).alias(
                 new_col)
 
-        return apply_expr(new_col, _date_transform, [col_name, current_format, output_format])
+        return self.apply_expr(new_col, _date_transform, [col_name, current_format, output_format])
 
-    @add_attr(cols)
-    def years_between(col_name, new_col, date_format):
+    def years_between(self, col_name, new_col, date_format):
         """
         This method compute the age based on a born date.
         :param  col_name: Name of the column born dates column.
@@ -798,7 +849,7 @@ def cols(self):
 
         """
         # Asserting if column if in dataFrame:
-        validate_columns_names(self, col_name)
+        validate_columns_names(self._df, col_name)
 
         # Output format date
         format_dt = "yyyy-MM-dd"  # Some SimpleDateFormat string
@@ -819,10 +870,9 @@ def cols(self):
                 .alias(
                 new_col)
 
-        return apply_expr(new_col, _years_between, [date_format, col_name]).cols.cast(new_col, "float")
+        return self.apply_expr(new_col, _years_between, [date_format, col_name]).cols.cast(new_col, "float")
 
-    @add_attr(cols)
-    def impute(input_cols, output_cols, strategy="mean"):
+    def impute(self, input_cols, output_cols, strategy="mean"):
         """
         Imputes missing data from specified columns using the mean or median.
         :param input_cols: List of columns to be analyze.
@@ -831,37 +881,33 @@ def cols(self):
         :return: Dataframe object (DF with columns that has the imputed values).
         """
 
-        input_cols = parse_columns(self, input_cols)
+        input_cols = parse_columns(self._df, input_cols)
         output_cols = val_to_list(output_cols)
 
         imputer = Imputer(inputCols=input_cols, outputCols=output_cols)
 
-        df = self
+        df = self._df
         model = imputer.setStrategy(strategy).fit(df)
         df = model.transform(df)
 
         return df
 
-    @add_attr(cols)
-    def fill_na(columns, value):
+    def fill_na(self, columns, value):
         """
         Replace null data with a specified value
         :param columns:
         :param value:
         :return:
         """
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
 
         def _fill_na(_col_name, _value):
             return F.when(F.isnan(_col_name) | F.col(_col_name).isNull(), _value).otherwise(F.col(_col_name))
 
-        df = self
-        for col_name in columns:
-            df = df.cols.apply_expr(col_name, _fill_na, value)
+        df = self._df.cols.apply_expr(columns, _fill_na, value)
         return df
 
-    @add_attr(cols)
-    def is_na(columns):
+    def is_na(self, columns):
         """
         Replace null values per True and non null per False
         :param columns:
@@ -869,25 +915,23 @@ def cols(self):
         :return:
         """
 
+        columns = parse_columns(self._df, columns)
+
         def _replace_na(_col_name, _value):
             return F.when(F.isnan(_col_name) | F.col(_col_name).isNull(), True).otherwise(False)
 
-        df = self
-        for col_name in columns:
-            df = df.cols.apply_expr(col_name, _replace_na)
+        df = self._df.cols.apply_expr(columns, _replace_na)
 
         return df
 
-    @add_attr(cols)
-    def count():
+    def count(self):
         """
         Return the columns number
         :return:
         """
-        return len(self.columns)
+        return len(self._df.columns)
 
-    @add_attr(cols)
-    def count_na(columns):
+    def count_na(self, columns):
         """
         Return the NAN and Null count in a Column
         :param columns: '*', list of columns names or a single column name.
@@ -895,35 +939,43 @@ def cols(self):
         :return:
         """
 
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
+
+        df = self._df
+        cached = stats_cache.get(df, [("count_na", col_name) for col_name in columns])
 
-        df = self
         expr = []
         for col_name in columns:
-            # If type column is Struct parse to String. isnan/isNull can not handle Structure
+            if ("count_na", col_name) in cached:
+                continue
 
+            # If type column is Struct parse to String. isnan/isNull can not handle Structure
             if is_(df.cols.schema_dtypes(col_name), (StructType, BooleanType)):
                 df = df.cols.cast(col_name, "string")
             expr.append(F.count(F.when(F.isnan(col_name) | F.col(col_name).isNull(), col_name)).alias(col_name))
 
-        result = format_dict(df.select(*expr).to_json())
+        if len(expr) > 0:
+            values = df.select(*expr).to_json()[0]
+            calculated = {("count_na", col_name): values[col_name] for col_name in values}
+            stats_cache.set(self._df, calculated)
+            cached.update(calculated)
+
+        result = format_dict([{col_name: cached[("count_na", col_name)] for col_name in columns}])
 
         return result
 
-    @add_attr(cols)
-    def count_zeros(columns):
+    def count_zeros(self, columns):
         """
         Return the NAN and Null count in a Column
         :param columns: '*', list of columns names or a single column name.
         :param type: Accepts integer, float, string or None
         :return:
         """
-        columns = parse_columns(self, columns)
-        df = self
+        columns = parse_columns(self._df, columns)
+        df = self._df
         return format_dict(df.select([F.count(F.when(F.col(c) == 0, c)).alias(c) for c in columns]).to_json())
 
-    @add_attr(cols)
-    def count_uniques(columns, estimate=True):
+    def count_uniques(self, columns, estimate=True):
         """
         Return how many unique items exist in a columns
         :param columns: '*', list of columns names or a single column name.
@@ -931,84 +983,76 @@ def cols(self):
         :type estimate: bool
         :return:
         """
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
 
         if estimate is True:
-            result = _exprs(F.approx_count_distinct, columns)
+            result = self._exprs(F.approx_count_distinct, columns)
         else:
-            df = self
+            df = self._df
             result = {c: df.select(c).distinct().count() for c in columns}
         return result
 
-    @add_attr(cols)
-    def unique(columns):
-        columns = parse_columns(self, columns)
-        return self.select(columns).distinct()
+    def unique(self, columns):
+        columns = parse_columns(self._df, columns)
+        return self._df.select(columns).distinct()
 
-    @add_attr(cols)
-    def select_by_dtypes(data_type):
+    def select_by_dtypes(self, data_type):
         """
         This function returns one or multiple dataFrame columns which match with the data type provided.
         :param data_type: Datatype column to look at
         :return:
         """
 
-        columns = parse_columns(self, '*', is_regex=None, filter_by_column_dtypes=data_type)
+        columns = parse_columns(self._df, '*', is_regex=None, filter_by_column_dtypes=data_type)
 
-        return self.select(columns)
+        return self._df.select(columns)
 
     # Operations between columns
-    @add_attr(cols)
-    def _math(columns, operator):
+    def _math(self, columns, operator):
         """
         Helper to process arithmetic operation between columns
         :param columns:
         :param operator:
         :return:
         """
-        columns = parse_columns(self, columns, ["integer", "float"])
+        columns = parse_columns(self._df, columns, ["integer", "float"])
         assert len(columns) >= 2, "Error 2 or more columns needed"
-        return self.select(reduce(operator, columns, 1))
+        return self._df.select(reduce(operator, columns, 1))
 
-    @add_attr(cols)
-    def add(columns):
+    def add(self, columns):
         """
         Add two or more columns
         :param columns: '*', list of columns names or a single column name.
         :return:
         """
 
-        self._math(columns, lambda x, y: self[x] + self[y])
+        self._df._math(columns, lambda x, y: self._df[x] + self._df[y])
 
-    @add_attr(cols)
-    def sub(columns):
+    def sub(self, columns):
         """
         Subs two or more columns
         :param columns: '*', list of columns names or a single column name.
         :return:
         """
-        self._math(columns, lambda x, y: self[x] - self[y])
+        self._df._math(columns, lambda x, y: self._df[x] - self._df[y])
 
-    @add_attr(cols)
-    def mul(columns):
+    def mul(self, columns):
         """
         Multiply two or more columns
         :param columns: '*', list of columns names or a single column name.
         :return:
         """
-        self._math(columns, lambda x, y: self[x] * self[y])
+        self._df._math(columns, lambda x, y: self._df[x] * self._df[y])
 
-    @add_attr(cols)
-    def div(columns):
+    def div(self, columns):
         """
         Divide two or more columns
         :param columns: '*', list of columns names or a single column name.
         :return:
         """
-        self._math(columns, lambda x, y: self[x] / self[y])
+        self._df._math(columns, lambda x, y: self._df[x] / self._df[y])
 
-    @add_attr(cols)
-    def replace(columns, search_and_replace=None, value=None, regex=None):
+    def replace(self, columns, search_and_replace=None, value=None, regex=None):
         """
         Replace a value or a list of values by a specified string
         :param columns: '*', list of columns names or a single column name.
@@ -1043,7 +1087,7 @@ def cols(self):
             return _df.withColumn(c, F.regexp_replace(_col_name, _search, _replace))
 
         def func_replace(_df, _col_name, _search, _replace):
-            data_type = self.cols.dtype(_col_name)
+            data_type = self._df.cols.dtype(_col_name)
             _search = [PYTHON_TYPES_[data_type](s) for s in _search]
             _df = _df.replace(_search, _replace, _col_name)
             return _df
@@ -1053,59 +1097,61 @@ def cols(self):
         else:
             func = func_replace
 
-        df = self
+        df = self._df
 
-        columns = parse_columns(self, columns, filter_by_column_dtypes="string")
+        columns = parse_columns(self._df, columns, filter_by_column_dtypes="string")
         for c in columns:
             df = func(df, c, search, _replace)
 
         return df
 
     # Stats
-    @add_attr(cols)
-    def z_score(columns):
+    def z_score(self, columns):
         """
         Return the column data type
         :param columns:
         :return:
         """
 
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
 
-        df = self
+        df = self._df
         for c in columns:
             new_col = "z_col_" + c
 
-            mean_value = self.cols.mean(columns)
-            stdev_value = self.cols.std(columns)
+            mean_value = self._df.cols.mean(columns)
+            stdev_value = self._df.cols.std(columns)
 
             df = df.withColumn(new_col, F.abs((F.col(c) - mean_value) / stdev_value))
         return df
 
-    @add_attr(cols)
-    def iqr(columns, more=None):
+    def iqr(self, columns, more=None, error=1):
         """
         Return the column data type
         :param columns:
         :param more: Return info about q1 and q3
+        :param error: Relative error as in approxQuantile() or "sketch". See percentile()
         :return:
         """
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
+
+        # The quartiles of all the columns in one pass
+        quartiles = self._quantiles(self._df, columns, [0.25, 0.75], error)
+
+        result = {}
         for c in columns:
-            quartile = self.cols.percentile(c, [0.25, 0.75])
-            q1 = quartile[0.25]
-            q3 = quartile[0.75]
+            q1 = quartiles[c][0.25]
+            q3 = quartiles[c][0.75]
 
-        iqr_value = q3 - q1
-        if more:
-            result = {"iqr": iqr_value, "q1": q1, "q3": q3}
-        else:
-            result = iqr_value
-        return result
+            iqr_value = q3 - q1
+            if more:
+                result[c] = {"iqr": iqr_value, "q1": q1, "q3": q3}
+            else:
+                result[c] = iqr_value
+        return format_dict(result)
 
-    @add_attr(cols)
     # TODO: Maybe we should create nest_to_vector and nest_array, nest_to_string
-    def nest(input_cols, output_col, shape="string", separator=""):
+    def nest(self, input_cols, output_col, shape="string", separator=""):
         """
         Concat multiple columns to one with the format specified
         :param input_cols: columns to be nested
@@ -1115,32 +1161,31 @@ def cols(self):
         :return: Spark DataFrame
         """
 
-        df = self
+        df = self._df
 
         if has_(input_cols, F.Column):
             # Transform non Column data to lit
             columns = [F.lit(col) if not is_(col, F.Column) else col for col in input_cols]
         else:
-            columns = parse_columns(self, input_cols)
+            columns = parse_columns(self._df, input_cols)
 
         if shape is "vector":
             vector_assembler = VectorAssembler(
                 inputCols=input_cols,
                 outputCol=output_col)
-            df = vector_assembler.transform(self)
+            df = vector_assembler.transform(self._df)
 
         elif shape is "array":
-            df = apply_expr(output_col, F.array(*columns))
+            df = self.apply_expr(output_col, F.array(*columns))
 
         elif shape is "string":
-            df = apply_expr(output_col, F.concat_ws(separator, *columns))
+            df = self.apply_expr(output_col, F.concat_ws(separator, *columns))
         else:
             RaiseIt.value_error(shape, ["vector", "array", "string"])
 
         return df
 
-    @add_attr(cols)
-    def unnest(columns, mark=None, n=None, index=None):
+    def unnest(self, columns, mark=None, n=None, index=None):
         """
         Split an array or string in different columns
         :param columns: Columns to be un-nested
@@ -1155,15 +1200,17 @@ def cols(self):
         if n is None:
             infer_n = True
 
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
 
-        df = self
+        # The new columns from arrays and strings are added in a single projection
+        exprs = []
+        vector_columns = []
 
         for col_name in columns:
             # if the col is array
             expr = None
 
-            col_dtype = self.schema[col_name].dataType
+            col_dtype = self._df.schema[col_name].dataType
 
             # Array
             if is_(col_dtype, ArrayType):
@@ -1171,17 +1218,17 @@ def cols(self):
                 expr = F.col(col_name)
                 # Try to infer the array length using the first row
                 if infer_n is True:
-                    n = len(self.cols.cell(col_name))
+                    n = len(self._df.cols.cell(col_name))
 
                 for i in builtins.range(n):
-                    df = df.withColumn(col_name + "_" + str(i), expr.getItem(i))
+                    exprs.append((col_name + "_" + str(i), expr.getItem(i)))
 
             # String
             elif is_(col_dtype, StringType):
                 expr = F.split(F.col(col_name), mark)
                 # Try to infer the array length using the first row
                 if infer_n is True:
-                    n = len(self.cols.cell(col_name).split(mark))
+                    n = len(self._df.cols.cell(col_name).split(mark))
 
                 if is_int(index):
                     r = builtins.range(index, index + 1)
@@ -1189,141 +1236,144 @@ def cols(self):
                     r = builtins.range(0, n)
 
                 for i in r:
-                    df = df.withColumn(col_name + "_" + str(i), expr.getItem(i))
+                    exprs.append((col_name + "_" + str(i), expr.getItem(i)))
 
             # Vector
             elif is_(col_dtype, VectorUDT):
-                def extract(row):
-                    return row + tuple(row.vector.toArray().tolist())
+                vector_columns.append(col_name)
 
-                df = df.rdd.map(extract).toDF(df.columns)
+        df = self._df.with_columns(exprs)
+
+        for _ in vector_columns:
+            def extract(row):
+                return row + tuple(row.vector.toArray().tolist())
+
+            df = df.rdd.map(extract).toDF(df.columns)
 
         return df
 
     # TODO: Maybe we could merge this with un unnest. Like unnesting to the same column
-    @add_attr(cols)
-    def split(columns, mark):
+    def split(self, columns, mark):
         """
         A shortcut to the Apache Spark split
         :param columns: Column to be split
         :param mark: char used to split the column
         :return:
         """
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
 
         def _split(col_name, args):
             return F.split(F.col(col_name), mark)
 
-        return apply_expr(columns, _split)
+        return self.apply_expr(columns, _split)
 
-    @add_attr(cols)
-    def cell(column):
+    def cell(self, column):
         """
         Get the value for the first cell from a column in a data frame
         :param column: Column to be processed
         :return:
         """
-        return self.cols.select(column).first()[0]
+        return self._df.cols.select(column).first()[0]
 
-    @add_attr(cols, log_time=True)
     @dispatch((str, list), (float, int), (float, int), int)
-    def hist(columns, min_value, max_value, buckets=10):
+    def hist(self, columns, min_value, max_value, buckets=10):
         """
-         Get the histogram column in json format
+        Get the histogram of multiple columns in json format. All the columns are processed in a single Spark job
         :param columns: Columns to be processed
         :param min_value: Min value used to calculate the buckets
         :param max_value: Max value used to calculate the buckets
         :param buckets: Number of buckets
-        :return:
+        :return: dict with a list of buckets for every column. The list if only one column is processed
         """
 
-        columns = parse_columns(self, columns)
-        for col_name in columns:
-            # Create splits
-            splits = create_buckets(min_value, max_value, buckets)
-
-            # Create buckets in the dataFrame
-            df = bucketizer(self, col_name, splits=splits)
-
-            col_bucket = col_name + "_buckets"
-
-            counts = (df
-                      .h_repartition(col_name=col_bucket)
-                      .groupBy(col_bucket)
-                      .agg(F.count(col_bucket).alias("count"))
-                      .cols.rename(col_bucket, "value")
-                      .sort(F.asc("value")).to_json())
-
-            # Fill the gaps in dict values. For example if we have  1,5,7,8,9 it get 1,2,3,4,5,6,7,8,9
-            new_array = []
-            for i in builtins.range(buckets):
-                flag = False
-                for c in counts:
-                    value = c["value"]
-                    count = c["count"]
-                    if value == i:
-                        new_array.append({"value": value, "count": count})
-                        flag = True
-                if flag is False:
-                    new_array.append({"value": i, "count": 0})
-
-            counts = new_array
-
-            hist_data = []
-            for i in list(itertools.zip_longest(counts, splits)):
-                if i[0] is None:
-                    hist_data.append({"count": 0, "lower": i[1]["lower"], "upper": i[1]["upper"]})
-                elif "count" in i[0]:
-                    hist_data.append({"count": i[0]["count"], "lower": i[1]["lower"], "upper": i[1]["upper"]})
-
-        return hist_data
-
-    @add_attr(cols, log_time=True)
+        columns = parse_columns(self._df, columns)
+
+        hists = [(col_name, F.col("`" + col_name.replace("`", "``") + "`"), min_value, max_value, buckets)
+                 for col_name in columns]
+        result = hist_counts(self._df, hists)
+
+        if len(columns) == 1:
+            return result[columns[0]]
+        return result
+
     @dispatch((str, list), int)
-    def hist(columns, buckets=10):
-        return self.cols.hist(columns, fast_float(self.cols.min(columns)), fast_float(self.cols.max(columns)), buckets)
+    def hist(self, columns, buckets=10):
+        """
+        Get the histogram of multiple columns in json format. The buckets are calculated between the min and max
+        of every column
+        :param columns: Columns to be processed
+        :param buckets: Number of buckets
+        :return: dict with a list of buckets for every column. The list if only one column is processed. Columns
+        with only nulls get an empty list
+        """
+        columns = parse_columns(self._df, columns)
+        exprs = [F.col("`" + c.replace("`", "``") + "`") for c in columns]
+
+        # Min and max of all the columns in one pass
+        row = self._df.agg(*[F.struct(F.min(expr).alias("min"), F.max(expr).alias("max")).alias(str(i))
+                             for i, expr in enumerate(exprs)]).first()
 
-    @add_attr(cols)
-    def frequency(columns, buckets=10):
+        hists = []
+        for i, (col_name, expr) in enumerate(zip(columns, exprs)):
+            min_value, max_value = row[str(i)]
+            if min_value is not None:
+                hists.append((col_name, expr, fast_float(min_value), fast_float(max_value), buckets))
+
+        counts = hist_counts(self._df, hists)
+        result = {col_name: counts.get(col_name, []) for col_name in columns}
+
+        if len(columns) == 1:
+            return result[columns[0]]
+        return result
+
+    def frequency(self, columns, buckets=10, approx=False, k=None):
         """
         Output values frequency in json format
         :param columns: Columns to be processed
         :param buckets: Number of buckets
+        :param approx: Find the most frequent values of all the columns in one pass with a heavy hitters sketch instead
+        of counting every distinct value. Every count is underestimated by at most the 'error' reported
+        :param k: Number of counters of the sketch. By default 10 times the buckets
         :return:
         """
-        columns = parse_columns(self, columns)
-        df = self
+        columns = parse_columns(self._df, columns)
+
+        if approx:
+            if k is None:
+                k = max(100, 10 * buckets)
+            sketches = heavy_hitters(self._df, columns, k)
+            return format_dict({c: [{"value": value, "count": count, "error": sketches[c].error}
+                                    for value, count in sketches[c].top(buckets)] for c in columns})
+
+        df = self._df
         for col_name in columns:
             df = df.groupBy(col_name).count().rows.sort([("count", "desc"), (col_name, "desc")]).limit(
                 buckets).cols.rename(col_name, "value")
 
         return df.to_json()
 
-    @add_attr(cols)
-    def schema_dtypes(columns):
+    def schema_dtypes(self, columns):
         """
         Return the column(s) data type as Type
         :param columns: Columns to be processed
         :return:
         """
-        columns = parse_columns(self, columns)
-        return format_dict([self.schema[col_name].dataType for col_name in columns])
+        columns = parse_columns(self._df, columns)
+        return format_dict([self._df.schema[col_name].dataType for col_name in columns])
 
-    @add_attr(cols)
-    def dtype(columns):
+    def dtype(self, columns):
         """
         Return the column(s) data type as string
         :param columns: Columns to be processed
         :return:
         """
 
-        columns = parse_columns(self, columns)
-        data_types = tuple_to_dict(self.dtypes)
+        columns = parse_columns(self._df, columns)
+        data_types = tuple_to_dict(self._df.dtypes)
 
         return format_dict({c: data_types[c] for c in columns})
 
-    @add_attr(cols)
-    def qcut(input_col, output_col, num_buckets):
+    def qcut(self, input_col, output_col, num_buckets):
         """
         Bin columns into n buckets. Quantile Discretizer
         :param input_col: Input column to processed
@@ -1332,10 +1382,9 @@ def cols(self):
         :return:
         """
         discretizer = QuantileDiscretizer(numBuckets=num_buckets, inputCol=input_col, outputCol=output_col)
-        return discretizer.fit(self).transform(self)
+        return discretizer.fit(self._df).transform(self._df)
 
-    @add_attr(cols)
-    def clip(columns, lower, upper):
+    def clip(self, columns, lower, upper):
         """
         Trim values at input thresholds
         :param columns: Columns to be trimmed
@@ -1344,33 +1393,26 @@ def cols(self):
         :return:
         """
 
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
 
         def _clip(_col_name, args):
             _lower = args[0]
             _upper = args[1]
             return (F.when(F.col(_col_name) <= _lower, _lower)
-                    .when(F.col(_col_name) >= _upper, _upper)).otherwise(F.col(col_name))
+                    .when(F.col(_col_name) >= _upper, _upper)).otherwise(F.col(_col_name))
 
-        df = self
-        for col_name in columns:
-            df = df.cols.apply_expr(col_name, _clip, [lower, upper])
+        df = self._df.cols.apply_expr(columns, _clip, [lower, upper])
         return df
 
-    @add_attr(cols)
-    def abs(columns):
+    def abs(self, columns):
         """
         Apply abs to the values in a column
         :param columns:
         :return:
         """
-        columns = parse_columns(self, columns)
-        df = self
-        for col_name in columns:
-            df = df.withColumn(col_name, F.abs(F.col(col_name)))
+        columns = parse_columns(self._df, columns)
+        df = self._df.with_columns([(col_name, F.abs(F.col(col_name))) for col_name in columns])
         return df
 
-    return cols
-
 
-DataFrame.cols = property(cols)
+DataFrame.cols = property(Cols)
@@ -1,18 +1,25 @@
+import heapq
+import json
 import logging
 import multiprocessing
 import os
+import pickle
+from random import Random
 
 import humanize
 import jinja2
 from IPython.core.display import display, HTML
 from pyspark.ml.feature import SQLTransformer
 from pyspark.ml.stat import Correlation
-from pyspark.serializers import PickleSerializer, AutoBatchedSerializer
 from pyspark.sql import DataFrame
 from pyspark.sql import functions as F
+from pyspark.sql.types import ByteType, ShortType, IntegerType, LongType, FloatType, DoubleType, StringType, \
+    BooleanType, DateType
 
+from optimus.helpers.checkit import is_int
 from optimus.helpers.decorators import *
-from optimus.helpers.functions import parse_columns, collect_as_dict, random_int, val_to_list
+from optimus.helpers.functions import parse_columns, collect_as_dict, random_int, val_to_list, is_pyarrow_installed
+from optimus.helpers.raiseit import RaiseIt
 from optimus.spark import Spark
 
 cpu_count = multiprocessing.cpu_count()
@@ -27,33 +34,174 @@ def rollout():
     print("Yes!")
 
 
+# Data types that are collected with Arrow as the same python values returned by Row.asDict()
+ARROW_COLLECT_TYPES = (ByteType, ShortType, IntegerType, LongType, FloatType, DoubleType, StringType, BooleanType,
+                       DateType)
+
+
+def can_collect_as_arrow(df):
+    """
+    Check if a dataframe can be collected with Arrow
+    :param df: Spark Dataframe
+    :return:
+    """
+    return (is_pyarrow_installed() and len(df.columns) > 0 and len(set(df.columns)) == len(df.columns) and
+            all(isinstance(field.dataType, ARROW_COLLECT_TYPES) for field in df.schema))
+
+
 @add_method(DataFrame)
-def to_json(self):
+def iter_records(self, batch_size=None):
+    """
+    Iterate over the rows of a dataframe as dicts. Only one partition at a time is held in the driver memory, so
+    repartition the dataframe if its partitions are too big
+    :param self:
+    :param batch_size: If set yield lists of batch_size dicts instead of one dict at a time
+    :return: generator
+    """
+    records = (row.asDict() for row in self.toLocalIterator())
+
+    if batch_size is None:
+        yield from records
+    else:
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+
+
+@add_method(DataFrame)
+def to_json(self, arrow=None, stream=None, batch_size=1000):
     """
     Return a json from a Spark Dataframe
     :param self:
-    :return:
+    :param arrow: Collect the data as Arrow record batches, which avoids unpickling every row. None use Arrow if
+    pyarrow is installed and all the columns have simple data types. False always collect Rows
+    :param stream: Do not collect the whole dataframe. If a function is passed it is called with every batch of
+    records. If a path is passed the records are written as json lines to the file
+    :param batch_size: Number of records passed to the stream function or written to the file at once. Required in
+    stream mode
+    :return: list of dicts, or the number of records streamed
     """
+    if stream is not None:
+        if not is_int(batch_size) or batch_size < 1:
+            RaiseIt.type_error(batch_size, ["int greater than 0"])
+
+        count = 0
+        if callable(stream):
+            for batch in self.iter_records(batch_size):
+                stream(batch)
+                count += len(batch)
+        else:
+            with open(stream, "w", encoding="utf-8") as file:
+                for batch in self.iter_records(batch_size):
+                    file.write("".join(json.dumps(record, default=str) + "\n" for record in batch))
+                    count += len(batch)
+        return count
+
+    if arrow is None:
+        arrow = can_collect_as_arrow(self)
+
+    if arrow is True:
+        import pyarrow as pa
+
+        batches = self._collectAsArrow()
+        if len(batches) == 0:
+            return []
+
+        data = pa.Table.from_batches(batches).to_pydict()
+        columns = self.columns
+        return [dict(zip(columns, values)) for values in zip(*[data[c] for c in columns])]
+
     return collect_as_dict(self.collect())
 
 
 @add_method(DataFrame)
-def sample_n(self, n=10, random=False):
+def with_columns(self, exprs):
     """
-    Return a n number of sample from a dataFrame
+    Add or replace multiple columns in a single projection. It has the same result as chaining withColumn() calls
+    but the plan is analyzed only once, so it does not slow down with the number of columns.
+    All the expressions are evaluated over the columns of the original dataframe. If the dataframe has duplicated
+    column names, for example after a join, the columns can not be selected by name and the expressions are applied
+    with chained withColumn() calls
+    :param self:
+    :param exprs: dict or list of tuples (column name, Column expression). Existing columns are replaced in place,
+    new columns are added at the end in the same order. Every column name can appear only once
+    :return: Spark DataFrame
+    """
+    if isinstance(exprs, dict):
+        exprs = list(exprs.items())
+
+    if len(exprs) == 0:
+        return self
+
+    names = [c for c, _ in exprs]
+    duplicated = sorted({c for c in names if names.count(c) > 1})
+    if len(duplicated) > 0:
+        raise ValueError("Columns {columns} appear more than once in with_columns()".format(columns=duplicated))
+
+    if len(set(self.columns)) < len(self.columns):
+        df = self
+        for c, expr in exprs:
+            df = df.withColumn(c, expr)
+        return df
+
+    exprs = dict(exprs)
+    columns = [exprs.pop(c).alias(c) if c in exprs else F.col("`" + c.replace("`", "``") + "`")
+               for c in self.columns]
+    columns = columns + [expr.alias(c) for c, expr in exprs.items()]
+
+    return self.select(*columns)
+
+
+@add_method(DataFrame)
+def sample_n(self, n=10, random=False, stratify=None):
+    """
+    Return a n number of sample from a dataFrame in a single pass, without counting the rows before. Every partition
+    keeps the n rows with the smallest random keys (reservoir sampling) and the partial samples are merged with a tree
+    reduce, so exactly n rows are returned if the dataframe has at least n rows
     :param self:
     :param n: Number of samples
     :param random: if true get a semi random sample
+    :param stratify: Column name. If set n rows are sampled for every value of the column
     :return:
     """
     if random is True:
-        seed = random_int()
+        seed = int(random_int())
     elif random is False:
         seed = 0
 
-    rows_count = self.count()
-    fraction = n / rows_count
-    return self.sample(False, fraction, seed=seed)
+    stratify_index = self.columns.index(stratify) if stratify is not None else None
+
+    def _reservoir(index, rows):
+        generator = Random(seed + index)
+        reservoirs = {}
+        for i, row in enumerate(rows):
+            stratum = row[stratify_index] if stratify_index is not None else None
+            reservoir = reservoirs.setdefault(stratum, [])
+
+            # Max heap by key, so the row with the biggest key is the one replaced
+            item = (-generator.random(), i, row)
+            if len(reservoir) < n:
+                heapq.heappush(reservoir, item)
+            elif item > reservoir[0]:
+                heapq.heapreplace(reservoir, item)
+
+        yield {stratum: [(-key, row) for key, _, row in reservoir] for stratum, reservoir in reservoirs.items()}
+
+    def _merge(reservoirs_a, reservoirs_b):
+        for stratum, reservoir in reservoirs_b.items():
+            merged = reservoirs_a.get(stratum, []) + reservoir
+            reservoirs_a[stratum] = heapq.nsmallest(n, merged, key=lambda x: x[0])
+        return reservoirs_a
+
+    reservoirs = self.rdd.mapPartitionsWithIndex(_reservoir).treeAggregate({}, _merge, _merge)
+
+    rows = [row for reservoir in reservoirs.values() for _, row in reservoir]
+    return Spark.instance.spark.createDataFrame(rows, schema=self.schema)
 
 
 @add_method(DataFrame)
@@ -98,26 +246,40 @@ def melt(self, id_vars, value_vars, var_name="variable", value_name="value", dat
 
 
 @add_method(DataFrame)
-def size(self):
+def size(self, mode="plan", sample=1000):
     """
-    Get the size of a dataframe in bytes
+    Get the estimated size of a dataframe in bytes. The data is never collected to the driver
     :param self:
+    :param mode: 'plan' read the size estimated by Catalyst from the optimized plan, no Spark job is launched.
+    'files' sum the size of the input files, if the dataframe does not come from files the plan estimation is used.
+    'sample' measure the serialized size of some rows and multiply the mean by the rows count
+    :param sample: Number of rows measured in 'sample' mode
     :return:
     """
-
-    def _to_java_object_rdd(rdd):
-        """
-        Return a JavaRDD of Object by unpickling
-        It will convert each Python object into Java object by Pyrolite, whenever the
-        RDD is serialized in batch or not.
-        """
-        rdd = rdd._reserialize(AutoBatchedSerializer(PickleSerializer()))
-        return rdd.ctx._jvm.org.apache.spark.mllib.api.python.SerDe.pythonToJava(rdd._jrdd, True)
-
-    java_obj = _to_java_object_rdd(self.rdd)
-
-    n_bytes = Spark.instance.sc._jvm.org.apache.spark.util.SizeEstimator.estimate(java_obj)
-    return n_bytes
+    modes = ["plan", "files", "sample"]
+    if mode not in modes:
+        RaiseIt.value_error(mode, modes)
+
+    if mode == "files":
+        files = self.inputFiles()
+        if len(files) > 0:
+            sc = Spark.instance.sc
+            conf = sc._jsc.hadoopConfiguration()
+            n_bytes = 0
+            for file in files:
+                path = sc._jvm.org.apache.hadoop.fs.Path(file)
+                n_bytes += path.getFileSystem(conf).getFileStatus(path).getLen()
+            return n_bytes
+
+    elif mode == "sample":
+        rows = self.limit(sample).collect()
+        if len(rows) == 0:
+            return 0
+        mean_size = sum(len(pickle.dumps(tuple(row))) for row in rows) / len(rows)
+        return int(mean_size * self.rows.count())
+
+    # sizeInBytes is a Scala BigInt
+    return int(self._jdf.queryExecution().optimizedPlan().stats().sizeInBytes().toString())
 
 
 @add_method(DataFrame)
@@ -227,7 +389,7 @@ def table_html(self, limit=100, columns=None):
     # Filter only the columns and data type info need it
     dtypes = [(i[0], i[1], j.nullable,) for i, j in zip(self.dtypes, self.schema)]
 
-    total_rows = self.count()
+    total_rows = self.rows.count()
     if total_rows < limit:
         limit = total_rows
 
@@ -0,0 +1,138 @@
+from pyspark.sql import functions as F
+
+from optimus.functions import abstract_udf as audf, remove_accents_series, remove_special_chars_series
+from optimus.helpers.functions import parse_columns, get_spark_dtypes_object
+
+
+def _fill_na(col, args):
+    return F.when(F.isnan(col) | col.isNull(), args[0]).otherwise(col)
+
+
+def _is_na(col, args):
+    return F.when(F.isnan(col) | col.isNull(), True).otherwise(False)
+
+
+def _clip(col, args):
+    _lower, _upper = args
+    return F.when(col <= _lower, _lower).when(col >= _upper, _upper).otherwise(col)
+
+
+# Operation name: (function that receives a Column and the args and return a Column, data type of the columns the
+# operation is applied to, data type returned, True if applying the operation twice is the same as applying it once)
+OPERATIONS = {
+    "lower": (lambda col, args: F.lower(col), "string", "string", True),
+    "upper": (lambda col, args: F.upper(col), "string", "string", True),
+    "trim": (lambda col, args: F.trim(col), None, "string", True),
+    "reverse": (lambda col, args: F.reverse(col), "string", "string", False),
+    "remove_white_spaces": (lambda col, args: F.regexp_replace(col, " ", ""), None, "string", True),
+    "remove_accents": (lambda col, args: audf(col, remove_accents_series, "string", func_type="vectorized"), None,
+                       "string", True),
+    "remove_special_chars": (lambda col, args: audf(col, remove_special_chars_series, "string",
+                                                    func_type="vectorized"), None, "string", True),
+    "abs": (lambda col, args: F.abs(col), None, None, True),
+    "fill_na": (_fill_na, None, None, True),
+    "is_na": (_is_na, None, "boolean", False),
+    "clip": (_clip, None, None, True),
+    "cast": (lambda col, args: col.cast(get_spark_dtypes_object(args[0])), None, None, True),
+}
+
+
+class LazyCols:
+    """
+    Record cols operations without creating a new dataframe for every one of them. When collect_plan() is called
+    the operations over every column are merged in one expression and the dataframe is created with a single
+    projection.
+    df.cols.lazy().trim("*").lower("*").remove_accents("name").collect_plan()
+    """
+    __slots__ = ["_df", "_steps"]
+
+    def __init__(self, df):
+        self._df = df
+        self._steps = []
+
+    def _add(self, name, columns, *args):
+        self._steps.append((name, columns, args))
+        return self
+
+    def lower(self, columns):
+        return self._add("lower", columns)
+
+    def upper(self, columns):
+        return self._add("upper", columns)
+
+    def trim(self, columns):
+        return self._add("trim", columns)
+
+    def reverse(self, columns):
+        return self._add("reverse", columns)
+
+    def remove_white_spaces(self, columns):
+        return self._add("remove_white_spaces", columns)
+
+    def remove_accents(self, columns):
+        return self._add("remove_accents", columns)
+
+    def remove_special_chars(self, columns):
+        return self._add("remove_special_chars", columns)
+
+    def abs(self, columns):
+        return self._add("abs", columns)
+
+    def fill_na(self, columns, value):
+        return self._add("fill_na", columns, value)
+
+    def is_na(self, columns):
+        return self._add("is_na", columns)
+
+    def clip(self, columns, lower, upper):
+        return self._add("clip", columns, lower, upper)
+
+    def cast(self, columns, dtype):
+        return self._add("cast", columns, dtype)
+
+    def plan(self):
+        """
+        Return the operations that are going to be applied to every column. Steps that do not change the column are
+        dropped: operations over columns of other data type, casts to the current data type and idempotent operations
+        applied twice in a row
+        :return: dict with a list of tuples (operation name, args) for every column
+        """
+        df = self._df
+        dtypes = dict(df.dtypes)
+        result = {}
+
+        for name, columns, args in self._steps:
+            _, input_dtype, output_dtype, idempotent = OPERATIONS[name]
+
+            for col_name in parse_columns(df, columns):
+                steps = result.setdefault(col_name, [])
+
+                if input_dtype is not None and dtypes[col_name] != input_dtype:
+                    continue
+                if idempotent and len(steps) > 0 and steps[-1] == (name, args):
+                    continue
+
+                if name == "cast":
+                    output_dtype = get_spark_dtypes_object(args[0]).simpleString()
+                    if dtypes[col_name] == output_dtype:
+                        continue
+
+                steps.append((name, args))
+                if output_dtype is not None:
+                    dtypes[col_name] = output_dtype
+
+        return {col_name: steps for col_name, steps in result.items() if len(steps) > 0}
+
+    def collect_plan(self):
+        """
+        Apply all the operations recorded in a single projection
+        :return: Spark DataFrame
+        """
+        exprs = []
+        for col_name, steps in self.plan().items():
+            expr = F.col("`" + col_name.replace("`", "``") + "`")
+            for name, args in steps:
+                expr = OPERATIONS[name][0](expr, args)
+            exprs.append((col_name, expr))
+
+        return self._df.with_columns(exprs)
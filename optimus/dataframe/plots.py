@@ -3,41 +3,46 @@ import seaborn as sns
 from pyspark.sql import DataFrame
 
 from optimus.functions import plot_hist, plot_freq
-from optimus.helpers.decorators import add_attr
 from optimus.helpers.functions import parse_columns
 
 
-def plots(self):
-    @add_attr(plots)
-    def hist(columns=None, buckets=10):
+class Plots:
+    __slots__ = ["_df"]
+
+    def __init__(self, df):
+        self._df = df
+
+    def hist(self, columns=None, buckets=10):
         """
         Plot histogram
         :param columns: Columns to be printed
         :param buckets: Number of buckets
         :return:
         """
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
 
-        for col_name in columns:
-            data = self.cols.hist(col_name, buckets)
-            plot_hist({col_name: data}, output="image")
+        # All the histograms are calculated in one pass
+        data = self._df.cols.hist(columns, buckets)
+        if len(columns) == 1:
+            data = {columns[0]: data}
 
-    @add_attr(plots)
-    def frequency(columns=None, buckets=10):
+        for col_name, hist in data.items():
+            plot_hist({col_name: hist}, output="image")
+
+    def frequency(self, columns=None, buckets=10):
         """
         Plot frequency chart
         :param columns: Columns to be printed
         :param buckets: Number of buckets
         :return:
         """
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
 
         for col_name in columns:
-            data = self.cols.frequency(col_name, buckets)
+            data = self._df.cols.frequency(col_name, buckets)
             plot_freq({col_name: data}, output="image")
 
-    @add_attr(plots)
-    def correlation(vec_col, method="pearson"):
+    def correlation(self, vec_col, method="pearson"):
         """
         Compute the correlation matrix for the input dataset of Vectors using the specified method. Method
         mapped from  pyspark.ml.stat.Correlation.
@@ -48,11 +53,9 @@ def plots(self):
         :return: Heatmap plot of the corr matrix using seaborn.
         """
 
-        corr = self.correlation(vec_col, method, output="array")
+        corr = self._df.correlation(vec_col, method, output="array")
         return sns.heatmap(corr, mask=np.zeros_like(corr, dtype=np.bool), cmap=sns.diverging_palette(220, 10,
                                                                                                      as_cmap=True))
 
-    return plots
-
 
-DataFrame.plots = property(plots)
+DataFrame.plots = property(Plots)
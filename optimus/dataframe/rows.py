@@ -7,22 +7,42 @@ from pyspark.sql import functions as F
 # Helpers
 import optimus.create as op
 from optimus.functions import filter_row_by_data_type as fbdt
+from optimus.helpers.cache import stats_cache
 from optimus.helpers.checkit import is_list_of_str_or_int
 from optimus.helpers.constants import *
 from optimus.helpers.decorators import *
 from optimus.helpers.functions import validate_columns_names, parse_columns, one_list_to_val, val_to_list
 
 
-def rows(self):
-    @add_attr(rows)
-    def append(row):
+class Rows:
+    __slots__ = ["_df"]
+
+    def __init__(self, df):
+        self._df = df
+
+    def count(self):
+        """
+        Return the number of rows. The result is cached, so calling it again over the same dataframe does not launch
+        another Spark job
+        :return:
+        """
+        df = self._df
+        cached = stats_cache.get(df, [("count",)])
+        if ("count",) in cached:
+            return cached[("count",)]
+
+        rows_count = df.count()
+        stats_cache.set(df, {("count",): rows_count})
+        return rows_count
+
+    def append(self, row):
         """
         Append a row at the end of a dataframe
         :param row: List of values to be appended
         :return: Spark DataFrame
         """
 
-        df = self
+        df = self._df
 
         assert isinstance(row, list), "Error: row must me a list"
         assert len(row) > 0, "Error: row list must be greater that 0"
@@ -42,8 +62,7 @@ def rows(self):
 
         return df.union(new_row)
 
-    @add_attr(rows)
-    def select_by_dtypes(col_name, data_type=None):
+    def select_by_dtypes(self, col_name, data_type=None):
         """
         This function has built in order to filter some type of row depending of the var type detected by python
         for Example if you have a column with
@@ -59,41 +78,37 @@ def rows(self):
         :param data_type: Datatype use filter values
         :return: Spark DataFrame
         """
-        col_name = parse_columns(self, col_name)
+        col_name = parse_columns(self._df, col_name)
 
-        return self.where(fbdt(col_name, data_type))
+        return self._df.where(fbdt(col_name, data_type))
 
-    @add_attr(rows)
-    def select(*args, **kwargs):
+    def select(self, *args, **kwargs):
         """
         Alias of Spark filter function. Return rows that match a expression
         :param args:
         :param kwargs:
         :return: Spark DataFrame
         """
-        return self.filter(*args, **kwargs)
+        return self._df.filter(*args, **kwargs)
 
-    @add_attr(rows)
     @dispatch(str)
-    def sort(columns):
+    def sort(self, columns):
         """
         Sort column by row
         """
-        columns = parse_columns(self, columns)
-        return self.rows.sort([(columns, "desc",)])
+        columns = parse_columns(self._df, columns)
+        return self._df.rows.sort([(columns, "desc",)])
 
-    @add_attr(rows)
     @dispatch(str, str)
-    def sort(columns, order="desc"):
+    def sort(self, columns, order="desc"):
         """
         Sort column by row
         """
-        columns = parse_columns(self, columns)
-        return self.rows.sort([(columns, order,)])
+        columns = parse_columns(self._df, columns)
+        return self._df.rows.sort([(columns, order,)])
 
-    @add_attr(rows)
     @dispatch(list)
-    def sort(col_sort):
+    def sort(self, col_sort):
         """
         Sort columns taking in account multiple columns
         :param col_sort: column and sort type combination (col_name, "asc")
@@ -118,31 +133,28 @@ def rows(self):
             elif order == "desc":
                 sort_func = F.desc
             func.append(sort_func(col_name))
-        df = self.sort(*func)
+        df = self._df.sort(*func)
         return df
 
-    @add_attr(rows)
-    def drop(where=None):
+    def drop(self, where=None):
         """
         Drop a row depending on a dataframe expression
         :param where: Expression used to drop the row
         :return: Spark DataFrame
         """
-        return self.where(~where)
+        return self._df.where(~where)
 
-    @add_attr(rows)
-    def drop_by_dtypes(col_name, data_type=None):
+    def drop_by_dtypes(self, col_name, data_type=None):
         """
         Drop rows by cell data type
         :param col_name: Column in which the filter is going to be apllied
         :param data_type: filter by string, integer, float or boolean
         :return: Spark DataFrame
         """
-        validate_columns_names(self, col_name)
-        return self.rows.drop(fbdt(col_name, data_type))
+        validate_columns_names(self._df, col_name)
+        return self._df.rows.drop(fbdt(col_name, data_type))
 
-    @add_attr(rows)
-    def drop_na(columns, how="all"):
+    def drop_na(self, columns, how="all"):
         """
         Removes rows with null values. You can choose to drop the row if 'all' values are nulls or if
         'any' of the values is null.
@@ -153,12 +165,11 @@ def rows(self):
         :return: Returns a new DataFrame omitting rows with null values.
         """
 
-        columns = parse_columns(self, columns)
+        columns = parse_columns(self._df, columns)
 
-        return self.dropna(how, subset=columns)
+        return self._df.dropna(how, subset=columns)
 
-    @add_attr(rows)
-    def drop_duplicates(columns=None):
+    def drop_duplicates(self, columns=None):
         """
         Drop duplicates values in a dataframe
         :param columns: List of columns to make the comparison, this only  will consider this subset of columns,
@@ -166,19 +177,17 @@ def rows(self):
         :return: Return a new DataFrame with duplicate rows removed
         """
 
-        columns = parse_columns(self, columns)
-        return self.drop_duplicates(subset=columns)
+        columns = parse_columns(self._df, columns)
+        return self._df.drop_duplicates(subset=columns)
 
-    @add_attr(rows)
-    def drop_first():
+    def drop_first(self):
         """
         Remove first row in a dataframe
         :return: Spark DataFrame
         """
-        return self.zipWithIndex().filter(lambda tup: tup[1] > 0).map(lambda tup: tup[0])
+        return self._df.zipWithIndex().filter(lambda tup: tup[1] > 0).map(lambda tup: tup[0])
 
-    @add_attr(rows)
-    def is_in(columns, values):
+    def is_in(self, columns, values):
         """
         Filter rows which columns that match a specific value
         :return: Spark DataFrame
@@ -193,9 +202,7 @@ def rows(self):
         # Concat expression with and logical or
         expr = reduce(lambda a, b: a | b, column_expr)
 
-        return self.rows.select(expr)
-
-    return rows
+        return self._df.rows.select(expr)
 
 
-DataFrame.rows = property(rows)
+DataFrame.rows = property(Rows)
@@ -1,22 +1,170 @@
 import csv
 import json
 import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import pandas as pd
 import requests
-from backoff import on_exception, expo
 from pymongo import MongoClient
 from pyspark.sql.functions import DataFrame
-from pyspark.sql.functions import pandas_udf, PandasUDFType
-from ratelimit import limits, RateLimitException
+from pyspark.sql.types import StructType, StructField, StringType
 from tqdm import tqdm_notebook
 
 from optimus.helpers.checkit import is_function, is_
+from optimus.io.save import mongo_client
 
 # Temporal col used to create a temporal ID to join the enriched data in mongo with the dataframe.
 COL_ID = "jazz_id"
 COL_RESULTS = "jazz_results"
 
+# Status codes that are worth to retry
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+
+class TokenBucket:
+    """
+    Rate limiter shared by multiple threads. Tokens are refilled at a constant rate up to the bucket capacity, so
+    bursts up to the capacity are allowed but the mean rate is never exceeded
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        :param rate: Tokens per second
+        :param capacity: Max number of tokens. By default the tokens refilled in one second, at least 1
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, rate)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Wait until a token is available and take it
+        :return:
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class RequestEngine:
+    """
+    Make requests from multiple threads. The calls of all the threads are limited by the same token bucket, the number
+    of requests waiting for a response is bounded and the requests that fail with a connection error or a retry status
+    code are retried with exponential backoff. The default request function keeps a session per thread so the
+    connections are reused
+    """
+
+    def __init__(self, func_request=None, calls=60, period=60, max_workers=10, max_in_flight=None, max_tries=8,
+                 max_backoff=60):
+        """
+        :param func_request: Function that receives a document and returns a response. By default requests.get()
+        :param calls: How many calls can be made in a period
+        :param period: Period of time in seconds
+        :param max_workers: Number of threads making requests
+        :param max_in_flight: Max number of documents submitted and not finished. By default 2 times max_workers
+        :param max_tries: How many times a request is tried
+        :param max_backoff: Max seconds to wait before retrying
+        """
+        self._local = threading.local()
+        self.func_request = func_request if func_request is not None else self._get
+        self.bucket = TokenBucket(calls / period)
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight if max_in_flight is not None else 2 * max_workers
+        self.max_tries = max_tries
+        self.max_backoff = max_backoff
+
+    def _get(self, value):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session.get(value)
+
+    def request(self, doc):
+        """
+        Make a request respecting the rate limit. Retry with exponential backoff and jitter
+        :param doc: Document passed to the request function
+        :return: response
+        """
+        for tries in range(1, self.max_tries + 1):
+            self.bucket.acquire()
+            try:
+                response = self.func_request(doc)
+            except requests.exceptions.RequestException:
+                if tries == self.max_tries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or tries == self.max_tries:
+                    return response
+
+            time.sleep(random.uniform(0, min(self.max_backoff, 2 ** (tries - 1))))
+
+    def map(self, docs):
+        """
+        Make a request for every document
+        :param docs: Iterable of documents. It is consumed from the calling thread
+        :return: generator of tuples (document, response) in the order they finish
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            in_flight = {}
+            for doc in docs:
+                if len(in_flight) >= self.max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield in_flight.pop(future), future.result()
+
+                in_flight[executor.submit(self.request, doc)] = doc
+
+            for future in list(in_flight):
+                yield in_flight.pop(future), future.result()
+
+
+def find_results(collection, ids, batch_size=10000):
+    """
+    Look up the results of multiple ids with a find() and $in per batch of ids. Only one result is returned per id, if
+    there are more documents with the same id the first one with a result is used. Results that are not strings are
+    returned as json
+    :param collection: Mongo collection
+    :param ids: Iterable of ids
+    :param batch_size: Number of ids looked up in every query
+    :return: generator of tuples (id, result)
+    """
+
+    def _find(_ids):
+        results = {}
+        cursor = collection.find({COL_ID: {"$in": _ids}}, projection={"_id": 0, COL_ID: 1, COL_RESULTS: 1}) \
+            .batch_size(batch_size)
+        for doc in cursor:
+            if results.get(doc[COL_ID]) is None:
+                results[doc[COL_ID]] = doc.get(COL_RESULTS)
+
+        for _id, value in results.items():
+            if value is not None and not isinstance(value, str):
+                value = json.dumps(value, default=str)
+            yield _id, value
+
+    batch = []
+    for _id in ids:
+        batch.append(_id)
+        if len(batch) == batch_size:
+            yield from _find(batch)
+            batch = []
+    if len(batch) > 0:
+        yield from _find(batch)
+
 
 class Enricher:
     """
@@ -59,7 +207,7 @@ class Enricher:
             raise Exception("df must by a Spark Dataframe or Pandas Dataframe")
 
     def run(self, df, collection_name=None, func_request=None, func_response=None, return_type="json", calls=60,
-            period=60, max_tries=8):
+            period=60, max_tries=8, max_workers=10, max_backoff=60):
         """
         Read a the url key from a mongo collection an make a request to a service
         :param df: Dataframe to me loaded to the enricher collection.
@@ -70,6 +218,8 @@ class Enricher:
         :param calls: how many call can you make
         :param period: in which period ot time can the call be made
         :param max_tries: how many retries should we do
+        :param max_workers: how many requests can be made at the same time
+        :param max_backoff: max seconds to wait before retrying a request
         :return:
         """
 
@@ -89,20 +239,13 @@ class Enricher:
 
         total_docs = cursor.count(True)
 
-        if func_request is None:
-            func_request = requests.get
         collection = self.get_collection(collection_name)
 
-        @on_exception(expo, RateLimitException, max_tries=max_tries)
-        @limits(calls=calls, period=period)
-        def _func_request(v):
-            return func_request(v)
+        engine = RequestEngine(func_request, calls, period, max_workers, max_tries=max_tries, max_backoff=max_backoff)
 
         if total_docs > 0:
-            for c in tqdm_notebook(cursor, total=total_docs, desc='Processing...'):
-
-                # Send request to the API
-                response = _func_request(c)
+            # Send the requests to the API concurrently
+            for c, response in tqdm_notebook(engine.map(cursor), total=total_docs, desc='Processing...'):
 
                 mongo_id = c["_id"]
 
@@ -127,27 +270,7 @@ class Enricher:
             # Append the data in enrichment to the dataframe
 
             logging.info("Appending collection info into the dataframe")
-            # TODO: An elegant way to handle pickling?
-            # take care to the pickling
-            host = self.host
-            port = self.port
-            db_name = self.db_name
-
-            @pandas_udf('string', PandasUDFType.SCALAR)
-            def func(value):
-                # More about pickling
-                from pymongo import MongoClient
-                _client = MongoClient(host, port)
-                _db = _client[db_name]
-                _collection = _db[collection_name]
-
-                def func_serie(serie):
-                    _cursor = _collection.find_one({COL_ID: serie}, projection={"_id": 0, COL_RESULTS: 1})
-                    return _cursor[COL_RESULTS]
-
-                return value.apply(func_serie)
-
-            df = df.withColumn(COL_RESULTS, func(df[COL_ID])).cols.drop(COL_ID).run()
+            df = self.join_results(df, collection_name).cols.drop(COL_ID).run()
 
             # If the process is finished, flush the Mongo collection
             self.flush()
@@ -155,6 +278,36 @@ class Enricher:
         else:
             print("No records available to process")
 
+    def join_results(self, df, collection_name=None, batch_size=10000):
+        """
+        Join the results saved in the mongo collection to the dataframe. Every partition looks up its ids with
+        find_results(), using a client shared by the python worker, and the results are joined back to the dataframe
+        by id
+        :param df: Spark dataframe with the id column
+        :param collection_name: Collection with the results
+        :param batch_size: Number of ids looked up in every query
+        :return: Spark dataframe with the results column
+        """
+        if collection_name is None:
+            collection_name = self.collection_name
+
+        # The ids are looked up in batches, an index makes every query a range scan
+        self.get_collection(collection_name).create_index(COL_ID)
+
+        host = self.host
+        port = self.port
+        db_name = self.db_name
+
+        def _lookup(rows):
+            collection = mongo_client(host, port)[db_name][collection_name]
+            return find_results(collection, (row[0] for row in rows), batch_size)
+
+        schema = StructType([StructField(COL_ID, df.schema[COL_ID].dataType, False),
+                             StructField(COL_RESULTS, StringType(), True)])
+        results = df.sql_ctx.createDataFrame(df.select(COL_ID).rdd.mapPartitions(_lookup), schema)
+
+        return df.join(results, COL_ID, "left")
+
     def count(self):
         """
         Count number of documents in a collections
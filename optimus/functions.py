@@ -1,11 +1,16 @@
 import base64
-from fastnumbers import isint, isfloat
-from functools import reduce
+import re
+import string
+import sys
+import unicodedata
+from functools import reduce, lru_cache
 from io import BytesIO
 
-import dateutil.parser
 import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
 from numpy import array
+from pandas.api.types import is_bool_dtype, is_integer_dtype, is_float_dtype
 from pyspark.sql import DataFrame
 from pyspark.sql import functions as F
 
@@ -21,7 +26,8 @@ def abstract_udf(col, func, func_return_type=None, attrs=None, func_type=None, v
     :param func: Function to be applied to the data
     :param attrs: If required attributes to be passed to the function
     :param func_return_type: Required by UDF and Pandas UDF.
-    :param func_type: pandas_udf or udf. The function is going to try to use pandas_udf if func_type is not defined
+    :param func_type: pandas_udf, vectorized or udf. The function is going to try to use pandas_udf if func_type is not
+    defined. A vectorized function receives the whole pandas Series and must return a Series of the same length
     :param verbose: print additional info
     :return: A function, UDF or Pandas UDF
     """
@@ -30,10 +36,21 @@ def abstract_udf(col, func, func_return_type=None, attrs=None, func_type=None, v
     if func_type is None and is_pyarrow_installed() is True:
         func_type = "pandas_udf"
 
-    types = ["column_exp", "udf", "pandas_udf"]
+    types = ["column_exp", "udf", "pandas_udf", "vectorized"]
     if func_type not in types:
         RaiseIt.value_error(func_type, types)
 
+    # Without Arrow a vectorized function is applied to one element Series
+    if func_type == "vectorized" and is_pyarrow_installed() is False:
+        vectorized = func
+
+        def func(value, attr):
+            result = vectorized(pd.Series([value]), attr)[0]
+            # Numpy scalars can not be pickled to the JVM, return the python value
+            return result.item() if hasattr(result, "item") else result
+
+        func_type = "udf"
+
     # if verbose is True:
     #    logging.info("Using '{func_type}' to process column '{column}' with function {func_name}"
     #                 .format(func_type=func_type, column=col, func_name=func.__name__))
@@ -45,7 +62,7 @@ def abstract_udf(col, func, func_return_type=None, attrs=None, func_type=None, v
 def func_factory(func_type=None, func_return_type=None):
     """
     Return column express, udf or pandas udf function.
-    :param func_type: Type of function udf or pandas udf
+    :param func_type: Type of function udf, pandas udf or vectorized
     :param func_return_type:
     :return:
     """
@@ -70,6 +87,13 @@ def func_factory(func_type=None, func_return_type=None):
 
         return F.pandas_udf(to_serie, func_return_type)
 
+    def vectorized_func(attr=None, func=None):
+        # Pass the whole series to the function
+        def to_serie(value):
+            return func(value, attr)
+
+        return F.pandas_udf(to_serie, func_return_type)
+
     def udf_func(attr, func):
         return F.udf(lambda value: func(value, attr), func_return_type)
 
@@ -79,16 +103,53 @@ def func_factory(func_type=None, func_return_type=None):
 
         return inner
 
-    if func_type is "pandas_udf":
+    if func_type == "pandas_udf":
         return pandas_udf_func
 
-    elif func_type is "udf":
+    elif func_type == "vectorized":
+        return vectorized_func
+
+    elif func_type == "udf":
         return udf_func
 
-    elif func_type is "column_exp":
+    elif func_type == "column_exp":
         return expression_func
 
 
+@lru_cache(maxsize=1)
+def combining_chars_table():
+    """
+    Return a str.translate() table that removes the unicode combining chars
+    :return: dict
+    """
+    return {c: None for c in range(sys.maxunicode + 1) if unicodedata.combining(chr(c))}
+
+
+def remove_accents_series(series, attr=None):
+    """
+    Remove the accents of every string in a pandas Series
+    :param series: pandas Series
+    :param attr:
+    :return: pandas Series
+    """
+    # first, normalize strings. Then remove the chars that are combined with others (i.e. accents chars)
+    return series.str.normalize('NFKD').str.translate(combining_chars_table())
+
+
+REGEX_SPECIAL_CHARS = re.compile("[%s]" % re.escape(string.punctuation))
+
+
+def remove_special_chars_series(series, attr=None):
+    """
+    Remove the special characters (i.e. !”#$%&/()=?) of every string in a pandas Series
+    Reference https://stackoverflow.com/questions/265960/best-way-to-strip-punctuation-from-a-string-in-python
+    :param series: pandas Series
+    :param attr:
+    :return: pandas Series
+    """
+    return series.str.replace(REGEX_SPECIAL_CHARS, "")
+
+
 def filter_row_by_data_type_audf(col_name, data_type):
     """
     Filter a column using a Spark data type as reference
@@ -238,85 +299,134 @@ def plot_hist(column_data=None, output="image", sub_title=""):
             return output_base64(fig)
 
 
-def filter_row_by_data_type(col_name, data_type=None, get_type=False):
+# Regular expressions used to infer the data type of a string in the JVM
+REGEX_INT = r"^\s*[+-]?\d+\s*$"
+REGEX_FLOAT = r"(?i)^\s*[+-]?((\d+\.?\d*|\.\d+)(e[+-]?\d+)?|nan|inf|infinity)\s*$"
+REGEX_BOOL = r"(?i)^(true|false)$"
+REGEX_DATE = (r"(?i)^\s*("
+              # 2018-01-31, 31/01/2018, 01.31.18 with an optional time
+              r"\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}([ t]\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?\s*(am|pm|z|[+-]\d{2}:?\d{2})?)?"
+              # Jan 31, 2018 or 31 January 2018
+              r"|(\d{1,2}\s+)?(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?(\s+\d{1,2})?,?\s+\d{2,4}"
+              # 10:30, 10:30:15 pm
+              r"|\d{1,2}:\d{2}(:\d{2})?\s*(am|pm)?"
+              r")\s*$")
+
+# Flat lists and tuples of literals: numbers, quoted strings, True, False and None. Nested lists or tuples are not
+# matched and are labeled as string
+_REGEX_ITEM = (r"\s*([+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?|'([^'\\]|\\.)*'|\"([^\"\\]|\\.)*\"|True|False|None)"
+               r"\s*")
+REGEX_ARRAY = (r"^\s*(\[(" + _REGEX_ITEM + r"(," + _REGEX_ITEM + r")*,?)?\s*\]"
+               r"|\((" + _REGEX_ITEM + r",(" + _REGEX_ITEM + r"(," + _REGEX_ITEM + r")*,?)?)?\s*\))\s*$")
+
+# Regular expressions used to infer the data type of a string in pandas. They follow the Python int() and float() rules
+PY_REGEX_INT = r"^\s*[+-]?\d+(_\d+)*\s*$"
+PY_REGEX_FLOAT_SPECIAL = r"(?i)^\s*[+-]?(nan|inf|infinity)\s*$"
+PY_REGEX_ARRAY = REGEX_ARRAY
+
+
+def infer_data_type_expr(col_name):
+    """
+    Return a Spark expression that infer the data type of every value in a column. The value is casted to string and
+    checked with regular expressions in the JVM, so no Python worker is needed.
+    The labels are the same used by filter_row_by_data_type(). Dates are detected for ISO 8601, numeric and month
+    name formats, so some fuzzy formats accepted by dateutil are labeled as string. Only flat lists and tuples of
+    literals are labeled as array, nested ones are labeled as string
+    :param col_name: Column to be processed
+    :return: Column with the data type as string
+    """
+    col = F.col(col_name).cast("string")
+
+    return (F.when(col.isNull(), "null")
+            .when(col.rlike(REGEX_INT), "int")
+            .when(col.rlike(REGEX_FLOAT), "float")
+            .when(col.rlike(REGEX_BOOL), "bool")
+            .when(col.rlike(REGEX_DATE) | col.cast("timestamp").isNotNull(), "date")
+            .when(col.rlike(REGEX_ARRAY), "array")
+            .otherwise("string"))
+
+
+def infer_data_type_series(series):
+    """
+    Infer the data type of every value in a pandas Series. The whole Series is classified at once with vectorized
+    masks, only the strings that look like a list or tuple are checked one by one with literal_eval. Arrays are
+    matched with the same regular expression used by infer_data_type_expr(), so both label the same values
+    :param series: pandas Series
+    :return: pandas Series with the data type as string
+    """
     from ast import literal_eval
+
+    result = pd.Series("null", index=series.index, dtype=object)
+
+    if is_bool_dtype(series):
+        result[:] = "bool"
+        return result
+    elif is_integer_dtype(series):
+        result[:] = "int"
+        return result
+    elif is_float_dtype(series):
+        # NaN is a float too
+        result[:] = "float"
+        return result
+
+    types = series.map(type)
+    result.loc[types == bool] = "bool"
+    result.loc[types.isin([int, np.int8, np.int16, np.int32, np.int64])] = "int"
+    result.loc[types.isin([float, np.float32, np.float64])] = "float"
+
+    # Every step only checks the strings that did not match before
+    pending = types == str
+    strings = series[pending]
+
+    def _set(mask, data_type):
+        result.loc[mask[mask].index] = data_type
+        return strings[~mask]
+
+    strings = _set(strings.str.match(PY_REGEX_INT), "int")
+    strings = _set(pd.to_numeric(strings.str.strip(), errors="coerce").notnull() |
+                   strings.str.match(PY_REGEX_FLOAT_SPECIAL), "float")
+    strings = _set(strings.str.lower().isin(["true", "false"]), "bool")
+    strings = _set(pd.to_datetime(strings, errors="coerce").notnull(), "date")
+
+    def _is_array(value):
+        try:
+            return isinstance(literal_eval((value.encode('ascii', 'ignore')).decode("utf-8")), (list, tuple))
+        except (ValueError, SyntaxError,):
+            return False
+
+    candidates = strings[strings.str.match(PY_REGEX_ARRAY)]
+    is_array = candidates.map(_is_array).astype(bool)
+    result.loc[candidates[is_array].index] = "array"
+
+    result.loc[strings.index.difference(candidates[is_array].index)] = "string"
+    return result
+
+
+def filter_row_by_data_type(col_name, data_type=None, get_type=False, native=True):
     """
-    A Pandas UDF function that returns bool if the value match with the data_type param passed to the function.
+    A function that returns bool if the value match with the data_type param passed to the function.
     Also can return the data type
     :param col_name: Column to be process
     :param data_type: The data_type to be compared with
     :param get_type: Value to be returned as string or boolean
+    :param native: Infer the data type with Spark expressions. If False use a Pandas UDF
     :return: True or False
     """
     if data_type is not None:
         data_type = parse_python_dtypes(data_type)
 
-    def pandas_udf_func(v):
-        def str_to_boolean(value):
-            """
-            Check if a str can be converted to boolean
-            :param value:
-            :return:
-            """
-            value = value.lower()
-            if value == "true" or value == "false":
-                return True
-
-        def str_to_date(value):
-            try:
-                dateutil.parser.parse(value)
-                return True
-            except ValueError:
-                pass
-
-        def str_to_array(value):
-            """
-            Check if value can be parsed to a tuple or and array.
-            Because Spark can handle tuples we will try to transform tuples to arrays
-            :param value:
-            :return:
-            """
-            try:
-                if isinstance(literal_eval((value.encode('ascii', 'ignore')).decode("utf-8")), (list, tuple)):
-                    return True
-            except (ValueError, SyntaxError,):
-                pass
-
-        def func(value):
-            """
-            Check if a value can be casted to a specific
-            :param value: value to be checked
-            :return:
-            """
-            if isinstance(value, bool):
-                _data_type = "bool"
-            # _data_type = data_type
-            elif isint(value):  # Check if value is integer
-                _data_type = "int"
-            elif isfloat(value):
-                _data_type = "float"
-            # if string we try to parse it to int, float or bool
-            elif isinstance(value, str):
-                if str_to_boolean(value):
-                    _data_type = "bool"
-                elif str_to_date(value):
-                    _data_type = "date"
-                elif str_to_array(value):
-                    _data_type = "array"
-                else:
-                    _data_type = "string"
-            else:
-                _data_type = "null"
-
-            if get_type is False:
-                if _data_type == data_type:
-                    return True
-                else:
-                    return False
-            else:
-                return _data_type
+    if native is True:
+        col_name = one_list_to_val(col_name)
+        expr = infer_data_type_expr(col_name)
+        if get_type is True:
+            return expr
+        return expr == data_type
 
-        return v.apply(func)
+    def pandas_udf_func(v):
+        data_types = infer_data_type_series(v)
+        if get_type is False:
+            return data_types == data_type
+        return data_types
 
     if get_type is True:
         return_data_type = "string"
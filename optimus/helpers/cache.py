@@ -0,0 +1,84 @@
+"""
+Cache for dataframe statistics. Stats are keyed by a fingerprint of the analyzed plan, so any transformation creates a
+new key and the cached stats of a dataframe are never returned for another one. The least recently used stats are
+evicted when the cache is full.
+If the data behind a dataframe changes (a table or a file is overwritten) the plan can stay the same, call
+stats_cache.clear() in that case.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def plan_fingerprint(df):
+    """
+    Return a fingerprint of the analyzed plan of a dataframe. It is calculated once per dataframe
+    :param df: Spark Dataframe
+    :return: str
+    """
+    # Use the instance dict. getattr() could return a column with the same name
+    fingerprint = df.__dict__.get("_plan_fingerprint")
+    if fingerprint is None:
+        plan = df._jdf.queryExecution().analyzed()
+        # The plan string can truncate long lists of fields, the semantic hash covers the whole plan
+        fingerprint = hashlib.sha1((plan.toString() + str(plan.semanticHash())).encode("utf-8")).hexdigest()
+        df.__dict__["_plan_fingerprint"] = fingerprint
+    return fingerprint
+
+
+class StatsCache:
+    """
+    LRU cache of dataframe stats. Safe to be used from multiple threads
+    """
+
+    def __init__(self, max_size=4096):
+        """
+        :param max_size: Max number of stats cached
+        """
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, df, keys):
+        """
+        Return the cached stats of a dataframe
+        :param df: Spark Dataframe
+        :param keys: list of stats keys. Any hashable value, for example (stat name, column name)
+        :return: dict with the keys found in the cache
+        """
+        fingerprint = plan_fingerprint(df)
+        result = {}
+        with self._lock:
+            for key in keys:
+                cache_key = (fingerprint, key)
+                if cache_key in self._data:
+                    self._data.move_to_end(cache_key)
+                    result[key] = self._data[cache_key]
+        return result
+
+    def set(self, df, values):
+        """
+        Cache stats of a dataframe
+        :param df: Spark Dataframe
+        :param values: dict with the stats keys and values
+        :return:
+        """
+        fingerprint = plan_fingerprint(df)
+        with self._lock:
+            for key, value in values.items():
+                cache_key = (fingerprint, key)
+                self._data[cache_key] = value
+                self._data.move_to_end(cache_key)
+
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+stats_cache = StatsCache()
@@ -1,15 +1,21 @@
+import datetime
 import logging
+import timeit
+from decimal import Decimal
 
 from kombu import Connection, Exchange, Queue, Producer
 from pymongo import MongoClient
+from pymongo.write_concern import WriteConcern
 from pyspark.sql import DataFrame
 
-from optimus.helpers.decorators import *
 
+class Save:
+    __slots__ = ["_df"]
 
-def save(self):
-    @add_attr(save)
-    def json(path, mode="overwrite", num_partitions=1):
+    def __init__(self, df):
+        self._df = df
+
+    def json(self, path, mode="overwrite", num_partitions=1):
         """
         Save data frame in a json file
         :param path: path where the dataframe will be saved.
@@ -23,7 +29,7 @@ def save(self):
         """
         try:
             # na.fill enforce null value keys to the json output
-            self.na.fill("") \
+            self._df.na.fill("") \
                 .repartition(num_partitions) \
                 .write \
                 .format("json") \
@@ -33,8 +39,7 @@ def save(self):
             logging.error(e)
             raise
 
-    @add_attr(save)
-    def csv(path, header="true", mode="overwrite", sep=",", num_partitions=1):
+    def csv(self, path, header="true", mode="overwrite", sep=",", num_partitions=1):
         """
         Save data frame to a CSV file.
         :param path: path where the dataframe will be saved.
@@ -51,13 +56,12 @@ def save(self):
         """
 
         try:
-            self.repartition(num_partitions).write.options(header=header).mode(mode).csv(path, sep=sep)
+            self._df.repartition(num_partitions).write.options(header=header).mode(mode).csv(path, sep=sep)
         except IOError as error:
             logging.error(error)
             raise
 
-    @add_attr(save)
-    def parquet(path, mode="overwrite", num_partitions=1):
+    def parquet(self, path, mode="overwrite", num_partitions=1):
         """
         Save data frame to a parquet file
         :param path: path where the dataframe will be saved.
@@ -77,7 +81,7 @@ def save(self):
                 col_name = col_name.replace(i, "_")
             return col_name
 
-        df = self.cols.rename(func)
+        df = self._df.cols.rename(func)
 
         try:
             df.coalesce(num_partitions) \
@@ -88,8 +92,7 @@ def save(self):
             logging.error(e)
             raise
 
-    @add_attr(save)
-    def avro(path, mode="overwrite", num_partitions=1):
+    def avro(self, path, mode="overwrite", num_partitions=1):
         """
         Save data frame to an avro file
         :param path: path where the dataframe will be saved.
@@ -103,7 +106,7 @@ def save(self):
         """
 
         try:
-            self.coalesce(num_partitions) \
+            self._df.coalesce(num_partitions) \
                 .write.format("com.databricks.spark.avro") \
                 .mode(mode) \
                 .save(path)
@@ -111,69 +114,181 @@ def save(self):
             logging.error(e)
             raise
 
-    @add_attr(save)
-    def rabbit_mq(host, exchange_name=None, queue_name=None, routing_key=None, parallelism=None):
+    def rabbit_mq(self, host, exchange_name=None, queue_name=None, routing_key=None, parallelism=None, batch_size=1,
+                  serializer="json", confirm=False):
         """
-        Send a dataframe to a redis queue
+        Send a dataframe to a RabbitMQ queue. The queue is declared once and every partition publishes its rows
+        through its own connection. Every row is sent as a dict encoded with the kombu serializer, not as an Arrow
+        batch, so the consumers do not need pyarrow. Dates and datetimes are sent in ISO format and decimals as strings
         # https://medium.com/python-pandemonium/talking-to-rabbitmq-with-python-and-kombu-6cbee93b1298
         # https://medium.com/python-pandemonium/building-robust-rabbitmq-consumers-with-python-and-kombu-part-1-ccd660d17271
-        :return:
+        :param host: Broker url
+        :param exchange_name:
+        :param queue_name:
+        :param routing_key:
+        :param parallelism: Number of partitions publishing at the same time
+        :param batch_size: Number of rows sent in every message. If greater than 1 the body is a list of rows
+        :param serializer: Any kombu serializer, for example 'json' or 'msgpack'
+        :param confirm: Wait for the broker to confirm every message
+        :return: list with the messages, rows, seconds and messages per second of every partition
         """
-        df = self
+        df = self._df
         if parallelism:
             df = df.coalesce(parallelism)
 
-        def _rabbit_mq(messages):
-            conn = Connection(host)
-            channel = conn.channel()
-
-            exchange = Exchange(exchange_name, type="direct")
-            queue = Queue(name=queue_name, exchange=exchange, routing_key=routing_key)
+        exchange = Exchange(exchange_name, type="direct")
+        queue = Queue(name=queue_name, exchange=exchange, routing_key=routing_key)
 
+        with Connection(host) as conn:
             queue.maybe_bind(conn)
             queue.declare()
-            producer = Producer(exchange=exchange, channel=channel, routing_key=routing_key)
 
-            for message in messages:
-                # as_dict = message.asDict(recursive=True)
-                producer.publish(message)
+        transport_options = {"confirm_publish": True} if confirm else None
+
+        def _rabbit_mq(index, rows):
+            start_time = timeit.default_timer()
+
+            with Connection(host, transport_options=transport_options) as conn:
+                producer = Producer(conn.channel(), exchange=exchange, routing_key=routing_key, serializer=serializer)
+                rows_count, messages_count = publish_batches(producer, (to_message(row.asDict(recursive=True)) for row in rows),
+                                                             batch_size)
 
-            channel.close()
-            conn.release()
-            return messages
+            _time = timeit.default_timer() - start_time
+            yield {"partition": index, "messages": messages_count, "rows": rows_count, "seconds": round(_time, 2),
+                   "messages_per_sec": round(messages_count / _time, 2) if _time > 0 else None}
 
-        self.rdd.mapPartitions(_rabbit_mq).count()
+        metrics = df.rdd.mapPartitionsWithIndex(_rabbit_mq).collect()
+        for metric in metrics:
+            logging.info("Partition {partition} published {messages} messages in {seconds} sec".format(**metric))
+        return metrics
 
-    @add_attr(save)
-    def mongo(host, port=None, db_name=None, collection_name=None, parallelism=None):
+    def mongo(self, host, port=None, db_name=None, collection_name=None, parallelism=None, batch_size=1000,
+              write_concern=None):
         """
-        Send a dataframe to a mongo collection
+        Send a dataframe to a mongo collection. Every partition inserts the rows in batches with unordered
+        insert_many() calls, using a client shared by all the partitions processed by the same python worker
         :param host:
         :param port:
         :param db_name:
         :param collection_name:
         :param parallelism:
-        :return:
+        :param batch_size: Number of documents sent in every insert_many() call
+        :param write_concern: dict with the write concern options, for example {"w": 1}
+        :return: list with the rows inserted, seconds and rows per second of every partition
         """
-        df = self
+        df = self._df
         if parallelism:
             df = df.coalesce(parallelism)
 
-        def _mongo(messages):
-            client = MongoClient(host, port)
-            db = client[db_name]
-            collection = db[collection_name]
+        def _mongo(index, rows):
+            start_time = timeit.default_timer()
+
+            collection = mongo_client(host, port)[db_name][collection_name]
+            if write_concern is not None:
+                collection = collection.with_options(write_concern=WriteConcern(**write_concern))
+
+            count = insert_batches(collection, (row.asDict(recursive=True) for row in rows), batch_size)
+
+            _time = timeit.default_timer() - start_time
+            yield {"partition": index, "rows": count, "seconds": round(_time, 2),
+                   "rows_per_sec": round(count / _time, 2) if _time > 0 else None}
+
+        metrics = df.rdd.mapPartitionsWithIndex(_mongo).collect()
+        for metric in metrics:
+            logging.info("Partition {partition} inserted {rows} rows in {seconds} sec".format(**metric))
+        return metrics
+
+
+# Clients by host and port. Python workers are reused by Spark, so the connection pool of a client is reused by the
+# partitions processed in the same worker
+_mongo_clients = {}
+
+
+def mongo_client(host, port=None):
+    """
+    Return a MongoClient shared by all the calls with the same host and port in this process
+    :param host:
+    :param port:
+    :return:
+    """
+    key = (host, port)
+    if key not in _mongo_clients:
+        _mongo_clients[key] = MongoClient(host, port)
+    return _mongo_clients[key]
+
+
+def to_message(value):
+    """
+    Transform the values of a row that the kombu serializers can not encode. Dates and datetimes are transformed to ISO
+    format and decimals to string
+    :param value: Row as a dict, or any value inside it
+    :return:
+    """
+    if isinstance(value, dict):
+        return {k: to_message(v) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [to_message(v) for v in value]
+    elif isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    elif isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def publish_batches(producer, rows, batch_size=1):
+    """
+    Publish rows with a kombu producer
+    :param producer: kombu Producer
+    :param rows: Iterable of dicts
+    :param batch_size: Number of rows sent in every message. If greater than 1 the body is a list of rows
+    :return: Number of rows and number of messages published
+    """
+    rows_count = 0
+    messages_count = 0
+
+    if batch_size == 1:
+        for row in rows:
+            producer.publish(row)
+            rows_count += 1
+        return rows_count, rows_count
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            producer.publish(batch)
+            rows_count += len(batch)
+            messages_count += 1
+            batch = []
 
-            for message in messages:
+    if len(batch) > 0:
+        producer.publish(batch)
+        rows_count += len(batch)
+        messages_count += 1
+    return rows_count, messages_count
 
-                as_dict = message.asDict(recursive=True)
-                collection.insert_one(as_dict)
-            client.close()
-            return messages
 
-        df.rdd.mapPartitions(_mongo).count()
+def insert_batches(collection, documents, batch_size=1000):
+    """
+    Insert documents in a mongo collection with unordered insert_many() calls
+    :param collection: Mongo collection
+    :param documents: Iterable of dicts
+    :param batch_size: Number of documents sent in every call
+    :return: Number of documents inserted
+    """
+    count = 0
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == batch_size:
+            collection.insert_many(batch, ordered=False)
+            count += len(batch)
+            batch = []
 
-    return save
+    if len(batch) > 0:
+        collection.insert_many(batch, ordered=False)
+        count += len(batch)
+    return count
 
 
-DataFrame.save = property(save)
+DataFrame.save = property(Save)
@@ -1,3 +1,5 @@
+import warnings
+
 from pyspark.sql import functions as F
 from optimus.helpers.functions import parse_columns
 from optimus.helpers.checkit import is_dataframe, is_int
@@ -11,7 +13,9 @@ class OutlierDetector:
     @staticmethod
     def iqr(df, columns):
         """
-        Delete outliers using inter quartile range
+        Delete outliers using inter quartile range. The quartiles of all the columns are calculated over the dataframe
+        received, before dropping any outlier. Before, the quartiles of every column were calculated after dropping
+        the outliers of the previous columns
         :param df:
         :param columns:
         :return:
@@ -22,19 +26,25 @@ class OutlierDetector:
 
         columns = parse_columns(df, columns)
 
+        # The quartiles of all the columns are calculated in one pass
+        iqr = df.cols.iqr(columns, more=True)
+        if len(columns) == 1:
+            iqr = {columns[0]: iqr}
+
+        condition = F.lit(False)
         for c in columns:
-            iqr = df.cols.iqr(c, more=True)
-            lower_bound = iqr["q1"] - (iqr["iqr"] * 1.5)
-            upper_bound = iqr["q3"] + (iqr["iqr"] * 1.5)
+            lower_bound = iqr[c]["q1"] - (iqr[c]["iqr"] * 1.5)
+            upper_bound = iqr[c]["q3"] + (iqr[c]["iqr"] * 1.5)
 
-            df = df.rows.drop((F.col(c) > upper_bound) | (F.col(c) < lower_bound))
+            condition = condition | (F.col(c) > upper_bound) | (F.col(c) < lower_bound)
 
-        return df
+        return df.rows.drop(condition)
 
     @staticmethod
     def z_score(df, columns, threshold=None):
         """
-        Delete outlier using z score
+        Delete outlier using z score. The columns are processed in order, the z score of every column is calculated
+        after dropping the outliers of the previous columns
         :param df:
         :param columns:
         :param threshold:
@@ -62,7 +72,9 @@ class OutlierDetector:
     @staticmethod
     def mad(df, columns, threshold=None):
         """
-        Delete outlier using mad
+        Delete outlier using mad. The medians and the mads of all the columns are calculated over the dataframe
+        received, before dropping any outlier. Before, the bounds of every column were calculated after dropping the
+        outliers of the previous columns
         :param df:
         :param columns:
         :param threshold:
@@ -76,26 +88,46 @@ class OutlierDetector:
             raise TypeError("Integer expected")
 
         columns = parse_columns(df, columns)
+
+        mad_value = df.cols.mad(columns, more=True)
+        if len(columns) == 1:
+            mad_value = {columns[0]: mad_value}
+
+        condition = F.lit(False)
         for c in columns:
-            mad_value = df.cols.mad(c, more=True)
-            lower_bound = mad_value["median"] - threshold * mad_value["mad"]
-            upper_bound = mad_value["median"] + threshold * mad_value["mad"]
+            lower_bound = mad_value[c]["median"] - threshold * mad_value[c]["mad"]
+            upper_bound = mad_value[c]["median"] + threshold * mad_value[c]["mad"]
 
-            df = df.rows.drop((F.col(c) > upper_bound) | (F.col(c) < lower_bound))
-        return df
+            condition = condition | (F.col(c) > upper_bound) | (F.col(c) < lower_bound)
+        return df.rows.drop(condition)
 
     @staticmethod
-    def modified_z_score(df, col_name, threshold):
+    def modified_z_score(df, columns=None, threshold=None, col_name=None):
         """
-        Delete outliers from a DataFrame using modified z score
+        Delete outliers from a DataFrame using modified z score. The medians of all the columns are calculated in one
+        pass and the mads in another one, both over the dataframe received, before dropping any outlier
         Reference: http://colingorrie.github.io/outlier-detection.html#modified-z-score-method
         :param df:
-        :param col_name:
+        :param columns:
         :param threshold:
+        :param col_name: Deprecated, use columns
         :return:
         """
-        median = df.cols.median(col_name)
-        median_absolute_deviation = df.select(F.abs(F.col(col_name) - median).alias(col_name)).cols.median(col_name)
-        df = df.withColumn('m_z_score', F.abs(0.6745 * (F.col(col_name) - median) / median_absolute_deviation))
-        df = df.rows.drop(F.col("m_z_score") > threshold)
-        return df
+        if col_name is not None:
+            warnings.warn("col_name is deprecated, use columns", DeprecationWarning)
+            columns = col_name
+
+        columns = parse_columns(df, columns)
+
+        mad_value = df.cols.mad(columns, more=True)
+        if len(columns) == 1:
+            mad_value = {columns[0]: mad_value}
+
+        condition = F.lit(False)
+        for c in columns:
+            median = mad_value[c]["median"]
+            median_absolute_deviation = mad_value[c]["mad"]
+            condition = condition | \
+                (F.abs(0.6745 * (F.col(c) - median) / median_absolute_deviation) > threshold)
+
+        return df.rows.drop(condition)
@@ -1,13 +1,24 @@
 import json
 import math
 import timeit
+from concurrent.futures import ThreadPoolExecutor
 
+from pyspark.sql import Window
 from pyspark.sql import functions as F
 from pyspark.sql.functions import when
 
+from optimus.helpers.cache import stats_cache
+from optimus.helpers.checkit import is_str
 from optimus.helpers.constants import *
 from optimus.helpers.decorators import time_it
-from optimus.helpers.functions import parse_columns
+from optimus.helpers.functions import parse_columns, random_int
+from optimus.helpers.raiseit import RaiseIt
+from optimus.profiler.sketches import KLL, MisraGries
+from optimus.profiler.summary import to_json_value
+from optimus.spark import Spark
+
+# Local properties set by SparkContext.setJobGroup()
+JOB_GROUP_PROPERTIES = ["spark.jobGroup.id", "spark.job.description", "spark.job.interruptOnCancel"]
 
 confidence_level_constant = [50, .67], [68, .99], [90, 1.64], [95, 1.96], [99, 2.57]
 
@@ -80,48 +91,433 @@ def sample_size(population_size, confidence_level, confidence_interval):
     return int(math.ceil(n))  # sample size
 
 
+def z_score(confidence_level):
+    """
+    Get the number of standard deviations for a supported confidence level
+    :param confidence_level:
+    :return:
+    """
+    for i in confidence_level_constant:
+        if i[0] == confidence_level:
+            return i[1]
+
+    RaiseIt.value_error(confidence_level, [str(i[0]) for i in confidence_level_constant])
+
+
+def sample_df(df, confidence_level, confidence_interval, stratify=None):
+    """
+    Get a sample of the dataframe sized by sample_size()
+    :param df: Dataframe to be sampled
+    :param confidence_level: Confidence level in percentage
+    :param confidence_interval: Margin of error in percentage
+    :param stratify: Column name. If set every stratum is sampled proportionally to its size and at least one row
+    of every stratum is included
+    :return: sampled dataframe, sample rows count, population rows count
+    """
+    z_score(confidence_level)
+
+    if stratify is None:
+        population = df.rows.count()
+        n = sample_size(population, confidence_level, confidence_interval) if population > 0 else 0
+        if n >= population:
+            return df, population, population
+
+        # Oversample a bit so limit() can return exactly n rows
+        fraction = min(1.0, n / population * 1.1 + 10 / population)
+        sample = df.sample(False, fraction, seed=1).limit(n).cache()
+        return sample, sample.count(), population
+
+    strata = {row[0]: row[1] for row in df.groupBy(stratify).count().collect()}
+    population = sum(strata.values())
+    n = sample_size(population, confidence_level, confidence_interval) if population > 0 else 0
+    if n >= population:
+        return df, population, population
+
+    fraction = n / population
+    limits = F.create_map(*[item for value, count in strata.items() if value is not None
+                            for item in (F.lit(value), F.lit(int(math.ceil(count * fraction))))])
+    null_limit = int(math.ceil(strata.get(None, 0) * fraction))
+
+    # Shuffle every stratum and take its share of the sample
+    window = Window.partitionBy(stratify).orderBy(F.rand(seed=1))
+    limit = F.when(F.col(stratify).isNull(), null_limit).otherwise(limits[F.col(stratify)])
+
+    sample = (df
+              .withColumn("__rank", F.row_number().over(window))
+              .where(F.col("__rank") <= limit)
+              .drop("__rank")
+              .cache())
+
+    return sample, sample.count(), population
+
+
+def proportion_bounds(p, n, population, z):
+    """
+    Confidence interval of a proportion estimated from a simple random sample, with finite population correction
+    :param p: proportion between 0 and 1
+    :param n: sample size
+    :param population: population size
+    :param z: number of standard deviations for the confidence level
+    :return: list [lower, upper] between 0 and 1
+    """
+    error = z * math.sqrt(p * (1 - p) / n) * finite_population_correction(n, population)
+    return [max(0.0, p - error), min(1.0, p + error)]
+
+
+def mean_bounds(mean, stddev, n, population, z):
+    """
+    Confidence interval of the mean estimated from a simple random sample, with finite population correction
+    :param mean:
+    :param stddev: sample standard deviation
+    :param n: sample size
+    :param population: population size
+    :param z: number of standard deviations for the confidence level
+    :return: list [lower, upper]
+    """
+    error = z * stddev / math.sqrt(n) * finite_population_correction(n, population)
+    return [mean - error, mean + error]
+
+
+def finite_population_correction(n, population):
+    if population <= 1:
+        return 0.0
+    return math.sqrt((population - n) / (population - 1))
+
+
 @time_it
 def bucketizer(df, columns, splits):
     """
-
+    Add a column '<column>_buckets' with the bucket in which every value falls. Values out of the splits are null and
+    a value on the boundary of two buckets falls in the lower one.
+    Buckets of the same width are calculated arithmetically, other splits with a when() chain
     :param df:
     :param columns:
-    :param splits:
+    :param splits: Buckets as returned by create_buckets()
     :return:
     """
     columns = parse_columns(df, columns)
 
-    def _bucketizer(col_name, args):
-        """
-        Create a column expression that create buckets in a range of values
-        :param col_name: Column to be processed
-        :return:
-        """
-        out_in_columns = args[1]
-        col_name_input = out_in_columns[col_name]
+    return df.with_columns([(col_name + "_buckets", bucket_expr(col_name, splits)) for col_name in columns])
+
+
+def is_contiguous(splits):
+    """
+    Check if every bucket starts where the previous ends
+    :param splits: Buckets as returned by create_buckets()
+    :return:
+    """
+    return all(current["lower"] == previous["upper"] for previous, current in zip(splits, splits[1:]))
+
+
+def is_uniform(splits):
+    """
+    Check if the splits are contiguous and have the same width
+    :param splits: Buckets as returned by create_buckets()
+    :return:
+    """
+    width = splits[0]["upper"] - splits[0]["lower"]
+    tolerance = 1e-9 * max(1.0, abs(width))
+
+    return is_contiguous(splits) and \
+        all(abs((s["upper"] - s["lower"]) - width) <= tolerance for s in splits)
+
+
+def bucket_expr(col_name, splits):
+    """
+    Create a column expression that return the bucket in which every value falls. If the buckets have the same width
+    the index is calculated arithmetically, so the cost does not depend on the number of buckets
+    :param col_name: Column name or column expression to be processed
+    :param splits: Buckets as returned by create_buckets()
+    :return: Column expression
+    """
+    if is_uniform(splits):
+        return bucket_index_expr(col_name, splits[0]["lower"], splits[-1]["upper"], len(splits))
+
+    if is_str(col_name):
+        col = F.col(col_name)
+    else:
+        col = col_name
+
+    expr = None
+    i = 0
+
+    for b in splits:
+        if i == 0:
+            expr = when((col >= b["lower"]) & (col <= b["upper"]), b["bucket"])
+        else:
+            expr = expr.when((col >= b["lower"]) & (col <= b["upper"]), b["bucket"])
+        i = i + 1
+
+    return expr
+
+
+def bucket_index_expr(col_name, min_value, max_value, buckets):
+    """
+    Create a column expression that return the bucket in which every value falls. The index is calculated as
+    ceil((value - min) / width) - 1, so the cost does not depend on the number of buckets. Values out of the range
+    return null. Like the when() chain of bucket_expr() a value on the boundary of two buckets falls in the lower one,
+    the min value falls in the first bucket
+    :param col_name: Column name or column expression to be processed
+    :param min_value: Min value of the first bucket
+    :param max_value: Max value of the last bucket
+    :param buckets: Number of buckets of the same width
+    :return: Column expression
+    """
+    if is_str(col_name):
+        col = F.col(col_name)
+    else:
+        col = col_name
+
+    width = (max_value - min_value) / buckets
+    if width == 0:
+        index = F.lit(0)
+    else:
+        index = F.least(F.greatest(F.ceil((col - min_value) / width).cast("int") - 1, F.lit(0)), F.lit(buckets - 1))
 
-        buckets = args[0]
+    return when((col >= min_value) & (col <= max_value), index)
 
-        expr = None
-        i = 0
 
-        # TODO: seems that this can be written with reduce
-        for b in buckets:
-            if i == 0:
-                expr = when((F.col(col_name_input) >= b["lower"]) & (F.col(col_name_input) <= b["upper"]), b["bucket"])
-            else:
-                expr = expr.when((F.col(col_name_input) >= b["lower"]) & (F.col(col_name_input) <= b["upper"]),
-                                 b["bucket"])
-            i = i + 1
+def hist_counts(df, hists):
+    """
+    Create the histograms of multiple columns in a single Spark job
+    :param df: Dataframe to be analyzed
+    :param hists: List of tuples (column name, column expression, min value, max value, number of buckets)
+    :return: dict with a list of buckets {"count", "lower", "upper"} for every column
+    """
+    if len(hists) == 0:
+        return {}
+
+    # Stack every (column, bucket) pair so all the histograms can be counted with one groupBy
+    pairs = [F.struct(F.lit(i).alias("index"),
+                      bucket_index_expr(expr, min_value, max_value, buckets).alias("bucket"))
+             for i, (_, expr, min_value, max_value, buckets) in enumerate(hists)]
+
+    rows = (df
+            .select(F.explode(F.array(*pairs)).alias("hist"))
+            .select("hist.*")
+            .where(F.col("bucket").isNotNull())
+            .groupBy("index", "bucket")
+            .count()
+            .collect())
+
+    # Buckets without values are already filled with 0
+    counts = [[0] * buckets for _, _, _, _, buckets in hists]
+    for row in rows:
+        counts[row["index"]][row["bucket"]] = row["count"]
+
+    result = {}
+    for i, (col_name, _, min_value, max_value, buckets) in enumerate(hists):
+        splits = create_buckets(min_value, max_value, buckets)
+        result[col_name] = [{"count": count, "lower": s["lower"], "upper": s["upper"]}
+                            for count, s in zip(counts[i], splits)]
+    return result
+
+
+def percentile_agg(col_name, values, relative_error):
+    """
+    Create an aggregation expression that calculate the approximate percentiles of a column. Unlike approxQuantile()
+    it can be mixed with other aggregations, so multiple columns and stats can be calculated in a single pass.
+    Nulls and NaN are ignored
+    :param col_name: Column to be processed
+    :param values: List of percentiles to be calculated
+    :param relative_error: Relative error as in approxQuantile(). 0 is exact but slow, 1 is fast but imprecise
+    :return: Column expression with an array of percentiles
+    """
+    if relative_error > 0:
+        accuracy = int(1 / relative_error)
+    else:
+        # The max accuracy accepted by percentile_approx
+        accuracy = 2147483647
+
+    # NaN values are ignored like nulls
+    return F.expr("percentile_approx(CASE WHEN isnan(CAST(`{col_name}` AS DOUBLE)) THEN NULL "
+                  "ELSE CAST(`{col_name}` AS DOUBLE) END, array({values}), {accuracy})"
+                  .format(col_name=col_name.replace("`", "``"),
+                          values=", ".join([str(float(v)) for v in values]),
+                          accuracy=accuracy))
+
+
+def quantile_sketches(df, columns, k=200):
+    """
+    Build a KLL quantile sketch for every column in a single pass. Every partition is sketched with the partition index
+    as seed and the partial sketches are merged with a tree reduce. Every level of the tree merges groups of partial
+    sketches in partition order, so the same dataframe always returns the same quantiles. Nulls and NaN are ignored.
+    The sketches are kept in the stats cache, so percentiles, medians, iqr and mad of the same columns are answered
+    without launching another Spark job. Only the columns not in the cache are processed. The sketches returned must
+    not be modified, use KLL.from_dict(sketch.to_dict()) to get a copy that can be merged with others
+    :param df: Dataframe to be processed
+    :param columns: Columns to be processed
+    :param k: Sketch size. With the default k=200 the rank error is about 1.65%
+    :return: dict with a KLL sketch for every column
+    """
+    cached = stats_cache.get(df, [("quantile_sketch", c, k) for c in columns])
+    missing = [c for c in columns if ("quantile_sketch", c, k) not in cached]
+
+    if len(missing) > 0:
+        def _sketch(index, rows):
+            sketches = [KLL(k, seed=index) for _ in missing]
+            for row in rows:
+                for sketch, value in zip(sketches, row):
+                    if value is not None and not math.isnan(value):
+                        sketch.add(value)
+            yield index, sketches
+
+        def _merge(partials):
+            # treeAggregate() merges the partial sketches in the order they arrive, that changes the coin flips of
+            # every run. Sort them by partition index before merging
+            partials = sorted(partials, key=lambda x: x[0])
+            if len(partials) == 0:
+                return [KLL(k, seed=0) for _ in missing]
+
+            sketches = partials[0][1]
+            for _, partial in partials[1:]:
+                for a, b in zip(sketches, partial):
+                    a.merge(b)
+            return sketches
+
+        partials = df.select(*[F.col("`" + c.replace("`", "``") + "`").cast("double") for c in missing]) \
+            .rdd.mapPartitionsWithIndex(_sketch)
+
+        # Like treeAggregate(depth=2), groups of about sqrt(partitions) sketches are merged in the executors
+        num_partitions = partials.getNumPartitions()
+        scale = max(int(math.ceil(math.sqrt(num_partitions))), 2)
+        while num_partitions > scale:
+            num_partitions = int(math.ceil(num_partitions / scale))
+            partials = partials \
+                .map(lambda x: (x[0] // scale, x)) \
+                .groupByKey(num_partitions) \
+                .map(lambda x: (x[0], _merge(x[1])))
+
+        sketches = _merge(partials.collect())
+
+        calculated = {("quantile_sketch", c, k): sketch for c, sketch in zip(missing, sketches)}
+        stats_cache.set(df, calculated)
+        cached.update(calculated)
+
+    return {c: cached[("quantile_sketch", c, k)] for c in columns}
+
+
+def heavy_hitters(df, columns, k=100):
+    """
+    Find the most frequent values of multiple columns in a single pass without shuffling the distinct values. Every
+    partition is summarized with a Misra-Gries sketch and the partial sketches are merged with a tree reduce.
+    The count of every value returned is underestimated by at most the 'error' of the sketch, that is lower than
+    n / (k + 1) where n is the number of rows
+    :param df: Dataframe to be processed
+    :param columns: Columns to be processed
+    :param k: Number of counters. Values with a frequency lower than n / (k + 1) can be missed
+    :return: dict with a MisraGries sketch for every column
+    """
+
+    def _zero():
+        return [MisraGries(k) for _ in columns]
+
+    def _add(sketches, row):
+        for sketch, value in zip(sketches, row):
+            sketch.add(to_json_value(value))
+        return sketches
+
+    def _merge(sketches_a, sketches_b):
+        for a, b in zip(sketches_a, sketches_b):
+            a.merge(b)
+        return sketches_a
+
+    sketches = df.select(*[F.col("`" + c.replace("`", "``") + "`") for c in columns]) \
+        .rdd.treeAggregate(_zero(), _add, _merge)
+
+    return dict(zip(columns, sketches))
+
+
+def na(col_name):
+    """
+    Count the nan and null values in a column
+    :param col_name: Column to be processed
+    :return: Column expression
+    """
+    return F.count(F.when(F.isnan(col_name) | F.col(col_name).isNull(), col_name))
+
+
+def zeros(col_name):
+    """
+    Count the zeros in a column
+    :param col_name: Column to be processed
+    :return: Column expression
+    """
+    return F.count(F.when(F.col(col_name) == 0, col_name))
+
+
+def start_job_group(description):
+    """
+    Tag all the Spark jobs launched from now from the calling thread in a job group, so they can be counted later.
+    If a job group is already set, for example by the user, it is kept and only the jobs launched from now are counted
+    :param description: Job group description shown in the Spark UI
+    :return: Job group to be passed to stop_job_group()
+    """
+    sc = Spark.instance.sc
+    previous = {prop: sc.getLocalProperty(prop) for prop in JOB_GROUP_PROPERTIES}
+
+    group_id = previous["spark.jobGroup.id"]
+    if group_id is None:
+        group_id = "optimus_" + random_int()
+        sc.setJobGroup(group_id, description)
+
+    return group_id, set(sc.statusTracker().getJobIdsForGroup(group_id)), previous
+
+
+def stop_job_group(job_group):
+    """
+    Restore the job group set before start_job_group() and return how many jobs were launched since it was called
+    :param job_group: Job group returned by start_job_group()
+    :return: Number of jobs
+    """
+    group_id, job_ids, previous = job_group
+
+    sc = Spark.instance.sc
+    for prop, value in previous.items():
+        sc.setLocalProperty(prop, value)
+    return len(set(sc.statusTracker().getJobIdsForGroup(group_id)) - job_ids)
+
+
+def parallel_columns(func, columns, max_workers=None):
+    """
+    Split the columns in chunks and process every chunk from a bounded thread pool, so the Spark jobs of different
+    columns can run at the same time. Every thread submits its jobs to its own Spark scheduler pool, so they share
+    the cluster when spark.scheduler.mode is FAIR.
+    The threads do not set any job group, their jobs are expected to be counted in the job group of the calling
+    thread. Python threads are only pinned to JVM threads with PYSPARK_PIN_THREAD (Spark 3), before that the local
+    properties of a thread can land on another JVM thread, so the scheduler pools and the jobs counted are only
+    accurate with pinned threads
+    :param func: Function that receives a list of columns and returns a dict keyed by column name
+    :param columns: Columns to be processed
+    :param max_workers: Max number of threads. If None or 1 the columns are processed in the calling thread
+    :return: dict keyed by column name in the same order as columns
+    """
+    if max_workers is None or max_workers <= 1 or len(columns) <= 1:
+        return func(columns)
+
+    workers = min(max_workers, len(columns))
+    chunk_size = int(math.ceil(len(columns) / workers))
+    chunks = [columns[i:i + chunk_size] for i in range(0, len(columns), chunk_size)]
 
-        return expr
+    def _func(chunk_index, chunk):
+        sc = Spark.instance.sc
+        pool = sc.getLocalProperty("spark.scheduler.pool")
+        sc.setLocalProperty("spark.scheduler.pool", "optimus_" + str(chunk_index))
+        try:
+            return func(chunk)
+        finally:
+            sc.setLocalProperty("spark.scheduler.pool", pool)
 
-    output_columns = [c + "_buckets" for c in columns]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_func, i, chunk) for i, chunk in enumerate(chunks)]
+        results = [f.result() for f in futures]
 
-    # TODO: This seems weird but I can not find another way. Send the actual column name to the func not seems right
-    df = df.cols.apply_expr(output_columns, _bucketizer, [splits, dict(zip(output_columns, columns))])
+    # Keep the result deterministic no matter which thread finished first
+    merged = {}
+    for result in results:
+        merged.update(result)
 
-    return df
+    return {c: merged[c] for c in columns}
 
 
 def create_buckets(low_val, high_val, bins):
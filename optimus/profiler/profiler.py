@@ -1,4 +1,5 @@
 import configparser
+import json
 import logging
 import os
 from collections import defaultdict
@@ -7,13 +8,19 @@ import dateutil
 import jinja2
 import pyspark.sql.functions as F
 from IPython.core.display import display, HTML
+from pyspark.sql import Window
 from pyspark.sql.types import ArrayType, LongType
 
 from optimus.functions import filter_row_by_data_type as fbdt, plot_hist, plot_freq
+from optimus.helpers.cache import stats_cache
+from optimus.helpers.constants import PROFILER_TYPES
 from optimus.helpers.decorators import time_it
 from optimus.helpers.functions import parse_columns
 from optimus.profiler.functions import fill_missing_var_types, fill_missing_col_types, \
-    write_json
+    write_json, hist_counts, percentile_agg, na, zeros, start_job_group, stop_job_group, \
+    parallel_columns, sample_df, z_score, proportion_bounds, mean_bounds, quantile_sketches, \
+    heavy_hitters
+from optimus.profiler.summary import ColumnSummary
 
 import humanize
 
@@ -48,7 +55,7 @@ class Profiler:
         columns = parse_columns(df, df.columns)
 
         cols_count = len(df.columns)
-        rows_count = df.count()
+        rows_count = df.rows.count()
         missing_count = round(sum(df.cols.count_na(columns).values()), 2)
 
         return (
@@ -58,51 +65,26 @@ class Profiler:
              'size': humanize.naturalsize(df.size())}
         )
 
-    # TODO: This should check only the StringType Columns. The datatype from others columns can be taken from schema().
     @staticmethod
     @time_it
-    def count_data_types(df, columns, infer=False):
+    def count_data_types(df, columns, infer=False, max_workers=None):
         """
-        Count the number of int, float, string, date and booleans and output the count in json format
+        Count the number of int, float, string, date and booleans and output the count in json format.
+        The count for all the columns is calculated in a single Spark job, or one per thread if max_workers is set
         :param df: Dataframe to be processed
         :param columns: Columns to be processed
+        :param infer: Try to infer the data type inside the string columns
+        :param max_workers: Number of threads used to submit the Spark jobs. None process all in the calling thread
         :return: json
         """
 
-        @time_it
-        def _count_data_types(col_name):
+        def _count_data_types(count_by_data_type, count_empty_strings):
             """
             Function for determine if register value is float or int or string.
-            :param col_name:
+            :param count_by_data_type: Count of values by data type
+            :param count_empty_strings: Count of empty strings
             :return:
             """
-            logging.info("Processing column '" + col_name + "'...")
-            # If String, process the data to try to infer which data type is inside. This a kind of optimization.
-            # We do not need to analyze the data if the column data type is integer or boolean.etc
-
-            temp = col_name + "_type"
-            col_data_type = df.cols.dtype(col_name)
-
-            count_by_data_type = {}
-            count_empty_strings = 0
-
-            if infer is True and col_data_type == "string":
-
-                types = (df
-                         .h_repartition(col_name=col_name)
-                         .withColumn(temp, fbdt(col_name, get_type=True))
-                         .groupBy(temp).count()
-                         .to_json())
-
-                for row in types:
-                    count_by_data_type[row[temp]] = row["count"]
-
-                count_empty_strings = df.where(F.col(col_name) == '').count()
-
-            else:
-                nulls = df.cols.count_na(col_name)
-                count_by_data_type[col_data_type] = int(df.count()) - nulls
-                count_by_data_type["null"] = nulls
 
             count_by_data_type = fill_missing_var_types(count_by_data_type)
 
@@ -122,15 +104,15 @@ class Profiler:
             # Get the greatest count by column data type
             greatest_data_type_count = max(data_types_count, key=data_types_count.get)
 
-            if greatest_data_type_count is "string":
+            if greatest_data_type_count == "string":
                 cat = "categorical"
-            elif greatest_data_type_count is "int" or greatest_data_type_count is "float":
+            elif greatest_data_type_count == "int" or greatest_data_type_count == "float":
                 cat = "numeric"
-            elif greatest_data_type_count is "date":
+            elif greatest_data_type_count == "date":
                 cat = "date"
-            elif greatest_data_type_count is "bool":
+            elif greatest_data_type_count == "bool":
                 cat = "bool"
-            elif greatest_data_type_count is "array":
+            elif greatest_data_type_count == "array":
                 cat = "array"
             else:
                 cat = "null"
@@ -143,9 +125,62 @@ class Profiler:
             return col
 
         columns = parse_columns(df, columns)
+        data_types = dict(df.dtypes)
+
+        # If String, process the data to try to infer which data type is inside. This a kind of optimization.
+        # We do not need to analyze the data if the column data type is integer or boolean.etc
+        infer_columns = [c for c in columns if infer is True and data_types[c] == "string"]
+
+        rows_counts = []
+
+        def _count_chunk(_columns):
+            """
+            Count the data types of a group of columns in a single Spark job
+            :param _columns: Columns to be processed
+            :return: dict with the data types info of every column
+            """
+            # Columns are referenced by position, so names with special chars do not break the expressions
+            exprs = []
+            for i, col_name in enumerate(_columns):
+                exprs.append(F.col(col_name).alias(str(i)))
+                if col_name in infer_columns:
+                    exprs.append(fbdt(col_name, get_type=True).alias(str(i) + "_type"))
+
+            aggs = [F.count(F.lit(1)).alias("rows_count")]
+            for i, col_name in enumerate(_columns):
+                temp = str(i)
+                if col_name in infer_columns:
+                    for data_type in PROFILER_TYPES:
+                        aggs.append(
+                            F.count(F.when(F.col(temp + "_type") == data_type, 1)).alias(temp + "_" + data_type))
+                    aggs.append(F.count(F.when(F.col(temp) == "", 1)).alias(temp + "_missing"))
+                else:
+                    aggs.append(Profiler._na(temp, data_types[col_name]).alias(temp + "_null"))
+
+            counts = df.select(*exprs).agg(*aggs).to_json()[0]
+            rows_count = counts["rows_count"]
+            rows_counts.append(rows_count)
+
+            # Info from all the columns
+            _type_details = {}
+            for i, col_name in enumerate(_columns):
+                temp = str(i)
+                count_by_data_type = {}
+                count_empty_strings = 0
+
+                if col_name in infer_columns:
+                    for data_type in PROFILER_TYPES:
+                        count_by_data_type[data_type] = counts[temp + "_" + data_type]
+                    count_empty_strings = counts[temp + "_missing"]
+                else:
+                    nulls = counts[temp + "_null"]
+                    count_by_data_type[data_types[col_name]] = rows_count - nulls
+                    count_by_data_type["null"] = nulls
 
-        # Info from all the columns
-        type_details = {c: _count_data_types(c) for c in columns}
+                _type_details[col_name] = _count_data_types(count_by_data_type, count_empty_strings)
+            return _type_details
+
+        type_details = parallel_columns(_count_chunk, columns, max_workers)
 
         results = {}
         count_types = {}
@@ -162,22 +197,49 @@ class Profiler:
 
         results["count_types"] = count_types
         results["columns"] = type_details
+        results["rows_count"] = rows_counts[0]
+
+        # The rows count is free here, save it so df.rows.count() does not need another job
+        stats_cache.set(df, {("count",): rows_counts[0]})
         return results
 
+    @staticmethod
+    def _na(col_name, data_type):
+        """
+        Count the nan and null values in a column. isnan can not handle boolean, struct or array columns
+        :param col_name: Column to be processed
+        :param data_type: Column data type as string
+        :return: Column expression
+        """
+        col = F.col(col_name)
+        if data_type in ["string", "float", "double"]:
+            expr = F.isnan(col) | col.isNull()
+        else:
+            expr = col.isNull()
+        return F.count(F.when(expr, 1))
+
     @time_it
-    def run(self, df, columns, buckets=40, infer=False, relative_error=1):
+    def run(self, df, columns, buckets=40, infer=False, relative_error=1, max_workers=None, sample=False,
+            confidence_level=95, confidence_interval=2, stratify=None):
         """
         Return dataframe statistical information in HTML Format
 
         :param df: Dataframe to be analyzed
         :param columns: Columns to be analized
         :param buckets: Number of buckets calculated to print the histogram
-        :param relative_error: Relative Error for quantile discretizer calculation
+        :param relative_error: Relative Error for quantile discretizer calculation. "sketch" calculate the quantiles
+        from the KLL sketches cached for the dataframe
+        :param max_workers: Number of threads used to profile the columns
+        :param sample: Profile a sample sized by the confidence level and interval instead of the whole dataframe
+        :param confidence_level: Confidence level in percentage used to size the sample
+        :param confidence_interval: Margin of error in percentage used to size the sample
+        :param stratify: Column used to stratify the sample
         :return:
         """
 
         columns = parse_columns(df, columns)
-        output = Profiler.to_json(df, columns, buckets, infer, relative_error)
+        output = Profiler.to_json(df, columns, buckets, infer, relative_error, max_workers, sample, confidence_level,
+                                  confidence_interval, stratify)
 
         # Load jinja
         path = os.path.dirname(os.path.abspath(__file__))
@@ -194,7 +256,7 @@ class Profiler:
 
         # Create every column stats
         for col_name in columns:
-            hist_pic = None
+            hist_pic = {}
             col = output["columns"][col_name]
 
             if "hist" in col:
@@ -227,105 +289,562 @@ class Profiler:
         write_json(output, self.path)
 
     @staticmethod
-    def to_json(df, columns, buckets=40, infer=False, relative_error=1):
+    def to_json(df, columns, buckets=40, infer=False, relative_error=1, max_workers=None, sample=False,
+                confidence_level=95, confidence_interval=2, stratify=None):
         """
         Return the profiling data in json format
         :param df: Dataframe to be processed
         :param columns: column to calculate the histogram
         :param buckets: buckets on the histogram
+        :param max_workers: Number of threads used to profile the columns
+        :param sample: Profile a sample sized by the confidence level and interval instead of the whole dataframe
+        :param confidence_level: Confidence level in percentage used to size the sample
+        :param confidence_interval: Margin of error in percentage used to size the sample
+        :param stratify: Column used to stratify the sample
         :return: json file
         """
 
+        sampling = None
+        source_df = df
+        if sample:
+            df, sampling = Profiler.sample(df, confidence_level, confidence_interval, stratify)
+
         # Get the stats for all the columns
-        output = Profiler.columns(df, columns, buckets, infer, relative_error)
+        output = Profiler.columns(df, columns, buckets, infer, relative_error, max_workers)
+
+        job_group = start_job_group("Profiling summary")
 
         # Add the data summary to the output
         output["summary"] = Profiler.dataset_info(df)
 
+        if sampling is not None:
+            Profiler.confidence_bounds(output, sampling)
+            output["summary"]["rows_count"] = sampling["population"]
+
         # Get a data sample and transform it to friendly json format
         data = []
         for l in df.sample_n(10).to_json():
             data.append([v for k, v in l.items()])
         output["sample"] = {"columns": df.columns, "data": data}
 
+        output["jobs_count"] = output["jobs_count"] + stop_job_group(job_group)
+
+        if sampling is not None:
+            output["jobs_count"] = output["jobs_count"] + sampling["jobs_count"]
+            if df is not source_df:
+                df.unpersist()
+
         return output
 
     @staticmethod
-    def columns(df, columns, buckets=40, infer=False, relative_error=1):
+    def columns(df, columns, buckets=40, infer=False, relative_error=1, max_workers=None, sample=False,
+                confidence_level=95, confidence_interval=2, stratify=None):
         """
-        Return statistical information about a specific column in json format
+        Return statistical information about a specific column in json format.
+        Instead of launching a group of Spark jobs per column all the aggregations are fused, so the number of jobs
+        does not depend on the number of columns. The jobs launched are reported in 'jobs_count'
         :param df: Dataframe to be processed
         :param columns: Columns that you want to profile
         :param buckets: Create buckets divided by range. Each bin is equal.
-        :param relative_error: relative error when the percentile is calculated. 0 is more exact as slow 1 more error and faster
+        :param infer: Try to infer the data type inside the string columns
+        :param relative_error: relative error when the percentile is calculated. 0 is more exact as slow 1 more error and faster.
+        "sketch" calculate the quantiles and the mad from the KLL sketches cached for the dataframe. The sketches are
+        built in the python workers, so it is slower than the percentile_approx aggregation unless the sketches are
+        already cached
+        :param max_workers: Split the columns in groups and profile every group from its own thread. Useful for wide
+        dataframes in clusters that are not fully used. None profile all the columns from the calling thread
+        :param sample: Profile a sample sized by the confidence level and interval instead of the whole dataframe.
+        The confidence bounds of the estimated stats are reported in 'confidence_bounds'
+        :param confidence_level: Confidence level in percentage used to size the sample
+        :param confidence_interval: Margin of error in percentage used to size the sample
+        :param stratify: Column used to stratify the sample
         :return: json object with the
         """
 
         columns = parse_columns(df, columns)
 
-        # Get just a sample to infer the column data type
-        # sample_size_number = sample_size(rows_count, 95.0, 2.0)
-        # fraction = sample_size_number / rows_count
-        # sample = df.sample(False, fraction, seed=1)
+        if sample:
+            sample_df, sampling = Profiler.sample(df, confidence_level, confidence_interval, stratify)
+            columns_info = Profiler.columns(sample_df, columns, buckets, infer, relative_error, max_workers)
+            if sample_df is not df:
+                sample_df.unpersist()
+
+            Profiler.confidence_bounds(columns_info, sampling)
+            columns_info["jobs_count"] = columns_info["jobs_count"] + sampling["jobs_count"]
+            return columns_info
+
+        job_group = start_job_group("Profiling {count} columns".format(count=len(columns)))
 
         # Initialize Objects
         columns_info = {}
         columns_info['columns'] = {}
 
-        rows_count = df.count()
-        columns_info['rows_count'] = humanize.intword(rows_count)
-        count_dtypes = Profiler.count_data_types(df, columns, infer)
+        # Rows count and data types in one pass
+        count_dtypes = Profiler.count_data_types(df, columns, infer, max_workers)
 
+        rows_count = count_dtypes["rows_count"]
+        columns_info['rows_count'] = humanize.intword(rows_count)
         columns_info["count_types"] = count_dtypes["count_types"]
         columns_info['size'] = humanize.naturalsize(df.size())
 
         # Cast columns to the data type infer by count_data_types()
-        df = Profiler.cast_columns(df, columns, count_dtypes).cache()
+        df = Profiler.cast_columns(df, columns, count_dtypes)
 
-        # Calculate stats
-        stats = Profiler.general_stats(df, columns)
+        # cast_columns() returns the same dataframe if no cast is needed. Do not uncache it if the caller cached it
+        storage_level = df.storageLevel
+        cached_here = not (storage_level.useMemory or storage_level.useDisk or storage_level.useOffHeap)
+        df = df.cache()
 
-        for col_name in columns:
-            col_info = {}
-            logging.info("------------------------------")
-            logging.info("Processing column '" + col_name + "'...")
-            columns_info['columns'][col_name] = {}
+        def _columns_info(_columns):
+            """
+            Profile a group of columns
+            :param _columns: Columns to be processed
+            :return: dict with the profile of every column
+            """
+            # General stats, quantiles and string lengths in one pass
+            stats, quantiles, lengths = Profiler.columns_stats(df, _columns, count_dtypes, relative_error)
+
+            if relative_error == "sketch":
+                # Quantiles and median absolute deviation from the quantile sketches in one pass
+                numeric = [col_name for col_name in _columns if count_dtypes["columns"][col_name]['type'] == "numeric"]
+                quantiles, mad = Profiler.columns_sketch(df, numeric)
+                medians = {col_name: q[0.5] for col_name, q in quantiles.items() if q[0.5] is not None}
+            else:
+                # Median absolute deviation in one pass. It needs the medians calculated before
+                medians = {col_name: q[0.5] for col_name, q in quantiles.items() if q[0.5] is not None}
+                mad = Profiler.columns_mad(df, medians, relative_error)
 
-            col_info["stats"] = stats[col_name]
-            col_info.update(Profiler.frequency(df, col_name, buckets))
-            col_info.update(Profiler.stats_by_column(col_name, stats, count_dtypes, rows_count))
+            # Numeric and string length histograms in one pass
+            hists = []
+            for col_name in _columns:
+                column_type = count_dtypes["columns"][col_name]['type']
+                min_value = stats[col_name]["min"]
+                max_value = stats[col_name]["max"]
 
-            col_info['column_dtype'] = count_dtypes["columns"][col_name]['dtype']
-            col_info["dtypes_stats"] = count_dtypes["columns"][col_name]['details']
+                if column_type == "numeric" and min_value is not None:
+                    hists.append((col_name, F.col(col_name), min_value, max_value, buckets))
 
-            column_type = count_dtypes["columns"][col_name]['type']
+                elif col_name in lengths and lengths[col_name]["max"]:
+                    min_value = lengths[col_name]["min"]
+                    max_value = lengths[col_name]["max"]
+
+                    # Max value can be considered as the number of buckets
+                    buckets_for_string = buckets
+                    if max_value <= 50:
+                        buckets_for_string = max_value
+
+                    hists.append((col_name, F.length(F.col(col_name)), min_value, max_value, buckets_for_string))
+
+            hist = Profiler.columns_hist(df, hists)
+
+            # Date histograms of all the date columns in two passes
+            dates_hist = Profiler.hist_dates(df, [col_name for col_name in _columns
+                                                  if count_dtypes["columns"][col_name]['type'] == "date"])
+
+            # Frequencies in one pass
+            freq = Profiler.columns_frequency(df, _columns, buckets, rows_count)
 
-            if column_type == "numeric":
-                col_info["stats"].update(Profiler.extra_numeric_stats(df, col_name, stats, relative_error))
-                col_info["hist"] = df.cols.hist(col_name, stats[col_name]["min"], stats[col_name]["max"], buckets)
+            result = {}
+            for col_name in _columns:
+                col_info = {}
+                logging.info("------------------------------")
+                logging.info("Processing column '" + col_name + "'...")
 
-            if column_type == "categorical" or column_type == "array":
-                col_info["hist"] = Profiler.hist_string(df, col_name, buckets)
+                col_info["stats"] = stats[col_name]
+                col_info['frequency'] = freq[col_name][:10]
+                col_info['frequency_graph'] = freq[col_name]
+                col_info.update(Profiler.stats_by_column(col_name, stats, count_dtypes, rows_count))
 
-            if column_type == "date":
-                col_info["hist"] = Profiler.hist_date(df, col_name)
+                col_info['column_dtype'] = count_dtypes["columns"][col_name]['dtype']
+                col_info["dtypes_stats"] = count_dtypes["columns"][col_name]['details']
 
-            columns_info['columns'][col_name] = col_info
+                column_type = count_dtypes["columns"][col_name]['type']
+
+                if column_type == "numeric" and col_name in medians:
+                    quantile = quantiles[col_name]
+                    max_value = stats[col_name]["max"]
+                    min_value = stats[col_name]["min"]
+                    stddev = stats[col_name]['stddev']
+                    mean = stats[col_name]['mean']
+
+                    col_info["stats"]['range'] = max_value - min_value
+                    col_info["stats"]['median'] = quantile[0.5]
+                    col_info["stats"]['interquartile_range'] = quantile[0.75] - quantile[0.25]
+                    col_info["stats"]['coef_variation'] = round((stddev / mean), 5) if mean else None
+                    col_info["stats"]['mad'] = round(mad[col_name], 5)
+                    col_info["stats"]['quantile'] = quantile
+
+                if col_name in hist:
+                    col_info["hist"] = hist[col_name]
+
+                if col_name in dates_hist:
+                    col_info["hist"] = dates_hist[col_name]
+
+                result[col_name] = col_info
+            return result
+
+        columns_info['columns'] = parallel_columns(_columns_info, columns, max_workers)
+
+        if cached_here:
+            df.unpersist()
+
+        columns_info["jobs_count"] = stop_job_group(job_group)
+
+        return columns_info
+
+    @staticmethod
+    @time_it
+    def sample(df, confidence_level=95, confidence_interval=2, stratify=None):
+        """
+        Get a sample of the dataframe big enough to estimate proportions with the confidence level and interval
+        requested
+        :param df: Dataframe to be sampled
+        :param confidence_level: Confidence level in percentage
+        :param confidence_interval: Margin of error in percentage
+        :param stratify: Column name. If set every stratum is sampled proportionally to its size
+        :return: cached sample and a dict with the sampling info
+        """
+        job_group = start_job_group("Profiling sample")
+        sample, rows_count, population = sample_df(df, confidence_level, confidence_interval, stratify)
+
+        sampling = {"rows_count": rows_count,
+                    "population": population,
+                    "confidence_level": confidence_level,
+                    "confidence_interval": confidence_interval,
+                    "stratify": stratify,
+                    "jobs_count": stop_job_group(job_group)}
+        return sample, sampling
+
+    @staticmethod
+    def confidence_bounds(columns_info, sampling):
+        """
+        Add the confidence bounds of the stats estimated from a sample. Bounds are reported for the mean, the
+        missing percentage and the percentage of every frequent value. Min, max and uniques are observed values
+        that can not be bounded from a sample
+        :param columns_info: output of columns()
+        :param sampling: sampling info returned by sample()
+        :return: columns_info
+        """
+        n = sampling["rows_count"]
+        population = sampling["population"]
+        z = z_score(sampling["confidence_level"])
+
+        columns_info["sampling"] = {k: v for k, v in sampling.items() if k != "jobs_count"}
+        columns_info["rows_count"] = humanize.intword(population)
+
+        if n == 0:
+            return columns_info
+
+        for col_name, col_info in columns_info["columns"].items():
+            stats = col_info["stats"]
+            bounds = {}
+
+            p_missing = proportion_bounds(stats["p_missing"] / 100, n, population, z)
+            bounds["p_missing"] = [round(b * 100, 2) for b in p_missing]
+
+            if stats.get("mean") is not None and stats.get("stddev") is not None:
+                bounds["mean"] = mean_bounds(stats["mean"], stats["stddev"], n, population, z)
+
+            for freq in col_info["frequency_graph"]:
+                percentage = proportion_bounds(freq["percentage"] / 100, n, population, z)
+                freq["percentage_bounds"] = [round(b * 100, 3) for b in percentage]
+
+            col_info["confidence_bounds"] = bounds
 
         return columns_info
 
     @staticmethod
     @time_it
-    def frequency(df, col_name, buckets):
+    def summary(df, columns, buckets=40):
+        """
+        Calculate a mergeable summary of the columns. The summary of new data can be merged with a stored one using
+        merge_summaries(), so append-only datasets can be profiled without rescanning the old partitions.
+        Every partition is summarized in one pass and the partial summaries are merged with a tree reduce, the
+        histograms are calculated in a second job once the min and max are known
+        :param df: Dataframe to be processed
+        :param columns: Columns to be summarized
+        :param buckets: Number of buckets in the numeric histograms
+        :return: json friendly dict
+        """
+        columns = parse_columns(df, columns)
+        data_types = dict(df.dtypes)
+        numeric = [data_types[c] in ["int", "bigint", "smallint", "tinyint", "float", "double"] or
+                   data_types[c].startswith("decimal") for c in columns]
+
+        def _zero():
+            return [ColumnSummary(is_numeric) for is_numeric in numeric]
+
+        def _add(summaries, row):
+            for summary, value in zip(summaries, row):
+                summary.add(value)
+            return summaries
+
+        def _merge(summaries_a, summaries_b):
+            for a, b in zip(summaries_a, summaries_b):
+                a.merge(b)
+            return summaries_a
+
+        summaries = df.select(columns).rdd.treeAggregate(_zero(), _add, _merge)
+
+        hists = []
+        for col_name, summary in zip(columns, summaries):
+            if summary.numeric and summary.min is not None:
+                hists.append((col_name, F.col(col_name), summary.min, summary.max, buckets))
+
+        hist = Profiler.columns_hist(df, hists)
+
+        rows_count = 0
+        for col_name, summary in zip(columns, summaries):
+            summary.hist = hist.get(col_name, [])
+            rows_count = summary.count + summary.nulls
+
+        return {"rows_count": rows_count,
+                "columns": {col_name: summary.to_dict() for col_name, summary in zip(columns, summaries)}}
+
+    @staticmethod
+    def merge_summaries(*summaries):
+        """
+        Merge summaries created by summary(). Columns that are not in all the summaries are merged with the ones
+        available
+        :param summaries: summaries to be merged
+        :return: json friendly dict
+        """
+        rows_count = 0
+        result = {}
+        for summary in summaries:
+            rows_count = rows_count + summary["rows_count"]
+            for col_name, data in summary["columns"].items():
+                column_summary = ColumnSummary.from_dict(data)
+                if col_name in result:
+                    result[col_name].merge(column_summary)
+                else:
+                    result[col_name] = column_summary
+
+        return {"rows_count": rows_count,
+                "columns": {col_name: summary.to_dict() for col_name, summary in result.items()}}
+
+    @staticmethod
+    def profile_from_summary(summary, buckets=40):
+        """
+        Create the columns profile from a summary. Uniques are estimated with HyperLogLog, quantiles and mad from a
+        quantile sketch and the frequencies are lower bounds of the real counts
+        :param summary: summary created by summary() or merge_summaries()
+        :param buckets: Number of items in the frequency
+        :return: json object in the same format as columns()
+        """
+        rows_count = summary["rows_count"]
+
+        columns_info = {}
+        columns_info['rows_count'] = humanize.intword(rows_count)
+        columns_info['columns'] = {col_name: ColumnSummary.from_dict(data).profile(rows_count, buckets)
+                                   for col_name, data in summary["columns"].items()}
+        return columns_info
+
+    def update_summary(self, df, columns, path=None, buckets=40):
+        """
+        Summarize a new batch of data and merge it with the summary stored in path
+        :param df: Dataframe with the new data
+        :param columns: Columns to be summarized
+        :param path: Path to the json file where the summary is stored. If the file does not exist it is created
+        :param buckets: Number of buckets in the numeric histograms
+        :return: json object with the profile of all the data summarized
+        """
+        if path is None:
+            path = os.path.splitext(self.path)[0] + "_summary.json"
+
+        summary = Profiler.summary(df, columns, buckets)
+
+        if os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                summary = Profiler.merge_summaries(json.load(f), summary)
+
+        write_json(summary, path=path)
+
+        return Profiler.profile_from_summary(summary, buckets)
+
+    @staticmethod
+    @time_it
+    def columns_stats(df, columns, count_dtypes, relative_error):
+        """
+        Calculate the general stats, the quantiles of numeric columns and the min/max string length of categorical
+        columns in a single Spark job
+        :param df: Dataframe to be analyzed
+        :param columns: Dataframe columns to be analyzed
+        :param count_dtypes: Data types as returned by count_data_types()
+        :param relative_error: Relative Error for quantile discretizer calculation. If "sketch" the quantiles are not
+        calculated
+        :return: stats, quantiles and lengths dicts
+        """
+
+        funcs = [F.min, F.max, F.stddev, F.kurtosis, F.mean, F.skewness, F.sum, F.variance, F.approx_count_distinct,
+                 na, zeros]
+        percentiles = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+        exprs = []
+        for i, col_name in enumerate(columns):
+            column_type = count_dtypes["columns"][col_name]['type']
+            for func in funcs:
+                exprs.append(func(col_name).alias(func.__name__ + "_" + str(i)))
+
+            if column_type == "numeric" and relative_error != "sketch":
+                exprs.append(percentile_agg(col_name, percentiles, relative_error).alias("percentile_" + str(i)))
+            elif column_type == "categorical" or column_type == "array":
+                exprs.append(F.min(F.length(F.col(col_name))).alias("min_length_" + str(i)))
+                exprs.append(F.max(F.length(F.col(col_name))).alias("max_length_" + str(i)))
+
+        result = df.agg(*exprs).to_json()[0]
+
+        stats = {}
+        quantiles = {}
+        lengths = {}
+        for i, col_name in enumerate(columns):
+            stats[col_name] = {func.__name__: result[func.__name__ + "_" + str(i)] for func in funcs}
+
+            key = "percentile_" + str(i)
+            if key in result:
+                values = result[key]
+                if values is None:
+                    values = [None] * len(percentiles)
+                quantiles[col_name] = dict(zip(percentiles, values))
+
+            key = "min_length_" + str(i)
+            if key in result:
+                lengths[col_name] = {"min": result[key], "max": result["max_length_" + str(i)]}
+
+        return stats, quantiles, lengths
+
+    @staticmethod
+    @time_it
+    def columns_sketch(df, columns):
+        """
+        Calculate the quantiles and the median absolute deviation of multiple columns from quantile sketches built in
+        a single Spark job. The sketches are cached in the dataframe
+        :param df: Dataframe to be analyzed
+        :param columns: Numeric columns to be analyzed
+        :return: quantiles and mad dicts
+        """
+        percentiles = [0.05, 0.25, 0.5, 0.75, 0.95]
+        sketches = quantile_sketches(df, columns)
+
+        quantiles = {}
+        mad = {}
+        for col_name, sketch in sketches.items():
+            quantiles[col_name] = dict(zip(percentiles, sketch.quantiles(percentiles)))
+            mad[col_name] = sketch.mad()[1]
+        return quantiles, mad
+
+    @staticmethod
+    @time_it
+    def columns_mad(df, medians, relative_error):
+        """
+        Calculate the median absolute deviation of multiple columns in a single Spark job
+        :param df: Dataframe to be analyzed
+        :param medians: Dict with the median of every column to be analyzed
+        :param relative_error: Relative Error for quantile discretizer calculation
+        :return: dict with the mad for every column
+        """
+        if len(medians) == 0:
+            return {}
+
+        columns = list(medians.keys())
+
+        result = (df
+                  .select(*[F.abs(F.col(c) - medians[c]).alias(str(i)) for i, c in enumerate(columns)])
+                  .agg(*[percentile_agg(str(i), [0.5], relative_error).alias(str(i)) for i in range(len(columns))])
+                  .to_json()[0])
+
+        return {c: result[str(i)][0] for i, c in enumerate(columns)}
+
+    @staticmethod
+    @time_it
+    def columns_hist(df, hists):
+        """
+        Create the histograms of multiple columns in a single Spark job
+        :param df: Dataframe to be analyzed
+        :param hists: List of tuples (column name, column expression, min value, max value, number of buckets)
+        :return: dict with the histogram for every column
+        """
+        return hist_counts(df, hists)
+
+    @staticmethod
+    @time_it
+    def columns_frequency(df, columns, buckets, rows_count):
+        """
+        Calculate the item frequency of multiple columns in a single Spark job
+        :param df: Dataframe to be analyzed
+        :param columns: Dataframe columns to be analyzed
+        :param buckets: Number of items to be returned per column
+        :param rows_count: Number of rows in the dataframe
+        :return: dict with the frequency for every column
+        """
+
+        def parse_value(value, data_type):
+            """
+            Values are stacked as string. Return them to the column data type
+            :param value:
+            :param data_type:
+            :return:
+            """
+            if value is None:
+                result = None
+            elif data_type in ["int", "bigint", "smallint", "tinyint"]:
+                result = int(value)
+            elif data_type in ["float", "double"]:
+                result = float(value)
+            elif data_type == "boolean":
+                result = value == "true"
+            else:
+                result = value
+            return result
+
+        data_types = dict(df.dtypes)
+
+        values = [F.struct(F.lit(i).alias("index"), F.col(c).cast("string").alias("value"))
+                  for i, c in enumerate(columns)]
+        window = Window.partitionBy("index").orderBy(F.desc("count"), F.desc("value"))
+
+        freq = (df
+                .select(F.explode(F.array(*values)).alias("freq"))
+                .select("freq.*")
+                .groupBy("index", "value")
+                .count()
+                .withColumn("rank", F.row_number().over(window))
+                .where(F.col("rank") <= buckets)
+                .to_json())
+
+        result = {c: [] for c in columns}
+        for row in sorted(freq, key=lambda r: (r["index"], r["rank"])):
+            col_name = columns[row["index"]]
+            result[col_name].append({"value": parse_value(row["value"], data_types[col_name]),
+                                     "count": row["count"],
+                                     "percentage": round((row["count"] / rows_count) * 100, 3)})
+        return result
+
+    @staticmethod
+    @time_it
+    def frequency(df, col_name, buckets, approx=False):
         """
         Calculate the item frequency by column
         :param df:
         :param col_name:
         :param buckets:
+        :param approx: Use a heavy hitters sketch. The rows count comes from the sketch so only one pass is needed
         :return:
         """
-        rows_count = df.count()
         col_info = {}
+
+        if approx:
+            sketch = heavy_hitters(df, [col_name], max(100, 10 * buckets))[col_name]
+            rows_count = sketch.n
+            freq = [{"value": value, "count": count, "percentage": round((count / rows_count) * 100, 3),
+                     "error": sketch.error}
+                    for value, count in sketch.top(buckets)]
+
+            col_info['frequency'] = freq[:10]
+            col_info['frequency_graph'] = freq
+            return col_info
+
+        rows_count = df.rows.count()
         # Frequency
         freq = (df
                 .h_repartition(col_name=col_name)
@@ -353,12 +872,6 @@ class Profiler:
         :return:
         """
 
-        def na(col_name):
-            return F.count(F.when(F.isnan(col_name) | F.col(col_name).isNull(), col_name))
-
-        def zeros(col_name):
-            return F.count(F.when(F.col(col_name) == 0, col_name))
-
         stats = df.cols._exprs(
             [F.min, F.max, F.stddev, F.kurtosis, F.mean, F.skewness, F.sum, F.variance, F.approx_count_distinct, na,
              zeros],
@@ -464,10 +977,26 @@ class Profiler:
         :param col_name: Dataframe column to be analyzed
         :return:
         """
-        col_info = {}
+        return Profiler.hist_dates(df, [col_name])[col_name]
 
-        # Create year/month/week day/hour/minute
+    @staticmethod
+    @time_it
+    def hist_dates(df, columns):
+        """
+        Create the years, months, weekdays, hours and minutes histograms of multiple date columns. The years range of
+        all the columns is calculated in one Spark job and all the histograms in another one
+        :param df: Dataframe to be analyzed
+        :param columns: Dataframe columns to be analyzed
+        :return: dict with the histograms of every column
+        """
+        if len(columns) == 0:
+            return {}
+
+        # Key, number of buckets and range of every part of the date. The years range is calculated from the data
+        parts = [("years", 100, None, None), ("months", 12, 0, 12), ("weekdays", 7, 0, 7), ("hours", 24, 0, 24),
+                 ("minutes", 60, 0, 60)]
 
+        # Create year/month/week day/hour/minute
         def func_infer_date(value, args):
             if value is None:
                 result = [None]
@@ -476,54 +1005,30 @@ class Profiler:
                 result = [date.year, date.month, date.weekday(), date.hour, date.minute]
             return result
 
-        df = (df
-              .cols.select(col_name)
-              .cols.apply(col_name, func_infer_date, ArrayType(LongType()))
-              .cols.unnest(col_name).h_repartition().cache()
-              )
-
-        for i in range(5):
-            key_name = ""
-            temp_col = col_name + "_" + str(i)
-            # Years
-            if i == 0:
-                buckets_date = 100
-                key_name = "years"
-
-                min_value = df.cols.min(temp_col)
-                max_value = df.cols.max(temp_col)
-
-            # Months
-            elif i == 1:
-                buckets_date = 12
-                min_value = 0
-                max_value = 12
-                key_name = "months"
-
-            # Weekdays
-            elif i == 2:
-                buckets_date = 7
-                min_value = 0
-                max_value = 7
-                key_name = "weekdays"
-
-            # Hours
-            elif i == 3:
-                buckets_date = 24
-                min_value = 0
-                max_value = 24
-                key_name = "hours"
-
-            # Minutes
-            elif i == 4:
-                buckets_date = 60
-                min_value = 0
-                max_value = 60
-                key_name = "minutes"
-
-            col_info[key_name] = df.cols.hist(temp_col, min_value, max_value, buckets_date)
+        def _part(i, j):
+            return "{i}_{j}".format(i=i, j=j)
 
-        return col_info
+        df = df.cols.select(columns).cols.apply(columns, func_infer_date, ArrayType(LongType()))
+        df = df.select(*[F.col("`" + col_name.replace("`", "``") + "`").getItem(j).alias(_part(i, j))
+                         for i, col_name in enumerate(columns) for j in range(len(parts))]).cache()
+
+        # Years range of all the columns in one pass
+        years = df.agg(*[F.struct(F.min(_part(i, 0)).alias("min"), F.max(_part(i, 0)).alias("max")).alias(str(i))
+                         for i in range(len(columns))]).first()
+
+        hists = []
+        for i in range(len(columns)):
+            for j, (_, buckets_date, min_value, max_value) in enumerate(parts):
+                if j == 0:
+                    min_value, max_value = years[str(i)]
+                if min_value is not None:
+                    hists.append((_part(i, j), F.col(_part(i, j)), min_value, max_value, buckets_date))
+
+        counts = hist_counts(df, hists)
+        df.unpersist()
+
+        return {col_name: {key: counts.get(_part(i, j), []) for j, (key, _, _, _) in enumerate(parts)}
+                for i, col_name in enumerate(columns)}
 
     @staticmethod
     @time_it
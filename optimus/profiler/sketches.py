@@ -0,0 +1,292 @@
+"""
+Mergeable sketches. Every sketch can be built per partition, merged with others of the same kind and serialized to a
+json friendly dict, so summaries calculated in different runs can be combined without rescanning the data.
+"""
+import base64
+import hashlib
+import math
+import random
+
+
+def hash_64(value):
+    """
+    Return a 64 bit hash. Python hash() is salted per process so it can not be used to merge sketches created in
+    different executors
+    :param value: Value to be hashed
+    :return: int
+    """
+    return int.from_bytes(hashlib.sha1(str(value).encode("utf-8")).digest()[:8], "big")
+
+
+class HyperLogLog:
+    """
+    Estimate the number of distinct values. The relative error is about 1.04 / sqrt(2 ** p)
+    Reference: http://algo.inria.fr/flajolet/Publications/FlFuGaMe07.pdf
+    """
+
+    def __init__(self, p=12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, value):
+        """
+        Add a value to the sketch
+        :param value:
+        :return:
+        """
+        h = hash_64(value)
+        index = h >> (64 - self.p)
+        w = h & ((1 << (64 - self.p)) - 1)
+        rho = (64 - self.p) - w.bit_length() + 1
+        if rho > self.registers[index]:
+            self.registers[index] = rho
+
+    def merge(self, other):
+        """
+        Merge another sketch into this one
+        :param other: HyperLogLog with the same precision
+        :return: self
+        """
+        if self.p != other.p:
+            raise ValueError("Can not merge HyperLogLog sketches with different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def count(self):
+        """
+        Return the estimated number of distinct values
+        :return:
+        """
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+
+        # Small range correction
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_dict(self):
+        return {"p": self.p, "registers": base64.b64encode(bytes(self.registers)).decode("ascii")}
+
+    @staticmethod
+    def from_dict(data):
+        sketch = HyperLogLog(data["p"])
+        sketch.registers = bytearray(base64.b64decode(data["registers"]))
+        return sketch
+
+
+class KLL:
+    """
+    Quantile sketch. With the default k=200 the rank error is about 1.65%
+    Reference: https://arxiv.org/abs/1603.05346
+    """
+
+    def __init__(self, k=200, c=2.0 / 3.0, seed=None):
+        """
+        :param k: Sketch size
+        :param c: Capacity ratio between a compactor and the one above it
+        :param seed: Seed of the coin flips used to compact the items. Sketches with the same seed built from the same
+        values in the same order return the same quantiles
+        """
+        self.k = k
+        self.c = c
+        self._random = random.Random(seed)
+        self.n = 0
+        self.compactors = []
+        self.max_size = 0
+        self._grow()
+
+    def _grow(self):
+        self.compactors.append([])
+        self.max_size = sum(self._capacity(h) for h in range(len(self.compactors)))
+
+    def _capacity(self, height):
+        depth = len(self.compactors) - height - 1
+        return int(math.ceil((self.c ** depth) * self.k)) + 1
+
+    def _size(self):
+        return sum(len(c) for c in self.compactors)
+
+    def _compress(self):
+        for h in range(len(self.compactors)):
+            if len(self.compactors[h]) >= self._capacity(h):
+                if h + 1 >= len(self.compactors):
+                    self._grow()
+
+                items = sorted(self.compactors[h])
+                # Keep an item back if the count is odd, so the total weight is preserved
+                kept = [items.pop()] if len(items) % 2 == 1 else []
+                offset = self._random.randint(0, 1)
+
+                self.compactors[h + 1].extend(items[offset::2])
+                self.compactors[h] = kept
+
+                if self._size() < self.max_size:
+                    break
+
+    def add(self, value):
+        """
+        Add a value to the sketch
+        :param value: numeric value
+        :return:
+        """
+        self.compactors[0].append(value)
+        self.n += 1
+        if self._size() >= self.max_size:
+            self._compress()
+
+    def merge(self, other):
+        """
+        Merge another sketch into this one
+        :param other: KLL sketch
+        :return: self
+        """
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for h, items in enumerate(other.compactors):
+            self.compactors[h].extend(items)
+        self.n += other.n
+
+        while self._size() >= self.max_size:
+            self._compress()
+        return self
+
+    def items(self):
+        """
+        Return the items in the sketch and its weights sorted by item
+        :return: list of tuples (item, weight)
+        """
+        weighted = [(item, 2 ** h) for h, items in enumerate(self.compactors) for item in items]
+        return sorted(weighted, key=lambda x: x[0])
+
+    def quantiles(self, values):
+        """
+        Return the approximate quantiles
+        :param values: list of quantiles between 0 and 1
+        :return: list of values
+        """
+        items = self.items()
+        if len(items) == 0:
+            return [None] * len(values)
+
+        total = sum(w for _, w in items)
+        result = []
+        for q in values:
+            target = q * total
+            cumulative = 0
+            value = items[-1][0]
+            for item, weight in items:
+                cumulative += weight
+                if cumulative >= target:
+                    value = item
+                    break
+            result.append(value)
+        return result
+
+    def quantile(self, value):
+        return self.quantiles([value])[0]
+
+    def mad(self):
+        """
+        Return the median and the median absolute deviation calculated from the items in the sketch, so no second
+        pass over the data is needed. The median has the rank error of the sketch. The mad is the weighted median of the
+        deviations, counting the items inside [median - mad, median + mad] takes two rank queries so its rank error is
+        at most twice the rank error of the sketch
+        :return: tuple (median, mad)
+        """
+        items = self.items()
+        if len(items) == 0:
+            return None, None
+
+        median = self.quantile(0.5)
+        deviations = sorted((abs(item - median), weight) for item, weight in items)
+        total = sum(w for _, w in deviations)
+        cumulative = 0
+        mad = deviations[-1][0]
+        for deviation, weight in deviations:
+            cumulative += weight
+            if cumulative >= total / 2:
+                mad = deviation
+                break
+        return median, mad
+
+    def to_dict(self):
+        return {"k": self.k, "c": self.c, "n": self.n, "compactors": self.compactors}
+
+    @staticmethod
+    def from_dict(data):
+        sketch = KLL(data["k"], data["c"])
+        sketch.n = data["n"]
+        sketch.compactors = [list(c) for c in data["compactors"]]
+        sketch.max_size = sum(sketch._capacity(h) for h in range(len(sketch.compactors)))
+        return sketch
+
+
+class MisraGries:
+    """
+    Heavy hitters. Keep at most k counters, every count is underestimated by at most n / (k + 1)
+    Reference: https://www.cs.utah.edu/~jeffp/papers/merge-summ.pdf
+    """
+
+    def __init__(self, k=100):
+        self.k = k
+        self.n = 0
+        self.error = 0
+        self.counters = {}
+
+    def add(self, value, count=1):
+        """
+        Add a value to the sketch
+        :param value: hashable value
+        :param count: times the value is added
+        :return:
+        """
+        self.n += count
+        self.counters[value] = self.counters.get(value, 0) + count
+
+        # Compress in batch, so the cost of the decrement is amortized
+        if len(self.counters) > 2 * self.k:
+            self._compress()
+
+    def _compress(self):
+        if len(self.counters) > self.k:
+            counts = sorted(self.counters.values(), reverse=True)
+            decrement = counts[self.k]
+            self.counters = {v: c - decrement for v, c in self.counters.items() if c > decrement}
+            self.error += decrement
+
+    def merge(self, other):
+        """
+        Merge another sketch into this one
+        :param other: MisraGries sketch
+        :return: self
+        """
+        for value, count in other.counters.items():
+            self.counters[value] = self.counters.get(value, 0) + count
+        self.n += other.n
+        self.error += other.error
+        self._compress()
+        return self
+
+    def top(self, n=10):
+        """
+        Return the most frequent values
+        :param n: number of values to be returned
+        :return: list of tuples (value, count)
+        """
+        self._compress()
+        return sorted(self.counters.items(), key=lambda x: (-x[1], str(x[0])))[:n]
+
+    def to_dict(self):
+        return {"k": self.k, "n": self.n, "error": self.error, "counters": [[v, c] for v, c in self.counters.items()]}
+
+    @staticmethod
+    def from_dict(data):
+        sketch = MisraGries(data["k"])
+        sketch.n = data["n"]
+        sketch.error = data["error"]
+        sketch.counters = {v: c for v, c in data["counters"]}
+        return sketch
@@ -0,0 +1,295 @@
+"""
+Mergeable column summaries. A summary holds everything needed to rebuild a column profile, so the summary of a new
+partition can be merged into a stored one without rescanning the old data.
+"""
+import math
+
+from optimus.profiler.sketches import HyperLogLog, KLL, MisraGries
+
+
+class Moments:
+    """
+    Count, mean and central moments up to the 4th. Updates and merges use the formulas from
+    Reference: https://www.osti.gov/servlets/purl/1028931
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+        self.m4 = 0.0
+
+    def add(self, value):
+        n1 = self.n
+        self.n += 1
+        n = self.n
+
+        delta = value - self.mean
+        delta_n = delta / n
+        delta_n2 = delta_n * delta_n
+        term1 = delta * delta_n * n1
+
+        self.mean += delta_n
+        self.m4 += term1 * delta_n2 * (n * n - 3 * n + 3) + 6 * delta_n2 * self.m2 - 4 * delta_n * self.m3
+        self.m3 += term1 * delta_n * (n - 2) - 3 * delta_n * self.m2
+        self.m2 += term1
+
+    def merge(self, other):
+        na, nb = self.n, other.n
+        if nb == 0:
+            return self
+        if na == 0:
+            self.n, self.mean, self.m2, self.m3, self.m4 = other.n, other.mean, other.m2, other.m3, other.m4
+            return self
+
+        n = na + nb
+        delta = other.mean - self.mean
+        delta2 = delta * delta
+
+        mean = (na * self.mean + nb * other.mean) / n
+        m2 = self.m2 + other.m2 + delta2 * na * nb / n
+        m3 = (self.m3 + other.m3 + delta2 * delta * na * nb * (na - nb) / (n * n) +
+              3 * delta * (na * other.m2 - nb * self.m2) / n)
+        m4 = (self.m4 + other.m4 + delta2 * delta2 * na * nb * (na * na - na * nb + nb * nb) / (n * n * n) +
+              6 * delta2 * (na * na * other.m2 + nb * nb * self.m2) / (n * n) +
+              4 * delta * (na * other.m3 - nb * self.m3) / n)
+
+        self.n, self.mean, self.m2, self.m3, self.m4 = n, mean, m2, m3, m4
+        return self
+
+    def stats(self):
+        """
+        Return the stats with the same definition used by Spark sql functions
+        :return:
+        """
+        n = self.n
+        result = {"mean": None, "variance": None, "stddev": None, "skewness": None, "kurtosis": None}
+        if n > 0:
+            result["mean"] = self.mean
+        if n > 1:
+            result["variance"] = self.m2 / (n - 1)
+            result["stddev"] = math.sqrt(result["variance"])
+        if self.m2 > 0:
+            result["skewness"] = math.sqrt(n) * self.m3 / (self.m2 ** 1.5)
+            result["kurtosis"] = n * self.m4 / (self.m2 * self.m2) - 3
+        return result
+
+    def to_dict(self):
+        return {"n": self.n, "mean": self.mean, "m2": self.m2, "m3": self.m3, "m4": self.m4}
+
+    @staticmethod
+    def from_dict(data):
+        moments = Moments()
+        moments.n, moments.mean, moments.m2, moments.m3, moments.m4 = \
+            data["n"], data["mean"], data["m2"], data["m3"], data["m4"]
+        return moments
+
+
+def to_json_value(value):
+    """
+    Values that can not be represented in json are transformed to string
+    :param value:
+    :return:
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def merge_hist(hist_a, hist_b):
+    """
+    Merge two histograms. If the bins are not the same both are rebinned to the union range with the same number of
+    bins, assuming the values are uniformly distributed inside every bin
+    :param hist_a: list of bins {"lower", "upper", "count"}
+    :param hist_b: list of bins {"lower", "upper", "count"}
+    :return: list of bins
+    """
+    if not hist_a:
+        return hist_b
+    if not hist_b:
+        return hist_a
+
+    if [(b["lower"], b["upper"]) for b in hist_a] == [(b["lower"], b["upper"]) for b in hist_b]:
+        return [{"lower": a["lower"], "upper": a["upper"], "count": a["count"] + b["count"]}
+                for a, b in zip(hist_a, hist_b)]
+
+    buckets = max(len(hist_a), len(hist_b))
+    low = min(hist_a[0]["lower"], hist_b[0]["lower"])
+    high = max(hist_a[-1]["upper"], hist_b[-1]["upper"])
+    width = (high - low) / buckets
+
+    counts = [0.0] * buckets
+    for b in hist_a + hist_b:
+        bin_width = b["upper"] - b["lower"]
+        for i in range(buckets):
+            lower = low + i * width
+            upper = lower + width
+            if bin_width == 0:
+                # All the values in the bin are the same
+                if lower <= b["lower"] <= upper:
+                    counts[i] += b["count"]
+                    break
+            else:
+                overlap = min(upper, b["upper"]) - max(lower, b["lower"])
+                if overlap > 0:
+                    counts[i] += b["count"] * overlap / bin_width
+
+    return [{"lower": low + i * width, "upper": low + (i + 1) * width, "count": int(round(c))}
+            for i, c in enumerate(counts)]
+
+
+class ColumnSummary:
+    """
+    Mergeable summary of a column: counts, null counts, moments, HyperLogLog registers, a quantile sketch, heavy
+    hitters and histogram bins
+    """
+
+    def __init__(self, numeric=False, k=200, p=12, top=100):
+        """
+        :param numeric: If True calculate moments, quantiles and histogram
+        :param k: Quantile sketch size
+        :param p: HyperLogLog precision
+        :param top: Number of heavy hitters counters
+        """
+        self.numeric = numeric
+        self.count = 0
+        self.nulls = 0
+        self.missing = 0
+        self.zeros = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self.moments = Moments()
+        self.distinct = HyperLogLog(p)
+        self.quantiles = KLL(k) if numeric else None
+        self.frequent = MisraGries(top)
+        self.hist = []
+
+    def add(self, value):
+        """
+        Add a value to the summary
+        :param value:
+        :return:
+        """
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            self.nulls += 1
+            return
+
+        self.count += 1
+        if value == "":
+            self.missing += 1
+
+        if self.numeric:
+            value = float(value)
+            if value == 0:
+                self.zeros += 1
+            self.sum += value
+            self.moments.add(value)
+            self.quantiles.add(value)
+
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+        value = to_json_value(value)
+        self.distinct.add(value)
+        self.frequent.add(value)
+
+    def merge(self, other):
+        """
+        Merge another summary of the same column into this one
+        :param other: ColumnSummary
+        :return: self
+        """
+        self.count += other.count
+        self.nulls += other.nulls
+        self.missing += other.missing
+        self.zeros += other.zeros
+        self.sum += other.sum
+
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+        self.moments.merge(other.moments)
+        self.distinct.merge(other.distinct)
+        if self.numeric:
+            self.quantiles.merge(other.quantiles)
+        self.frequent.merge(other.frequent)
+        self.hist = merge_hist(self.hist, other.hist)
+        return self
+
+    def profile(self, rows_count, buckets=40):
+        """
+        Return the column profile in the same format as Profiler.columns()
+        :param rows_count: Number of rows in the dataframe
+        :param buckets: Number of items in the frequency
+        :return: dict
+        """
+        uniques = self.distinct.count()
+        stats = {"min": self.min, "max": self.max, "sum": self.sum if self.numeric else None,
+                 "zeros": self.zeros, "na": self.nulls,
+                 "missing_count": self.nulls,
+                 "p_missing": round(self.nulls / rows_count * 100, 2) if rows_count else 0,
+                 "uniques_count": uniques,
+                 "p_uniques": round(uniques / rows_count * 100, 3) if rows_count else 0}
+
+        col_info = {}
+        if self.numeric:
+            stats.update(self.moments.stats())
+            if self.count > 0:
+                percentiles = [0.05, 0.25, 0.5, 0.75, 0.95]
+                quantile = dict(zip(percentiles, self.quantiles.quantiles(percentiles)))
+                median, mad = self.quantiles.mad()
+
+                stats["range"] = self.max - self.min
+                stats["median"] = median
+                stats["interquartile_range"] = quantile[0.75] - quantile[0.25]
+                stats["coef_variation"] = round(stats["stddev"] / stats["mean"], 5) \
+                    if stats["stddev"] is not None and stats["mean"] else None
+                stats["mad"] = round(mad, 5)
+                stats["quantile"] = quantile
+            col_info["hist"] = self.hist
+            column_type = "numeric"
+        else:
+            column_type = "categorical"
+
+        freq = [{"value": v, "count": c, "percentage": round((c / rows_count) * 100, 3) if rows_count else 0}
+                for v, c in self.frequent.top(buckets)]
+
+        col_info["stats"] = stats
+        col_info["frequency"] = freq[:10]
+        col_info["frequency_graph"] = freq
+        col_info["column_type"] = column_type
+        col_info["dtypes_stats"] = {"null": self.nulls, "missing": self.missing}
+        return col_info
+
+    def to_dict(self):
+        return {"numeric": self.numeric, "count": self.count, "nulls": self.nulls, "missing": self.missing,
+                "zeros": self.zeros, "sum": self.sum, "min": to_json_value(self.min), "max": to_json_value(self.max),
+                "moments": self.moments.to_dict(),
+                "distinct": self.distinct.to_dict(),
+                "quantiles": self.quantiles.to_dict() if self.numeric else None,
+                "frequent": self.frequent.to_dict(),
+                "hist": self.hist}
+
+    @staticmethod
+    def from_dict(data):
+        summary = ColumnSummary(data["numeric"])
+        summary.count = data["count"]
+        summary.nulls = data["nulls"]
+        summary.missing = data["missing"]
+        summary.zeros = data["zeros"]
+        summary.sum = data["sum"]
+        summary.min = data["min"]
+        summary.max = data["max"]
+        summary.moments = Moments.from_dict(data["moments"])
+        summary.distinct = HyperLogLog.from_dict(data["distinct"])
+        if data["quantiles"] is not None:
+            summary.quantiles = KLL.from_dict(data["quantiles"])
+        summary.frequent = MisraGries.from_dict(data["frequent"])
+        summary.hist = data["hist"]
+        return summary
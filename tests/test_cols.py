@@ -1,11 +1,14 @@
 import logging
 
+from mock import patch
 from pyspark.ml.linalg import Vectors, VectorUDT, DenseVector
 from pyspark.sql import Row
 from pyspark.sql import functions as F
 from pyspark.sql.types import *
 
 from optimus import Optimus
+from optimus.helpers.cache import StatsCache, stats_cache
+from optimus.profiler.sketches import KLL
 
 op = Optimus()
 # op.sc.setLogLevel("INFO")
@@ -342,6 +345,73 @@ class TestDataFrameCols(object):
 
         assert (actual_df.collect() == expected_df.collect())
 
+    @staticmethod
+    def test_rename_sequential():
+        source_df = op.create.df(
+            rows=[("happy", 1)],
+            cols=[
+                ("emotion", StringType(), True),
+                ("num", IntegerType(), True)
+            ]
+        )
+
+        # The renames are applied in order like chained withColumnRenamed() calls
+        assert source_df.cols.rename([("emotion", "num"), ("num", "number")]).columns == ["number", "number"]
+        assert source_df.cols.rename([("num", "number"), ("emotion", "num")]).columns == ["num", "number"]
+
+    @staticmethod
+    def test_rename_duplicated_columns():
+        source_df = op.create.df(
+            rows=[("happy", 1)],
+            cols=[
+                ("emotion", StringType(), True),
+                ("num", IntegerType(), True)
+            ]
+        )
+        df = source_df.select("emotion", "num", "num")
+
+        actual_df = df.cols.rename("emotion", "emotions")
+
+        assert actual_df.columns == ["emotions", "num", "num"]
+        assert actual_df.collect()[0][0] == "happy"
+
+    @staticmethod
+    def test_with_columns():
+        source_df = op.create.df(
+            rows=[(1, 2)],
+            cols=[
+                ("a", IntegerType(), True),
+                ("b", IntegerType(), True)
+            ]
+        )
+
+        # The expressions are evaluated over the original columns
+        actual_df = source_df.with_columns([("a", F.col("b") + 1), ("c", F.col("a") * 10)])
+        assert actual_df.columns == ["a", "b", "c"]
+        assert actual_df.collect()[0].asDict() == {"a": 3, "b": 2, "c": 10}
+
+        try:
+            source_df.with_columns([("a", F.lit(1)), ("a", F.lit(2))])
+            assert False
+        except ValueError:
+            pass
+
+    @staticmethod
+    def test_with_columns_duplicated_columns():
+        source_df = op.create.df(
+            rows=[(1, 2)],
+            cols=[
+                ("a", IntegerType(), True),
+                ("b", IntegerType(), True)
+            ]
+        )
+        df = source_df.select("a", "b", "b")
+
+        actual_df = df.with_columns([("c", F.lit(1))])
+
+        assert actual_df.columns == ["a", "b", "b", "c"]
+        assert actual_df.collect()[0][3] == 1
+
     @staticmethod
     def test_cast_simple():
         source_df = op.create.df(
@@ -739,3 +809,323 @@ class TestDataFrameCols(object):
         )
 
         assert (actual_df.collect() == expected_df.collect())
+
+    @staticmethod
+    def test_remove_accents():
+        source_df = op.create.df(
+            rows=[
+                ("camión", 1),
+                ("pingüino", 2)
+            ],
+            cols=[
+                ("name", StringType(), True),
+                ("num", IntegerType(), True)
+            ]
+        )
+
+        actual_df = source_df.cols.remove_accents("name")
+
+        expected_df = op.create.df(
+            rows=[
+                ("camion", 1),
+                ("pinguino", 2)
+            ],
+            cols=[
+                ("name", StringType(), True),
+                ("num", IntegerType(), True)
+            ]
+        )
+
+        assert (actual_df.collect() == expected_df.collect())
+
+    @staticmethod
+    def test_apply_vectorized():
+        source_df = op.create.df(
+            rows=[
+                ("happy", 1),
+                ("excited", 2)
+            ],
+            cols=[
+                ("emotion", StringType(), True),
+                ("num", IntegerType(), True)
+            ]
+        )
+
+        def func(series, args):
+            return series * args
+
+        actual_df = source_df.cols.apply("num", func, "int", 10, func_type="vectorized")
+
+        expected_df = op.create.df(
+            rows=[
+                ("happy", 10),
+                ("excited", 20)
+            ],
+            cols=[
+                ("emotion", StringType(), True),
+                ("num", IntegerType(), True)
+            ]
+        )
+
+        assert (actual_df.collect() == expected_df.collect())
+
+    @staticmethod
+    def test_apply_vectorized_without_arrow():
+        source_df = op.create.df(
+            rows=[
+                ("happy", 1),
+                ("excited", 2)
+            ],
+            cols=[
+                ("emotion", StringType(), True),
+                ("num", IntegerType(), True)
+            ]
+        )
+
+        def func(series, args):
+            return series * args
+
+        def is_even(series, args):
+            return series % 2 == 0
+
+        # Without Arrow the vectorized function is applied with a udf, numpy results must be converted
+        with patch("optimus.functions.is_pyarrow_installed", return_value=False):
+            actual_df = source_df.cols.apply("num", func, "int", 10, func_type="vectorized")
+            actual_bool_df = source_df.cols.apply("num", is_even, "boolean", func_type="vectorized")
+
+            assert [row["num"] for row in actual_df.collect()] == [10, 20]
+            assert [row["num"] for row in actual_bool_df.collect()] == [False, True]
+
+    @staticmethod
+    def test_abs():
+        source_df = op.create.df(
+            rows=[
+                (-1, "a", -2.5),
+                (2, "b", 3.0)
+            ],
+            cols=[
+                ("num", IntegerType(), True),
+                ("name", StringType(), True),
+                ("value", DoubleType(), True)
+            ]
+        )
+
+        actual_df = source_df.cols.abs(["num", "value"])
+
+        expected_df = op.create.df(
+            rows=[
+                (1, "a", 2.5),
+                (2, "b", 3.0)
+            ],
+            cols=[
+                ("num", IntegerType(), True),
+                ("name", StringType(), True),
+                ("value", DoubleType(), True)
+            ]
+        )
+
+        assert (actual_df.collect() == expected_df.collect())
+
+    @staticmethod
+    def test_lazy():
+        source_df = op.create.df(
+            rows=[
+                ("  BOB ", -1),
+                (" JoSe", 2)
+            ],
+            cols=[
+                ("name", StringType(), True),
+                ("num", IntegerType(), True)
+            ]
+        )
+
+        lazy = source_df.cols.lazy().trim("name").trim("name").lower("*").abs("num").cast("num", "int")
+
+        # The second trim, the lower on a numeric column and the cast to the same type are dropped
+        assert lazy.plan() == {"name": [("trim", ()), ("lower", ())], "num": [("abs", ())]}
+
+        actual_df = source_df.cols.lazy().trim("name").lower("name").abs("num").collect_plan()
+
+        expected_df = source_df.cols.trim("name").cols.lower("name").cols.abs("num")
+
+        assert (actual_df.collect() == expected_df.collect())
+
+    @staticmethod
+    def test_accessor_bound_to_dataframe():
+        df_a = op.create.df(rows=[("a", 1)], cols=[("name", StringType(), True), ("num", IntegerType(), True)])
+        df_b = op.create.df(rows=[("b",)], cols=[("name", StringType(), True)])
+
+        cols_a = df_a.cols
+        cols_b = df_b.cols
+
+        # Accessing the cols of another dataframe must not change the dataframe an accessor is bound to
+        assert cols_a.count() == 2
+        assert cols_b.count() == 1
+
+    @staticmethod
+    def test_hist_multiple_columns():
+        source_df = op.create.df(
+            rows=[
+                (1, 10.0),
+                (2, 10.0),
+                (2, 20.0),
+                (3, None)
+            ],
+            cols=[
+                ("num", IntegerType(), True),
+                ("value", DoubleType(), True)
+            ]
+        )
+
+        actual = source_df.cols.hist(["num", "value"], 2)
+
+        assert actual == {"num": [{"count": 3, "lower": 1.0, "upper": 2.0}, {"count": 1, "lower": 2.0, "upper": 3.0}],
+                          "value": [{"count": 2, "lower": 10.0, "upper": 15.0},
+                                    {"count": 1, "lower": 15.0, "upper": 20.0}]}
+        assert source_df.cols.hist("num", 2) == actual["num"]
+
+    @staticmethod
+    def test_hist_null_column():
+        source_df = op.create.df(
+            rows=[
+                (1, None),
+                (2, None)
+            ],
+            cols=[
+                ("num", IntegerType(), True),
+                ("empty", DoubleType(), True)
+            ]
+        )
+
+        # Every column keeps an entry, so the shape does not depend on the data
+        assert source_df.cols.hist(["num", "empty"], 2) == {
+            "num": [{"count": 1, "lower": 1.0, "upper": 1.5}, {"count": 1, "lower": 1.5, "upper": 2.0}],
+            "empty": []}
+        assert source_df.cols.hist(["empty"], 2) == []
+
+    @staticmethod
+    def test_percentile_multiple_columns():
+        source_df = op.create.df(
+            rows=[
+                (1, 10.0),
+                (2, 20.0),
+                (3, None),
+                (4, float("nan")),
+                (5, 30.0)
+            ],
+            cols=[
+                ("num", IntegerType(), True),
+                ("value", DoubleType(), True)
+            ]
+        )
+
+        actual = source_df.cols.percentile(["num", "value"], [0.5])
+
+        # Nulls and NaN are ignored per column
+        # format_dict collapses the dict of a single percentile to its value
+        assert actual == {"num": 3.0, "value": 20.0}
+        assert source_df.cols.median("num") == 3.0
+        assert source_df.cols.iqr(["num", "value"]) == {"num": 2.0, "value": 20.0}
+
+    @staticmethod
+    def test_percentile_error():
+        source_df = op.create.df(
+            rows=[
+                (1, 10.0),
+                (2, 20.0),
+                (3, None),
+                (4, float("nan")),
+                (5, 30.0)
+            ],
+            cols=[
+                ("num", IntegerType(), True),
+                ("value", DoubleType(), True)
+            ]
+        )
+
+        # All the columns are calculated with a single percentile_approx aggregation
+        actual = source_df.cols.percentile(["num", "value"], [0.25, 0.5, 0.75], error=0.01)
+
+        assert actual == {"num": {0.25: 2.0, 0.5: 3.0, 0.75: 4.0},
+                          "value": {0.25: 10.0, 0.5: 20.0, 0.75: 30.0}}
+
+    @staticmethod
+    def test_mad_multiple_columns():
+        source_df = op.create.df(
+            rows=[
+                (1, 10.0),
+                (2, 20.0),
+                (3, None),
+                (4, float("nan")),
+                (5, 40.0)
+            ],
+            cols=[
+                ("num", IntegerType(), True),
+                ("value", DoubleType(), True)
+            ]
+        )
+
+        actual = source_df.cols.mad(["num", "value"], more=True)
+
+        assert actual == {"num": {"mad": 1.0, "median": 3.0}, "value": {"mad": 10.0, "median": 20.0}}
+        assert source_df.cols.mad("num") == 1.0
+
+    @staticmethod
+    def test_quantile_sketch_cached():
+        source_df = op.create.df(
+            rows=[(1,), (2,), (3,), (None,), (5,)],
+            cols=[("num", IntegerType(), True)]
+        )
+
+        sketch = source_df.cols.quantile_sketch("num")
+
+        # The second call and the percentiles are answered from the cached sketch
+        assert source_df.cols.quantile_sketch("num") is sketch
+        assert source_df.cols.percentile("num", [0.5], error="sketch") == sketch.quantile(0.5) == 2.0
+        assert source_df.cols.mad("num", more=True, error="sketch") == dict(zip(["median", "mad"], sketch.mad()))
+        assert KLL.from_dict(sketch.to_dict()).quantile(0.5) == 2.0
+
+    @staticmethod
+    def test_quantile_sketch_seed():
+        def _sketch():
+            sketch = KLL(k=20, seed=1)
+            for value in range(10000):
+                sketch.add(value)
+            return sketch
+
+        # Enough values to compact, the coin flips are the same for the same seed
+        assert _sketch().quantiles([0.1, 0.5, 0.9]) == _sketch().quantiles([0.1, 0.5, 0.9])
+
+    @staticmethod
+    def test_frequency_approx():
+        source_df = op.create.df(
+            rows=[("a", 1), ("b", 1), ("a", 2), ("a", 1)],
+            cols=[("name", StringType(), True), ("num", IntegerType(), True)]
+        )
+
+        actual = source_df.cols.frequency(["name", "num"], 1, approx=True)
+
+        assert actual == {"name": [{"value": "a", "count": 3, "error": 0}],
+                          "num": [{"value": 1, "count": 3, "error": 0}]}
+
+    @staticmethod
+    def test_stats_cache():
+        source_df = op.create.df(
+            rows=[(1,), (2,), (None,)],
+            cols=[("num", IntegerType(), True)]
+        )
+
+        assert source_df.cols.min("num") == 1
+        assert stats_cache.get(source_df, [("min", "num")]) == {("min", "num"): 1}
+        assert source_df.cols.min("num") == 1
+
+        # A transformation creates a new plan, so the stats are not shared
+        filtered_df = source_df.where("num > 1")
+        assert stats_cache.get(filtered_df, [("min", "num")]) == {}
+        assert filtered_df.cols.min("num") == 2
+
+        cache = StatsCache(max_size=1)
+        cache.set(source_df, {("count",): 3})
+        cache.set(filtered_df, {("count",): 1})
+        assert cache.get(source_df, [("count",)]) == {}
+        assert cache.get(filtered_df, [("count",)]) == {("count",): 1}
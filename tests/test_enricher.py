@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+from mock import MagicMock
+
+from optimus.enricher import RequestEngine, TokenBucket, find_results
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Return the path as json. The first request to /retry fails with a 503
+    """
+    failed = set()
+
+    def do_GET(self):
+        if self.path.startswith("/retry") and self.path not in StubHandler.failed:
+            StubHandler.failed.add(self.path)
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        body = json.dumps({"path": self.path}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class TestEnricher(object):
+    @staticmethod
+    def test_request_engine():
+        server = start_server()
+        url = "http://127.0.0.1:{port}".format(port=server.server_address[1])
+
+        docs = [url + "/" + str(i) for i in range(20)] + [url + "/retry"]
+        engine = RequestEngine(calls=1000, period=1, max_workers=4, max_in_flight=5, max_backoff=0.1)
+        results = {doc: response for doc, response in engine.map(docs)}
+        server.shutdown()
+
+        assert sorted(results.keys()) == sorted(docs)
+        assert all(response.status_code == 200 for response in results.values())
+        assert results[url + "/retry"].json() == {"path": "/retry"}
+
+    @staticmethod
+    def test_token_bucket():
+        rate, capacity, n = 100, 1, 21
+        # Start before the bucket is created, the tokens are refilled from that moment
+        start = time.monotonic()
+        bucket = TokenBucket(rate=rate, capacity=capacity)
+        for _ in range(n):
+            bucket.acquire()
+        elapsed = time.monotonic() - start
+
+        # Only the first tokens are in the bucket, the rest are refilled at the given rate
+        assert elapsed >= (n - capacity) / rate
+
+    @staticmethod
+    def test_find_results():
+        collection = MagicMock()
+        collection.find.return_value.batch_size.side_effect = [
+            [{"jazz_id": 1, "jazz_results": {"a": 1}},
+             {"jazz_id": 2},
+             {"jazz_id": 2, "jazz_results": "b"},
+             {"jazz_id": 1, "jazz_results": "duplicated"}],
+            []
+        ]
+
+        actual = list(find_results(collection, iter([1, 2, 3]), batch_size=2))
+
+        # One query per batch of ids and one result per id
+        assert [c[0][0] for c in collection.find.call_args_list] == [{"jazz_id": {"$in": [1, 2]}},
+                                                                      {"jazz_id": {"$in": [3]}}]
+        assert actual == [(1, '{"a": 1}'), (2, "b")]
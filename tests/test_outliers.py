@@ -0,0 +1,42 @@
+from pyspark.sql.types import *
+
+from optimus import Optimus
+from optimus.outliers.outliers import OutlierDetector
+
+op = Optimus()
+
+source_df = op.create.df(
+    rows=[
+        (1, 10.0),
+        (2, 11.0),
+        (3, 1000.0),
+        (4, 12.0),
+        (100, 13.0)
+    ],
+    cols=[
+        ("num", IntegerType(), True),
+        ("value", DoubleType(), True)
+    ]
+)
+
+
+class TestOutliers(object):
+    @staticmethod
+    def test_mad_multiple_columns():
+        actual_df = OutlierDetector.mad(source_df, ["num", "value"], 3)
+
+        # The bounds of both columns are calculated before dropping any row
+        assert actual_df.collect() == source_df.where("num IN (1, 2, 4)").collect()
+
+    @staticmethod
+    def test_modified_z_score_multiple_columns():
+        actual_df = OutlierDetector.modified_z_score(source_df, ["num", "value"], 3.5)
+
+        assert actual_df.columns == ["num", "value"]
+        assert actual_df.collect() == source_df.where("num IN (1, 2, 4)").collect()
+
+    @staticmethod
+    def test_modified_z_score_col_name():
+        actual_df = OutlierDetector.modified_z_score(source_df, col_name="num", threshold=3.5)
+
+        assert actual_df.collect() == source_df.where("num != 100").collect()
@@ -0,0 +1,136 @@
+from mock import patch
+
+from optimus import Optimus
+from optimus.profiler.functions import bucketizer, create_buckets
+from optimus.profiler.profiler import Profiler
+from optimus.spark import Spark
+
+op = Optimus()
+
+source_df = op.create.df([
+    ("words", "str", True),
+    ("num", "int", True),
+    ("animals", "str", True),
+],
+    [
+        ("  I like     fish  ", 1, "dog dog"),
+        ("    zombies", 2, "cat"),
+        ("simpsons   cat lady", 2, "frog"),
+        (None, 3, "eagle"),
+    ])
+
+
+class TestProfiler(object):
+    @staticmethod
+    def test_columns():
+        output = op.profiler.columns(source_df, "*")
+
+        num = output["columns"]["num"]
+        assert num["column_type"] == "numeric"
+        assert num["stats"]["min"] == 1
+        assert num["stats"]["max"] == 3
+        assert num["frequency"][0] == {"value": 2, "count": 2, "percentage": 50.0}
+
+        words = output["columns"]["words"]
+        assert words["column_type"] == "categorical"
+        assert words["stats"]["missing_count"] == 1
+
+    @staticmethod
+    def test_columns_jobs_count():
+        output = op.profiler.columns(source_df, "*")
+
+        # The number of jobs must not depend on the number of columns
+        assert 0 < output["jobs_count"] <= 10
+
+    @staticmethod
+    def test_columns_dates_jobs_count():
+        df = op.create.df([("one", "str", True), ("two", "str", True)],
+                          [("2018-01-01 10:30:00", "2018-02-01 11:00:00"),
+                           ("2018-03-05 12:45:00", "2019-04-02 15:10:00")])
+
+        one = op.profiler.columns(df.cols.select(["one"]), "*", infer=True)
+        two = op.profiler.columns(df, "*", infer=True)
+
+        # The histograms of all the date columns are fused too
+        assert two["columns"]["two"]["hist"]["months"][1]["count"] == 1
+        assert one["jobs_count"] == two["jobs_count"]
+
+    @staticmethod
+    def test_columns_keeps_cache():
+        df = source_df.cache()
+
+        # If no cast is needed the dataframe received is profiled, it must stay cached
+        with patch.object(Profiler, "cast_columns", side_effect=lambda _df, columns, count_dtypes: _df):
+            op.profiler.columns(df, "*")
+
+        assert df.storageLevel.useMemory
+        df.unpersist()
+
+    @staticmethod
+    def test_columns_keeps_job_group():
+        sc = Spark.instance.sc
+        sc.setJobGroup("user_group", "User jobs")
+        try:
+            output = op.profiler.columns(source_df, "*")
+
+            # The job group set by the user is kept and the profiler jobs are counted inside it
+            assert sc.getLocalProperty("spark.jobGroup.id") == "user_group"
+            assert 0 < output["jobs_count"] <= len(sc.statusTracker().getJobIdsForGroup("user_group"))
+        finally:
+            sc.setLocalProperty("spark.jobGroup.id", None)
+            sc.setLocalProperty("spark.job.description", None)
+
+    @staticmethod
+    def test_columns_max_workers():
+        expected = op.profiler.columns(source_df, "*")
+        actual = op.profiler.columns(source_df, "*", max_workers=2)
+
+        assert list(actual["columns"].keys()) == list(expected["columns"].keys())
+        assert actual["columns"] == expected["columns"]
+        assert actual["count_types"] == expected["count_types"]
+
+    @staticmethod
+    def test_merge_summaries():
+        expected = op.profiler.summary(source_df, "*")
+        actual = op.profiler.merge_summaries(op.profiler.summary(source_df.where("num <= 2"), "*"),
+                                             op.profiler.summary(source_df.where("num > 2"), "*"))
+
+        assert actual["rows_count"] == expected["rows_count"]
+        for col_name in ["words", "num", "animals"]:
+            for key in ["count", "nulls", "min", "max"]:
+                assert actual["columns"][col_name][key] == expected["columns"][col_name][key]
+        assert actual["columns"]["num"]["moments"]["mean"] == expected["columns"]["num"]["moments"]["mean"]
+
+        profile = op.profiler.profile_from_summary(actual)
+        assert profile["columns"]["num"]["stats"]["uniques_count"] == 3
+        assert profile["columns"]["num"]["frequency"][0]["count"] == 2
+
+    @staticmethod
+    def test_columns_sample():
+        output = op.profiler.columns(source_df, "*", sample=True, confidence_level=95, confidence_interval=50)
+
+        assert output["sampling"]["population"] == 4
+        assert 0 < output["sampling"]["rows_count"] <= 4
+
+        num = output["columns"]["num"]
+        lower, upper = num["confidence_bounds"]["mean"]
+        assert lower <= num["stats"]["mean"] <= upper
+        assert "percentage_bounds" in num["frequency"][0]
+
+    @staticmethod
+    def test_bucketizer():
+        uniform = bucketizer(source_df, "num", create_buckets(1, 3, 2))
+        custom = bucketizer(source_df, "num", [{"lower": 0, "upper": 1.5, "bucket": 0},
+                                               {"lower": 1.5, "upper": 3, "bucket": 1}])
+
+        # A value on the boundary of two buckets falls in the lower one
+        assert [r[0] for r in uniform.select("num_buckets").collect()] == [0, 0, 0, 1]
+        assert [r[0] for r in custom.select("num_buckets").collect()] == [0, 1, 1, 1]
+
+    @staticmethod
+    def test_bucketizer_unequal_widths():
+        df = bucketizer(source_df, "num", [{"lower": 0, "upper": 1.5, "bucket": 0},
+                                           {"lower": 1.5, "upper": 2, "bucket": 1},
+                                           {"lower": 2, "upper": 2.5, "bucket": 2}])
+
+        assert [r[0] for r in df.select("num_buckets").collect()] == [0, 1, 1, None]
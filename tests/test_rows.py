@@ -1,6 +1,11 @@
+import json
+
+import pandas as pd
+
 from optimus import Optimus
 from pyspark.sql.types import *
 from optimus.functions import abstract_udf as audf
+from optimus.functions import filter_row_by_data_type as fbdt, infer_data_type_series
 
 op = Optimus()
 
@@ -101,6 +106,39 @@ class TestDataFrameRows(object):
 
         assert (expected_df.collect() == actual_df.collect())
 
+    @staticmethod
+    def test_infer_data_type_native():
+        df = op.create.df([("value", StringType(), True)],
+                          [("1",), ("1.5",), ("true",), ("2018-01-31",), ("[1, 2]",), ("dog",), (None,)])
+
+        actual = [r[0] for r in df.select(fbdt("value", get_type=True)).collect()]
+        expected = [r[0] for r in df.select(fbdt("value", get_type=True, native=False)).collect()]
+
+        assert actual == ["int", "float", "bool", "date", "array", "string", "null"]
+        assert actual == expected
+
+    @staticmethod
+    def test_infer_data_type_array():
+        # Only flat lists and tuples of literals are arrays, nested ones are labeled as string
+        values = ["[1, 2]", "('a', 1)", "()", "[citation needed]", "(555, ext 12)", "[a b c", "[[1, 2], [3]]"]
+        df = op.create.df([("value", StringType(), True)], [(v,) for v in values])
+
+        actual = [r[0] for r in df.select(fbdt("value", get_type=True)).collect()]
+        expected = [r[0] for r in df.select(fbdt("value", get_type=True, native=False)).collect()]
+
+        assert actual == ["array", "array", "array", "string", "string", "string", "string"]
+        assert actual == expected
+        assert list(infer_data_type_series(pd.Series(values))) == actual
+
+    @staticmethod
+    def test_infer_data_type_series():
+        series = pd.Series(["1", " 2 ", "1.5", "nan", "True", "2018-01-31", "[1, 2]", "dog", None, 1, 1.5, True])
+
+        actual = list(infer_data_type_series(series))
+
+        assert actual == ["int", "int", "float", "float", "bool", "date", "array", "string", "null", "int", "float",
+                          "bool"]
+
     @staticmethod
     def test_drop():
         actual_df = source_df.rows.drop((source_df["num"] == 2) | (source_df["second"] == 5))
@@ -180,3 +218,62 @@ class TestDataFrameRows(object):
             ])
 
         assert (expected_df.collect() == actual_df.collect())
+
+    @staticmethod
+    def test_size():
+        assert source_df.size() > 0
+        assert source_df.size(mode="files") == source_df.size()
+        assert source_df.size(mode="sample", sample=2) > 0
+
+    @staticmethod
+    def test_sample_n():
+        assert source_df.sample_n(3).count() == 3
+        assert source_df.sample_n(10).count() == 4
+
+    @staticmethod
+    def test_sample_n_random():
+        actual = source_df.sample_n(3, random=True).collect()
+
+        assert len(actual) == 3
+        assert all(row in source_df.collect() for row in actual)
+
+    @staticmethod
+    def test_sample_n_stratify():
+        # One row for every value of num
+        actual = [row["num"] for row in source_df.sample_n(1, stratify="num").collect()]
+        assert sorted(actual) == [1, 2, 3]
+
+        # Strata with less rows than n are returned complete
+        actual = [row["num"] for row in source_df.sample_n(2, random=True, stratify="num").collect()]
+        assert sorted(actual) == [1, 2, 2, 3]
+
+    @staticmethod
+    def test_to_json_arrow():
+        # Arrow is used if pyarrow is installed, the result must be the same
+        assert source_df.to_json() == source_df.to_json(arrow=False)
+
+    @staticmethod
+    def test_iter_records():
+        expected = source_df.to_json(arrow=False)
+
+        assert list(source_df.iter_records()) == expected
+        assert [len(batch) for batch in source_df.iter_records(batch_size=3)] == [3, 1]
+
+        batches = []
+        assert source_df.to_json(stream=batches.append, batch_size=2) == 4
+        assert [record for batch in batches for record in batch] == expected
+
+        # Without a batch size the stream function would receive single records
+        try:
+            source_df.to_json(stream=batches.append, batch_size=None)
+            assert False
+        except TypeError:
+            pass
+
+    @staticmethod
+    def test_to_json_stream_file(tmpdir):
+        path = str(tmpdir.join("records.json"))
+        assert source_df.to_json(stream=path, batch_size=3) == 4
+
+        with open(path, encoding="utf-8") as file:
+            assert [json.loads(line) for line in file] == source_df.to_json(arrow=False)
@@ -0,0 +1,45 @@
+import datetime
+import json
+from decimal import Decimal
+
+from kombu.serialization import dumps
+from mock import MagicMock
+from pyspark.sql import Row
+
+from optimus.io.save import insert_batches, publish_batches, to_message
+
+
+class TestSave(object):
+    @staticmethod
+    def test_insert_batches():
+        collection = MagicMock()
+
+        count = insert_batches(collection, ({"num": i} for i in range(5)), batch_size=2)
+
+        assert count == 5
+        assert [len(c[0][0]) for c in collection.insert_many.call_args_list] == [2, 2, 1]
+        assert all(c[1] == {"ordered": False} for c in collection.insert_many.call_args_list)
+
+    @staticmethod
+    def test_publish_batches():
+        producer = MagicMock()
+
+        rows_count, messages_count = publish_batches(producer, ({"num": i} for i in range(5)), batch_size=2)
+
+        assert (rows_count, messages_count) == (5, 3)
+        assert producer.publish.call_args_list[0][0][0] == [{"num": 0}, {"num": 1}]
+
+    @staticmethod
+    def test_to_message():
+        row = Row(date=datetime.date(2018, 10, 1), time=datetime.datetime(2018, 10, 1, 12, 30),
+                  price=Decimal("10.50"), tags=[Row(created=datetime.date(2018, 1, 2))])
+
+        message = to_message(row.asDict(recursive=True))
+
+        expected = {"date": "2018-10-01", "time": "2018-10-01T12:30:00", "price": "10.50",
+                    "tags": [{"created": "2018-01-02"}]}
+        assert message == expected
+
+        # The message can be encoded with the default serializer
+        _, _, body = dumps(message, serializer="json")
+        assert json.loads(body) == expected